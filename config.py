@@ -199,3 +199,12 @@ ASSET_GROUPS = {
         "engine": "MEAN_REVERSION"
     }
 }
+
+# ==========================================
+# 3. Streaming Intraday Mode (main.py --stream)
+# ==========================================
+# กลุ่ม intraday ที่รันแบบ streaming: วิเคราะห์ทีละแท่งทันทีที่แท่งปิด
+# แต่ละ (symbol, interval) มี cache ของตัวเอง (เช่น OANDA_XAUUSD_30.npy) → 15m/30m stream แยกกัน
+STREAM_GROUPS = ["GROUP_C1_GOLD_30M", "GROUP_C2_GOLD_15M", "GROUP_D1_SILVER_30M", "GROUP_D2_SILVER_15M"]
+STREAM_POLL_SECONDS = 5      # รอบ poll TradingView (s)
+STREAM_FLUSH_BARS = 20       # write-back cache / indicator store ทุกๆ N แท่ง
@@ -0,0 +1,344 @@
+"""
+core/bar_stream.py - Streaming Intraday Mode
+============================================
+Long-running loop for the intraday metals groups (config.STREAM_GROUPS):
+every closed bar is analyzed as soon as it arrives instead of re-running
+the whole batch pipeline.
+
+- Each (symbol, interval) streams into its own cache file (stream_cache_symbol,
+  e.g. OANDA_XAUUSD_30.npy): the batch run's OANDA_XAUUSD cache is shared by the
+  15m and 30m groups. The series stays in memory (data_cache write-back LRU)
+- New bar → update_cache (append / MAX_CACHE_BARS trim) → processor.analyze_asset
+  with persist_index=True: signals are encoded against the fixed threshold,
+  the pattern index and the indicator store only count / stream the new bar
+- Cache + indicator store writes are deferred and flushed every
+  STREAM_FLUSH_BARS bars and on exit
+- Feeds:
+  TvBarFeed        polls TradingView, a bar is emitted once the next bar opens
+                   (bars missed between polls are back-filled, fetch_since)
+  SimulatedBarFeed replays the last cached bars (no network, for testing);
+                   without a stream cache yet (fresh checkout) it replays the
+                   batch cache EXCHANGE_SYMBOL, the stream cache is removed on exit
+  or push bars directly with StreamSession.on_bar
+"""
+import os
+import csv
+import time
+import numpy as np
+import pandas as pd
+
+import config
+import processor
+from core.data_cache import (
+    load_cache, save_cache, update_cache, remove_cache, safe_fetch, flush_cache, get_cache_path,
+    get_manifest_entry, MAX_CACHE_BARS, RATE_LIMIT_DELTA
+)
+from core.indicator_store import set_write_back, flush_indicators
+
+STREAM_LOG = "logs/stream_forecasts.csv"
+STREAM_LOG_COLUMNS = ['bar_time', 'emitted_at', 'group', 'symbol', 'exchange', 'pattern',
+                      'forecast', 'prob', 'matches', 'threshold', 'price', 'latency_ms']
+POLL_BARS = 3   # bars per TradingView poll (last one is still forming)
+DELTA_BARS = 50  # warm-up refresh of an existing stream cache
+
+
+def stream_cache_symbol(symbol, interval):
+    """Cache key of a streamed series: one file per (symbol, interval)"""
+    return f"{symbol}_{getattr(interval, 'value', interval)}"
+
+
+def _bar_delta(interval):
+    """Bar length of a TradingView interval ('15' → 15 min, '1H', '1D', '1W', '1M')"""
+    name = str(getattr(interval, 'value', interval))
+    units = {'H': 'h', 'D': 'D', 'W': 'W', 'M': 'D'}
+    if name[-1:] in units:
+        count = int(name[:-1] or 1)
+        return pd.Timedelta(count * 30 if name[-1] == 'M' else count, unit=units[name[-1]])
+    return pd.Timedelta(minutes=int(name))
+
+
+def fetch_since(tv, symbol, exchange, interval, last_time, n_bars, max_bars=MAX_CACHE_BARS, delay=0):
+    """
+    Latest n_bars; when they don't reach back to last_time (missed polls,
+    disconnects, market closed) re-fetch enough bars to cover the gap, so the
+    series never gets a hole. None if a fetch failed (caller retries later).
+    """
+    data = safe_fetch(tv, symbol, exchange, interval, n_bars, delay=delay)
+    if data is None or data.empty or last_time is None or data.index[0] <= last_time:
+        return data
+    gap_bars = int(np.ceil((data.index[-1] - last_time) / _bar_delta(interval))) + n_bars
+    return safe_fetch(tv, symbol, exchange, interval, min(gap_bars, max_bars), delay=delay)
+
+
+# ===================================================================
+# FEEDS
+# ===================================================================
+class TvBarFeed:
+    """Polls TradingView; returns bars that closed since the last poll."""
+    done = False
+
+    def __init__(self, tv, symbol, exchange, interval, last_time=None):
+        self.tv = tv
+        self.symbol = symbol
+        self.exchange = exchange
+        self.interval = interval
+        self.last_time = last_time
+
+    def poll(self):
+        data = fetch_since(self.tv, self.symbol, self.exchange, self.interval, self.last_time, POLL_BARS)
+        if data is None or len(data) < 2:
+            return None
+        closed = data.iloc[:-1]
+        if self.last_time is not None:
+            closed = closed[closed.index > self.last_time]
+        if closed.empty:
+            return None
+        self.last_time = closed.index[-1]
+        return closed
+
+
+class SimulatedBarFeed:
+    """
+    Replays bars of a frame one per poll (local testing without network).
+    delay: seconds between bars (0 = as fast as the analysis runs)
+    """
+    def __init__(self, bars, delay=0.0):
+        self.bars = bars
+        self.delay = delay
+        self.pos = 0
+        self.done = bars.empty
+
+    def poll(self):
+        if self.done:
+            return None
+        if self.delay and self.pos:
+            time.sleep(self.delay)
+        bar = self.bars.iloc[self.pos:self.pos + 1]
+        self.pos += 1
+        self.done = self.pos >= len(self.bars)
+        return bar
+
+
+# ===================================================================
+# SESSION
+# ===================================================================
+class StreamSession:
+    """One streamed symbol: in-memory bar series + incremental analysis per closed bar"""
+
+    def __init__(self, group_name, asset, interval, fixed_threshold=None):
+        self.group_name = group_name
+        self.symbol = asset['symbol']
+        self.exchange = asset['exchange']
+        self.display_name = asset.get('name', self.symbol)
+        self.interval = interval
+        self.cache_symbol = stream_cache_symbol(self.symbol, interval)
+        self.fixed_threshold = fixed_threshold
+        self.df = None
+        self.bars_seen = 0
+        self.latencies = []
+
+    @property
+    def last_time(self):
+        return None if self.df is None or self.df.empty else self.df.index[-1]
+
+    def warm_up(self, df):
+        """Load the history and sync the pattern index / indicator store once (no forecast emitted)."""
+        self.df = df
+        if df is not None and not df.empty:
+            self.analyze()
+        return self.df is not None and not self.df.empty
+
+    def analyze(self):
+        results = processor.analyze_asset(self.df, symbol=self.symbol, exchange=self.exchange,
+                                          fixed_threshold=self.fixed_threshold, persist_index=True,
+                                          cache_symbol=self.cache_symbol)
+        for res in results:
+            res['symbol'] = self.display_name
+            res['group'] = self.group_name
+            res['exchange'] = self.exchange
+        return results
+
+    def on_bar(self, bars):
+        """
+        Append closed bar(s) and analyze. A bar with the last bar's timestamp
+        replaces it (the batch run may have cached it while still forming);
+        older bars are ignored. Returns the results, or None if nothing was new.
+        """
+        started = time.perf_counter()
+        if self.last_time is not None:
+            bars = bars[bars.index >= self.last_time]
+        if bars.empty:
+            return None
+        self.df = update_cache(self.cache_symbol, self.exchange, bars, self.interval)
+        results = self.analyze()
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.bars_seen += len(bars)
+        self.latencies.append(latency_ms)
+        for res in results:
+            res['bar_time'] = self.last_time
+            res['latency_ms'] = latency_ms
+        return results
+
+
+# ===================================================================
+# RUNNER
+# ===================================================================
+def _stream_assets(groups):
+    """(group, asset, settings) per symbol and interval; a duplicate streams with the first group"""
+    seen = set()
+    for group_name in groups:
+        settings = config.ASSET_GROUPS[group_name]
+        for asset in settings['assets']:
+            key = (asset['symbol'], asset['exchange'], str(settings['interval']))
+            if key in seen:
+                print(f"   ⏭️ {asset['symbol']} ({group_name}): already streamed by an earlier group")
+                continue
+            seen.add(key)
+            yield group_name, asset, settings
+
+
+def _load_history(tv, session, history_bars):
+    """
+    Warm-up series from the session's stream cache (delta refresh), or a full
+    fetch on the first run. Fetches use the real symbol, the cache its stream key.
+    """
+    cached = load_cache(session.cache_symbol, session.exchange)
+    if cached is not None and not cached.empty:
+        new_data = fetch_since(tv, session.symbol, session.exchange, session.interval, cached.index[-1],
+                               DELTA_BARS, max_bars=history_bars, delay=RATE_LIMIT_DELTA)
+        if new_data is None:
+            return cached
+        return update_cache(session.cache_symbol, session.exchange, new_data, session.interval)
+    full_data = safe_fetch(tv, session.symbol, session.exchange, session.interval, history_bars)
+    if full_data is not None:
+        save_cache(session.cache_symbol, session.exchange, full_data, session.interval)
+    return full_data
+
+
+def _emit(results, log_path=None):
+    """Print the new forecasts (and append them to the stream log)."""
+    rows = []
+    emitted_at = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    for res in results:
+        bar_time = pd.Timestamp(res['bar_time']).strftime("%Y-%m-%d %H:%M")
+        icon = "🟢" if res['forecast_label'] == 'UP' else "🔴"
+        print(f"   {icon} [{bar_time}] {res['symbol']:<8} {res['pattern']:<8} → {res['forecast_label']:<4} "
+              f"{res['acc_score']:.1f}% (n={res['total_events']}) | {res['latency_ms']:.1f} ms")
+        rows.append([bar_time, emitted_at, res['group'], res['symbol'], res['exchange'], res['pattern'],
+                     res['forecast_label'], round(res['acc_score'], 2), res['total_events'],
+                     res['threshold'], res['price'], round(res['latency_ms'], 2)])
+    if log_path and rows:
+        new_file = not os.path.exists(log_path)
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(STREAM_LOG_COLUMNS)
+            writer.writerows(rows)
+
+
+def _flush():
+    flush_cache()
+    flush_indicators()
+
+
+def run_stream(tv=None, groups=None, simulate_bars=0, delay=0.0, poll_seconds=None, max_polls=None):
+    """
+    Stream the intraday groups until Ctrl+C (or until the simulated feeds run out).
+
+    tv:            TvDatafeed for the live feed (ignored when simulating)
+    simulate_bars: >0 → replay the last N cached bars of each symbol instead of polling
+    delay:         seconds between simulated bars
+    poll_seconds:  live poll period (default config.STREAM_POLL_SECONDS)
+    max_polls:     stop after N poll rounds (None = run forever)
+    """
+    groups = groups or config.STREAM_GROUPS
+    poll_seconds = config.STREAM_POLL_SECONDS if poll_seconds is None else poll_seconds
+    mode = f"SIMULATED (replay {simulate_bars} bars)" if simulate_bars else f"LIVE (poll {poll_seconds}s)"
+    print(f"📡 Streaming intraday mode: {mode}")
+
+    sessions = []
+    originals = {}   # simulated: stream cache frames restored on exit (None → remove)
+    for group_name, asset, settings in _stream_assets(groups):
+        session = StreamSession(group_name, asset, settings['interval'], settings.get('fixed_threshold'))
+        symbol, exchange = asset['symbol'], asset['exchange']
+        if simulate_bars:
+            stream_cached = load_cache(session.cache_symbol, exchange)
+            full = stream_cached
+            if full is None or len(full) <= simulate_bars:
+                # No stream cache yet (fresh checkout): replay the batch cache instead
+                full = load_cache(symbol, exchange)
+                if full is None or len(full) <= simulate_bars:
+                    print(f"   ⚠️ {symbol} ({group_name}): not enough cached bars to replay {simulate_bars}"
+                          f" (no {exchange}_{session.cache_symbol} or {exchange}_{symbol} cache)")
+                    continue
+                batch_interval = (get_manifest_entry(get_cache_path(symbol, exchange)) or {}).get('interval')
+                print(f"   ℹ️ {symbol} ({group_name}): no {exchange}_{session.cache_symbol} stream cache,"
+                      f" replaying the batch cache {exchange}_{symbol}"
+                      + (f" (interval {batch_interval})" if batch_interval else ""))
+            originals[(session.cache_symbol, exchange)] = stream_cached
+            history = full.iloc[:-simulate_bars]
+            save_cache(session.cache_symbol, exchange, history, settings['interval'])
+            feed = SimulatedBarFeed(full.iloc[-simulate_bars:], delay)
+        else:
+            history = _load_history(tv, session, settings['history_bars'])
+            feed = None
+        if not session.warm_up(history):
+            print(f"   ⚠️ {symbol}: no data, skipped")
+            continue
+        if feed is None:
+            feed = TvBarFeed(tv, symbol, exchange, settings['interval'], session.last_time)
+        print(f"   ✅ {session.display_name} ({group_name}): {len(session.df)} bars, last {session.last_time}")
+        sessions.append((session, feed))
+
+    if not sessions:
+        print("❌ Nothing to stream.")
+        return []
+
+    log_path = None if simulate_bars else STREAM_LOG
+    set_write_back(True)
+    pending_flush = 0
+    polls = 0
+    emitted = []
+    try:
+        while True:
+            for session, feed in sessions:
+                bars = feed.poll()
+                if bars is None or bars.empty:
+                    continue
+                results = session.on_bar(bars)
+                if results is None:
+                    continue
+                pending_flush += len(bars)
+                emitted.extend(results)
+                _emit(results, log_path)
+            if pending_flush >= config.STREAM_FLUSH_BARS:
+                _flush()
+                pending_flush = 0
+            polls += 1
+            if all(feed.done for _, feed in sessions) or (max_polls and polls >= max_polls):
+                break
+            if not simulate_bars:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        print("\n⏹️ Stream stopped.")
+    finally:
+        # Replay leaves the stream cache exactly as it found it
+        for (cache_symbol, exchange), full in originals.items():
+            if full is not None:
+                save_cache(cache_symbol, exchange, full)
+        set_write_back(False)
+        flush_cache()
+        for (cache_symbol, exchange), full in originals.items():
+            if full is None:
+                remove_cache(cache_symbol, exchange)
+
+    print("\n📊 STREAM SUMMARY")
+    for session, _ in sessions:
+        if session.latencies:
+            lat = pd.Series(session.latencies)
+            print(f"   {session.display_name:<8} {session.group_name:<20} {session.bars_seen:>5} bars | latency median {lat.median():.1f} ms"
+                  f" | p95 {lat.quantile(0.95):.1f} ms | max {lat.max():.1f} ms")
+        else:
+            print(f"   {session.display_name:<8} {session.group_name:<20} no new bars")
+    return emitted
@@ -6,14 +6,37 @@ V3 Changes (Performance Fix):
 - Single-attempt fetch: no more progressive 3-step fallback
 - Connection state tracking: auto-switch to cache-only after failures
 - Reduced timeout waste: ~90s → ~10s per failed symbol
+
+V4 Changes (Binary Cache):
+- Pluggable cache backend (CACHE_FORMAT): 'npy' binary columnar (default) or legacy 'csv'
+- npy: float64 OHLCV columns + int64 timestamps → no text/datetime parsing on read
+- Migration of EXCHANGE_SYMBOL.csv files (migrate_csv_cache); CSVs stay in place,
+  a CSV newer than its converted file is merged in again
+- mmap=True: memory-mapped read-only views (zero-copy, page cache shared across processes)
+- In-process LRU handle: each symbol is read from disk at most once per run,
+  saves are write-back (flush_cache at the end of the run / at exit)
+- manifest.json: last bar / bars / interval / bytes / checksum per cache file,
+  updated atomically on every disk write → freshness + stats without loading data
+- load_tail(symbol, exchange, n): last n bars only (npy: mapped slice, csv: reverse
+  block read) → cost ∝ n, not file size
 """
+import io
 import os
 import glob
+import json
+import zlib
+import atexit
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import time
+import asyncio
 import logging
 from datetime import datetime, timedelta
 
+from core import run_metrics
+
 logger = logging.getLogger(__name__)
 
 # Cache Configuration
@@ -24,6 +47,14 @@ MAX_DATA_AGE_DAYS = 3       # Cache สดถ้าข้อมูลล่า
 MAX_CACHE_BARS = 5500       # จำกัดขนาด cache ไม่ให้บวมเกิน
 RATE_LIMIT_DELTA = 0.3      # delay หลัง delta fetch (s)
 RATE_LIMIT_FULL = 0.5       # delay หลัง full fetch (s)
+CACHE_FORMAT = "npy"        # Cache backend: "npy" (binary columnar) or "csv" (legacy text)
+CACHE_LRU_SIZE = 512        # Symbols kept in memory per run (> all configured assets)
+CSV_TAIL_BLOCK = 64 * 1024  # Reverse read block size for CSV tail reads (bytes)
+
+# Async prefetch (prefetch_many)
+ASYNC_MAX_IN_FLIGHT = 4     # concurrent get_hist calls
+ASYNC_RATE_PER_SEC = 3.0    # token bucket refill rate (requests/s)
+ASYNC_BURST = 3             # token bucket capacity
 
 # ===================================================================
 # CONNECTION STATE TRACKER
@@ -40,11 +71,13 @@ def is_connection_healthy():
 
 def report_fetch_success():
     """Report a successful fetch to reset failure counter."""
+    run_metrics.count('fetch.ok')
     _connection_state['consecutive_failures'] = 0
     _connection_state['healthy'] = True
 
 def report_fetch_failure():
     """Report a failed fetch. Auto-switches to cache-only after threshold."""
+    run_metrics.count('fetch.failed')
     _connection_state['consecutive_failures'] += 1
     if _connection_state['consecutive_failures'] >= _connection_state['failure_threshold']:
         _connection_state['healthy'] = False
@@ -55,6 +88,129 @@ def set_connection_healthy(healthy):
     if not healthy:
         _connection_state['consecutive_failures'] = _connection_state['failure_threshold']
 
+# ===================================================================
+# CACHE BACKENDS
+# ===================================================================
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+class CsvCacheBackend:
+    """Legacy text format: EXCHANGE_SYMBOL.csv (datetime strings parsed on every read)."""
+    name = "csv"
+    extension = ".csv"
+
+    def read(self, path, mmap=False):
+        # Text format cannot be mapped → mmap is ignored
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        return None if df.empty else df
+
+    def read_tail(self, path, n_rows):
+        """Last n_rows bars: read backwards in CSV_TAIL_BLOCK blocks until n_rows full lines are in."""
+        with open(path, 'rb') as f:
+            header = f.readline()
+            data_start = f.tell()
+            pos = f.seek(0, os.SEEK_END)
+            blocks = []
+            newlines = 0
+            # n_rows + 1 newlines → the oldest wanted line is complete
+            while pos > data_start and newlines <= n_rows:
+                step = min(CSV_TAIL_BLOCK, pos - data_start)
+                pos -= step
+                f.seek(pos)
+                block = f.read(step)
+                blocks.append(block)
+                newlines += block.count(b'\n')
+        
+        lines = b''.join(reversed(blocks)).splitlines()
+        if pos > data_start:
+            lines = lines[1:]  # Cut mid-line by the last block
+        lines = [line for line in lines if line.strip()][-n_rows:]
+        if not lines:
+            return None
+        df = pd.read_csv(io.BytesIO(header + b'\n'.join(lines) + b'\n'), index_col=0, parse_dates=True)
+        return None if df.empty else df
+
+    def write(self, path, df):
+        df.to_csv(path)
+
+class NpyCacheBackend:
+    """
+    Binary columnar format: EXCHANGE_SYMBOL.npy, one structured record per symbol
+    - index:  int64 bar timestamps (ns since epoch, naive like tvDatafeed)
+    - ohlcv:  float64 (5, n) — each column is one contiguous block
+    - symbol: TradingView symbol ("NASDAQ:AAPL")
+    Reading is a raw buffer load: no text or datetime string parsing.
+    With mmap=True the file is memory-mapped and the DataFrame's OHLCV block is a
+    read-only view of the page cache (no copy, shared by every process mapping it).
+    Writes replace the file atomically, so existing maps keep seeing their snapshot.
+    """
+    name = "npy"
+    extension = ".npy"
+
+    @staticmethod
+    def record_dtype(n_bars):
+        return np.dtype([
+            ('index', '<i8', (n_bars,)),
+            ('ohlcv', '<f8', (len(OHLCV_COLUMNS), n_bars)),
+            ('symbol', '<U64'),
+        ])
+
+    def read(self, path, mmap=False):
+        return self.to_frame(np.load(path, mmap_mode='r' if mmap else None))
+
+    def read_tail(self, path, n_rows):
+        """Last n_rows bars: copy of a slice of the mapped file (only those pages are read)."""
+        record = np.load(path, mmap_mode='r')
+        n_bars = record['index'].shape[0]
+        if n_bars == 0:
+            return None
+        start = max(0, n_bars - n_rows)
+        index = pd.DatetimeIndex(np.array(record['index'][start:]).view('datetime64[ns]'), name='datetime')
+        df = pd.DataFrame(np.array(record['ohlcv'][:, start:]).T, index=index, columns=OHLCV_COLUMNS)
+        df.insert(0, 'symbol', str(record['symbol']))
+        return df
+
+    def read_arrays(self, path):
+        """Memory-mapped NumPy views: {'index', 'open', 'high', 'low', 'close', 'volume'}."""
+        record = np.load(path, mmap_mode='r')
+        if record['index'].shape[0] == 0:
+            return None
+        ohlcv = record['ohlcv']
+        arrays = {'index': record['index']}
+        for row, col in enumerate(OHLCV_COLUMNS):
+            arrays[col] = ohlcv[row]
+        return arrays
+
+    def to_frame(self, record):
+        """Rebuild the cache DataFrame (same columns/index as the CSV cache) from a record."""
+        n_bars = record['index'].shape[0]
+        if n_bars == 0:
+            return None
+        index = pd.DatetimeIndex(record['index'].view('datetime64[ns]'), name='datetime')
+        df = pd.DataFrame(record['ohlcv'].T, index=index, columns=OHLCV_COLUMNS, copy=False)
+        df.insert(0, 'symbol', str(record['symbol']))
+        return df
+
+    def write(self, path, df):
+        record = np.zeros((), dtype=self.record_dtype(len(df)))
+        record['index'] = df.index.values.astype('datetime64[ns]').astype(np.int64)
+        record['ohlcv'] = df.reindex(columns=OHLCV_COLUMNS).to_numpy(dtype=np.float64).T
+        if 'symbol' in df.columns and len(df):
+            record['symbol'] = str(df['symbol'].iloc[0])
+        # Atomic replace: readers never see a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, record)
+        os.replace(tmp_path, path)
+
+CACHE_BACKENDS = {
+    'csv': CsvCacheBackend(),
+    'npy': NpyCacheBackend(),
+}
+
+def get_cache_backend():
+    """Active cache backend (CACHE_FORMAT)."""
+    return CACHE_BACKENDS[CACHE_FORMAT]
+
 # ===================================================================
 # CACHE FILE OPERATIONS
 # ===================================================================
@@ -62,11 +218,73 @@ def ensure_cache_dir():
     """Create cache directory if it doesn't exist."""
     os.makedirs(CACHE_DIR, exist_ok=True)
 
+def _cache_stem(symbol, exchange):
+    safe_symbol = symbol.replace("/", "_").replace(":", "_")
+    return os.path.normpath(os.path.join(CACHE_DIR, f"{exchange}_{safe_symbol}"))
+
 def get_cache_path(symbol, exchange):
-    """Get the file path for a symbol's cache."""
+    """Get the file path for a symbol's cache (active backend format)."""
     ensure_cache_dir()
-    safe_symbol = symbol.replace("/", "_").replace(":", "_")
-    return os.path.normpath(os.path.join(CACHE_DIR, f"{exchange}_{safe_symbol}.csv"))
+    return _cache_stem(symbol, exchange) + get_cache_backend().extension
+
+def get_legacy_csv_path(symbol, exchange):
+    """Path of the pre-V4 CSV cache file for a symbol."""
+    ensure_cache_dir()
+    return _cache_stem(symbol, exchange) + CsvCacheBackend.extension
+
+def _legacy_csv_pending(csv_path, target):
+    """True when the CSV holds data the active-format file may not have (missing or older target)."""
+    if csv_path == target or not os.path.exists(csv_path):
+        return False
+    if not os.path.exists(target):
+        return True
+    return os.path.getmtime(csv_path) > os.path.getmtime(target)
+
+def _import_legacy_csv(csv_path, target):
+    """
+    Convert / merge a legacy CSV into the active-format file; the CSV stays in place
+    (data/cache/*.csv are tracked in git). When both exist, CSV rows win on
+    duplicate timestamps (the CSV is the newer file). Returns the merged frame or None.
+    """
+    df = CACHE_BACKENDS['csv'].read(csv_path)
+    if df is None:
+        return None
+    if os.path.exists(target):
+        existing = get_cache_backend().read(target)
+        if existing is not None and not existing.empty:
+            df = pd.concat([existing, df])
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+            if len(df) > MAX_CACHE_BARS:
+                df = df.tail(MAX_CACHE_BARS)
+    if not _write_back(target, df, save=False):
+        return None
+    return df
+
+def migrate_csv_cache():
+    """
+    Convert legacy EXCHANGE_SYMBOL.csv files to the active backend (CSV files are kept).
+    A CSV newer than its converted file (e.g. refreshed by git pull) is merged in again.
+    """
+    backend = get_cache_backend()
+    if backend.name == "csv":
+        return 0
+    ensure_cache_dir()
+    converted = 0
+    for csv_path in glob.glob(os.path.join(CACHE_DIR, "*.csv")):
+        try:
+            target = os.path.splitext(csv_path)[0] + backend.extension
+            if _legacy_csv_pending(csv_path, target) and _import_legacy_csv(csv_path, target) is not None:
+                converted += 1
+        except Exception:
+            pass
+    save_manifest()
+    if converted > 0:
+        print(f"🔄 Migrated {converted} CSV cache files to .{backend.name}")
+    return converted
+
+def get_pattern_index_path(symbol, exchange):
+    """Base path for a symbol's persisted pattern index (next to its cache file)."""
+    return os.path.splitext(get_cache_path(symbol, exchange))[0]
 
 def cleanup_legacy_pkl():
     """Auto-convert legacy .pkl files to .csv and remove them."""
@@ -90,35 +308,313 @@ def cleanup_legacy_pkl():
     if converted > 0:
         print(f"🔄 Converted {converted} legacy .pkl cache files to .csv")
 
+_memory_lock = threading.RLock()
+
+# ===================================================================
+# CACHE MANIFEST (data/cache/manifest.json)
+# ===================================================================
+# file name -> {'last_bar', 'bars', 'interval', 'bytes', 'mtime_ns', 'checksum'}
+# An entry is trusted only while the file's size + mtime still match it,
+# so files written by older versions / other tools are simply re-indexed.
+MANIFEST_NAME = "manifest.json"
+_manifest = None
+_manifest_changes = {}
+
+def get_manifest_path():
+    return os.path.join(CACHE_DIR, MANIFEST_NAME)
+
+def _read_manifest_file():
+    try:
+        with open(get_manifest_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def load_manifest():
+    """Manifest entries (read once per process)."""
+    global _manifest
+    with _memory_lock:
+        if _manifest is None:
+            _manifest = _read_manifest_file()
+        return _manifest
+
+def save_manifest():
+    """
+    Atomically write the manifest (tmp file + rename).
+    Re-reads the file first and applies only this process's changes, so
+    concurrent writers (parallel backtests) don't drop each other's entries.
+    """
+    global _manifest
+    with _memory_lock:
+        if not _manifest_changes:
+            return
+        merged = _read_manifest_file()
+        for name, entry in _manifest_changes.items():
+            if entry is None:
+                merged.pop(name, None)
+            else:
+                merged[name] = entry
+        ensure_cache_dir()
+        tmp_path = f"{get_manifest_path()}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(merged, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, get_manifest_path())
+        except OSError as e:
+            logger.warning(f"Cache manifest write failed: {e}")
+            return
+        _manifest = merged
+        _manifest_changes.clear()
+
+def _file_checksum(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(block, crc)
+    return f"crc32:{crc:08x}"
+
+def _interval_name(interval):
+    if interval is None:
+        return None
+    return str(getattr(interval, 'value', interval))
+
+def _record_manifest(cache_path, df, interval=None):
+    """Describe a freshly written cache file (caller saves the manifest)."""
+    name = os.path.basename(cache_path)
+    previous = load_manifest().get(name) or {}
+    stat = os.stat(cache_path)
+    entry = {
+        'last_bar': str(pd.Timestamp(df.index[-1])) if len(df) else None,
+        'bars': int(len(df)),
+        'interval': _interval_name(interval) or previous.get('interval'),
+        'bytes': int(stat.st_size),
+        'mtime_ns': int(stat.st_mtime_ns),
+        'checksum': _file_checksum(cache_path),
+    }
+    with _memory_lock:
+        load_manifest()[name] = entry
+        _manifest_changes[name] = entry
+    return entry
+
+def get_manifest_entry(cache_path):
+    """
+    Manifest entry for a cache file, or None if missing / out of date.
+    Validation is a single stat(): size and mtime must match the entry.
+    """
+    entry = load_manifest().get(os.path.basename(cache_path))
+    if not entry:
+        return None
+    try:
+        stat = os.stat(cache_path)
+    except OSError:
+        return None
+    if stat.st_size != entry.get('bytes') or stat.st_mtime_ns != entry.get('mtime_ns'):
+        return None
+    return entry
+
+def verify_cache_file(cache_path):
+    """Full integrity check: recompute the file checksum and compare with the manifest."""
+    entry = load_manifest().get(os.path.basename(cache_path))
+    if not entry or not os.path.exists(cache_path):
+        return False
+    return _file_checksum(cache_path) == entry.get('checksum')
+
+def _index_cache_file(cache_path):
+    """Build (and save) the manifest entry of a file written without one."""
+    backend = CACHE_BACKENDS['csv'] if cache_path.endswith('.csv') else get_cache_backend()
+    try:
+        df = backend.read(cache_path, mmap=True)
+    except Exception:
+        return None
+    if df is None:
+        return None
+    entry = _record_manifest(cache_path, df)
+    return entry
+
+# ===================================================================
+# IN-PROCESS CACHE HANDLE (LRU, write-back)
+# ===================================================================
+# cache_path -> {'df': DataFrame, 'dirty': bool}; most recently used last.
+# Frames handed out are shared: callers must treat them as read-only
+# (update_cache builds a new frame instead of mutating).
+_memory_cache = OrderedDict()
+
+def _memory_get(cache_path):
+    with _memory_lock:
+        entry = _memory_cache.get(cache_path)
+        if entry is not None:
+            _memory_cache.move_to_end(cache_path)
+        return entry
+
+def _memory_put(cache_path, df, dirty, interval=None):
+    with _memory_lock:
+        _memory_cache[cache_path] = {'df': df, 'dirty': dirty, 'interval': interval}
+        _memory_cache.move_to_end(cache_path)
+        while len(_memory_cache) > CACHE_LRU_SIZE:
+            old_path, old_entry = _memory_cache.popitem(last=False)
+            if old_entry['dirty']:
+                _write_back(old_path, old_entry['df'], old_entry['interval'])
+
+def _write_back(cache_path, df, interval=None, save=True):
+    """Write one frame to disk and record it in the manifest."""
+    try:
+        with run_metrics.timed('cache_write'):
+            get_cache_backend().write(cache_path, df)
+        _record_manifest(cache_path, df, interval)
+    except Exception as e:
+        logger.warning(f"Cache write-back failed for {cache_path}: {e}")
+        return False
+    if save:
+        save_manifest()
+    return True
+
+def flush_cache():
+    """Write every modified symbol back to disk (once per run). Returns the number written."""
+    written = 0
+    with _memory_lock:
+        for cache_path, entry in _memory_cache.items():
+            if entry['dirty'] and _write_back(cache_path, entry['df'], entry['interval'], save=False):
+                entry['dirty'] = False
+                written += 1
+        save_manifest()
+    return written
+
+def drop_memory_cache():
+    """Flush and forget all in-memory frames (next access re-reads from disk)."""
+    flush_cache()
+    with _memory_lock:
+        _memory_cache.clear()
+
+# Safety net: scripts that never call flush_cache still persist their updates
+atexit.register(flush_cache)
+
 def has_cache(symbol, exchange):
-    """Check if cache exists for a symbol."""
-    return os.path.exists(get_cache_path(symbol, exchange))
+    """Check if cache exists for a symbol (in memory, active format or not-yet-migrated CSV)."""
+    cache_path = get_cache_path(symbol, exchange)
+    return (_memory_get(cache_path) is not None
+            or os.path.exists(cache_path)
+            or os.path.exists(get_legacy_csv_path(symbol, exchange)))
 
-def load_cache(symbol, exchange):
-    """Load cached OHLC data for a symbol."""
+def load_cache(symbol, exchange, mmap=False):
+    """
+    Load cached OHLC data for a symbol (disk is read at most once per run).
+    mmap=True (npy backend): read-only zero-copy view of the mapped file.
+    """
     cache_path = get_cache_path(symbol, exchange)
+    entry = _memory_get(cache_path)
+    if entry is not None:
+        run_metrics.count('cache.memory_hit')
+        return entry['df']
+    
+    legacy_path = get_legacy_csv_path(symbol, exchange)
+    if _legacy_csv_pending(legacy_path, cache_path):
+        # Not migrated yet / CSV refreshed since → convert (merge) once, keep the CSV
+        try:
+            with run_metrics.timed('cache_load'):
+                df = _import_legacy_csv(legacy_path, cache_path)
+            save_manifest()
+        except Exception:
+            return None
+        run_metrics.count('cache.csv_migrated')
+        if df is not None:
+            _memory_put(cache_path, df, dirty=False)
+        return df
     if not os.path.exists(cache_path):
         return None
     try:
-        df = pd.read_csv(cache_path, index_col=0, parse_dates=True)
-        if df.empty:
-            return None
-        return df
+        with run_metrics.timed('cache_load'):
+            df = get_cache_backend().read(cache_path, mmap=mmap)
     except Exception:
         return None
+    if df is not None:
+        run_metrics.count('cache.disk_read')
+        _memory_put(cache_path, df, dirty=False)
+    return df
 
-def save_cache(symbol, exchange, df):
-    """Save OHLC data to local cache."""
+def load_tail(symbol, exchange, n):
+    """
+    Last n bars of a symbol's cache without parsing the whole file
+    (memory → active format; a not-yet-migrated CSV is converted first). Cost ∝ n, not file size.
+    Same columns / index as load_cache; None if there is no cache.
+    The partial frame is not kept in the LRU handle.
+    """
+    n = max(1, int(n))
     cache_path = get_cache_path(symbol, exchange)
+    entry = _memory_get(cache_path)
+    if entry is not None:
+        return entry['df'].tail(n)
+    
+    if _legacy_csv_pending(get_legacy_csv_path(symbol, exchange), cache_path):
+        # Conversion / merge needs the whole CSV once
+        df = load_cache(symbol, exchange)
+        return None if df is None else df.tail(n)
+    if not os.path.exists(cache_path):
+        return None
+    path, backend = cache_path, get_cache_backend()
     try:
-        df.to_csv(cache_path)
-        return True
+        with run_metrics.timed('cache_tail'):
+            df = backend.read_tail(path, n)
     except Exception:
-        return False
+        return None
+    run_metrics.count('cache.tail_read')
+    return df
+
+def load_ohlcv_view(symbol, exchange):
+    """
+    Zero-copy OHLCV arrays for a symbol (memory-mapped, read-only).
+    Returns None if the cache is missing or the backend can't be mapped (csv).
+    """
+    backend = get_cache_backend()
+    cache_path = get_cache_path(symbol, exchange)
+    
+    # Not yet written back → views of the in-memory frame instead of the stale file
+    entry = _memory_get(cache_path)
+    if entry is not None and entry['dirty']:
+        df = entry['df']
+        arrays = {'index': df.index.values.astype('datetime64[ns]').astype(np.int64)}
+        for col in OHLCV_COLUMNS:
+            arrays[col] = df[col].to_numpy(dtype=np.float64)
+        return arrays
+    
+    if not hasattr(backend, 'read_arrays') or not os.path.exists(cache_path):
+        return None
+    try:
+        return backend.read_arrays(cache_path)
+    except Exception:
+        return None
+
+def save_cache(symbol, exchange, df, interval=None):
+    """Save OHLC data to local cache (write-back: hits disk + manifest on flush_cache)."""
+    cache_path = get_cache_path(symbol, exchange)
+    if interval is None:
+        previous = _memory_get(cache_path)
+        interval = previous['interval'] if previous else None
+    _memory_put(cache_path, df, dirty=True, interval=interval)
+    return True
+
+def remove_cache(symbol, exchange):
+    """Delete a symbol's cache file, manifest entry, in-memory frame and derived index / store files."""
+    cache_path = get_cache_path(symbol, exchange)
+    with _memory_lock:
+        _memory_cache.pop(cache_path, None)
+        load_manifest().pop(os.path.basename(cache_path), None)
+        _manifest_changes[os.path.basename(cache_path)] = None
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    # Pattern indexes (*.idx.npz) / indicator store (*.ind.npz) are derived from it
+    for path in glob.glob(glob.escape(get_pattern_index_path(symbol, exchange)) + ".*.npz"):
+        os.remove(path)
+    save_manifest()
 
 def get_last_cached_date(symbol, exchange):
-    """Get the last date in the cache."""
-    df = load_cache(symbol, exchange)
+    """Get the last date in the cache (memory → manifest → file tail)."""
+    cache_path = get_cache_path(symbol, exchange)
+    entry = _memory_get(cache_path)
+    if entry is None:
+        meta = get_manifest_entry(cache_path)
+        if meta and meta.get('last_bar'):
+            return pd.Timestamp(meta['last_bar'])
+    df = load_tail(symbol, exchange, 1)
     if df is None or df.empty:
         return None
     return df.index[-1]
@@ -127,34 +623,35 @@ def is_cache_fresh(symbol, exchange):
     """
     Smart Stale Check: ดูจาก "วันล่าสุดของข้อมูล" แทน file timestamp
     ครอบคลุม weekend (ศุกร์ปิดตลาด → จันทร์รันก็ยังสดอยู่)
+    V4: วันล่าสุดอ่านจาก manifest (ไม่ต้องโหลดข้อมูลทั้งไฟล์)
     """
-    cached = load_cache(symbol, exchange)
-    if cached is None or cached.empty:
-        return False
     try:
-        last_date = pd.Timestamp(cached.index[-1])
+        last_date = get_last_cached_date(symbol, exchange)
+        if last_date is None:
+            return False
         now = pd.Timestamp(datetime.now())
-        days_old = (now - last_date).days
+        days_old = (now - pd.Timestamp(last_date)).days
         return days_old <= MAX_DATA_AGE_DAYS
     except Exception:
         return False
 
-def update_cache(symbol, exchange, new_df):
+def update_cache(symbol, exchange, new_df, interval=None):
     """Update cache with new data (merge existing + new, deduplicate)."""
     existing = load_cache(symbol, exchange)
     
     if existing is None or existing.empty:
-        save_cache(symbol, exchange, new_df)
+        save_cache(symbol, exchange, new_df, interval)
         return new_df
     
-    combined = pd.concat([existing, new_df])
-    combined = combined[~combined.index.duplicated(keep='last')]
-    combined = combined.sort_index()
-    
-    if len(combined) > MAX_CACHE_BARS:
-        combined = combined.tail(MAX_CACHE_BARS)
+    with run_metrics.timed('cache_merge'):
+        combined = pd.concat([existing, new_df])
+        combined = combined[~combined.index.duplicated(keep='last')]
+        combined = combined.sort_index()
+        
+        if len(combined) > MAX_CACHE_BARS:
+            combined = combined.tail(MAX_CACHE_BARS)
     
-    save_cache(symbol, exchange, combined)
+    save_cache(symbol, exchange, combined, interval)
     return combined
 
 # ===================================================================
@@ -167,12 +664,13 @@ def safe_fetch(tv, symbol, exchange, interval, n_bars, delay=RATE_LIMIT_DELTA):
     """
     try:
         time.sleep(delay)
-        data = tv.get_hist(
-            symbol=symbol,
-            exchange=exchange,
-            interval=interval,
-            n_bars=n_bars
-        )
+        with run_metrics.timed('fetch'):
+            data = tv.get_hist(
+                symbol=symbol,
+                exchange=exchange,
+                interval=interval,
+                n_bars=n_bars
+            )
         if data is not None and not data.empty:
             report_fetch_success()
             return data
@@ -185,7 +683,7 @@ def safe_fetch(tv, symbol, exchange, interval, n_bars, delay=RATE_LIMIT_DELTA):
 # ===================================================================
 # MAIN ENTRY POINT: Smart data fetching with cache
 # ===================================================================
-def get_data_with_cache(tv, symbol, exchange, interval, full_bars=5000, delta_bars=50):
+def get_data_with_cache(tv, symbol, exchange, interval, full_bars=5000, delta_bars=50, mmap=False):
     """
     Smart data fetching with cache (V3 - Performance).
     
@@ -198,13 +696,17 @@ def get_data_with_cache(tv, symbol, exchange, interval, full_bars=5000, delta_ba
     
     Key change from V2: NO progressive_fetch (was 3 attempts).
     Network failure = use cache. No cache = skip.
+    
+    mmap=True: cache-served data comes back as a read-only memory-mapped view.
     """
-    cached = load_cache(symbol, exchange) if has_cache(symbol, exchange) else None
+    cached = load_cache(symbol, exchange, mmap=mmap) if has_cache(symbol, exchange) else None
     
     # === FAST PATH: Connection is bad → use cache directly ===
     if not is_connection_healthy():
         if cached is not None and not cached.empty:
+            run_metrics.count('cache.offline_hit')
             return cached
+        run_metrics.count('cache.offline_miss')
         return None  # No cache + no connection = skip
     
     # === Connection is healthy: try to fetch ===
@@ -212,18 +714,170 @@ def get_data_with_cache(tv, symbol, exchange, interval, full_bars=5000, delta_ba
         # Has cache → try delta only (fast, 50 bars)
         new_data = safe_fetch(tv, symbol, exchange, interval, delta_bars)
         if new_data is not None:
-            return update_cache(symbol, exchange, new_data)
+            run_metrics.count('cache.delta')
+            return update_cache(symbol, exchange, new_data, interval)
         else:
             # Delta failed → use existing cache (still valid data)
+            run_metrics.count('cache.delta_failed')
             return cached
     else:
         # No cache → single full fetch attempt
+        run_metrics.count('cache.miss')
         full_data = safe_fetch(tv, symbol, exchange, interval, full_bars, delay=RATE_LIMIT_FULL)
         if full_data is not None:
-            save_cache(symbol, exchange, full_data)
+            save_cache(symbol, exchange, full_data, interval)
             return full_data
+        run_metrics.count('cache.full_failed')
         return None  # Complete failure
 
+# ===================================================================
+# ASYNC FETCH: concurrent prefetch with token-bucket rate limit
+# ===================================================================
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens/s, at most `capacity` banked.
+    acquire() waits until a token is available (requests start no faster than the rate).
+    """
+    def __init__(self, rate=ASYNC_RATE_PER_SEC, capacity=ASYNC_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+async def safe_fetch_async(tv, symbol, exchange, interval, n_bars, bucket):
+    """
+    Async safe_fetch: token bucket instead of a fixed sleep, blocking get_hist
+    runs in a worker thread. Same single attempt + circuit breaker reporting.
+    """
+    await bucket.acquire()
+    try:
+        with run_metrics.timed('fetch'):
+            data = await asyncio.to_thread(
+                tv.get_hist,
+                symbol=symbol,
+                exchange=exchange,
+                interval=interval,
+                n_bars=n_bars
+            )
+        if data is not None and not data.empty:
+            report_fetch_success()
+            return data
+        report_fetch_failure()
+        return None
+    except Exception:
+        report_fetch_failure()
+        return None
+
+async def get_data_with_cache_async(tv, symbol, exchange, interval, full_bars=5000, delta_bars=50, bucket=None):
+    """
+    Async version of get_data_with_cache — same strategy:
+    connection bad → cache only; has cache → delta fetch (fallback cache);
+    no cache → single full fetch.
+    """
+    if bucket is None:
+        bucket = TokenBucket()
+    cached = load_cache(symbol, exchange) if has_cache(symbol, exchange) else None
+    
+    # === FAST PATH: Connection is bad → use cache directly ===
+    if not is_connection_healthy():
+        if cached is not None and not cached.empty:
+            run_metrics.count('cache.offline_hit')
+            return cached
+        run_metrics.count('cache.offline_miss')
+        return None
+    
+    if cached is not None and not cached.empty:
+        new_data = await safe_fetch_async(tv, symbol, exchange, interval, delta_bars, bucket)
+        if new_data is not None:
+            run_metrics.count('cache.delta')
+            return update_cache(symbol, exchange, new_data, interval)
+        run_metrics.count('cache.delta_failed')
+        return cached
+    
+    run_metrics.count('cache.miss')
+    full_data = await safe_fetch_async(tv, symbol, exchange, interval, full_bars, bucket)
+    if full_data is not None:
+        save_cache(symbol, exchange, full_data, interval)
+        return full_data
+    run_metrics.count('cache.full_failed')
+    return None
+
+async def prefetch_many(tv, assets, interval=None, full_bars=5000, delta_bars=50,
+                        max_in_flight=ASYNC_MAX_IN_FLIGHT, rate=ASYNC_RATE_PER_SEC,
+                        burst=ASYNC_BURST, tv_factory=None, bucket=None, clients=None):
+    """
+    Fetch many symbols concurrently so network latency overlaps.
+    
+    assets: list of {'symbol', 'exchange'} dicts (optional per-asset
+    'interval' / 'history_bars' override the defaults).
+    
+    tvDatafeed keeps its websocket on the client object, so each in-flight
+    request needs its own client: pass tv_factory (tv_client_factory(tv)) to open
+    up to max_in_flight clients. With tv only, requests run one at a time
+    (still under the token bucket).
+    
+    Calling it once per batch: pass the same bucket (TokenBucket) and clients
+    (client list, tv first) to every call, all on one event loop, so the rate
+    limit and the connections hold across the whole run.
+    
+    Returns {(symbol, exchange): DataFrame or None} in input order.
+    Usage: results = asyncio.run(prefetch_many(tv, assets, interval, tv_factory=tv_client_factory(tv)))
+    """
+    bucket = bucket or TokenBucket(rate, burst)
+    if clients is None:
+        clients = [tv]
+        if tv_factory is not None:
+            clients += [tv_factory() for _ in range(max(0, max_in_flight - 1))]
+    idle = asyncio.Queue()
+    for client in clients:
+        idle.put_nowait(client)
+    
+    async def fetch_one(asset):
+        client = await idle.get()
+        try:
+            return await get_data_with_cache_async(
+                client, asset['symbol'], asset['exchange'],
+                asset.get('interval', interval),
+                full_bars=asset.get('history_bars', full_bars),
+                delta_bars=delta_bars,
+                bucket=bucket
+            )
+        except Exception:
+            return None
+        finally:
+            idle.put_nowait(client)
+    
+    frames = await asyncio.gather(*(fetch_one(a) for a in assets))
+    return {(a['symbol'], a['exchange']): df for a, df in zip(assets, frames)}
+
+def tv_client_factory(tv):
+    """
+    tv_factory for prefetch_many: fresh TvDatafeed clients carrying tv's auth
+    token (same credentials, no extra login per client).
+    """
+    from tvDatafeed import TvDatafeed
+    
+    def factory():
+        client = TvDatafeed()
+        if getattr(tv, 'token', None):
+            client.token = tv.token
+        return client
+    return factory
+
 # ===================================================================
 # CONNECTION HEALTH CHECK
 # ===================================================================
@@ -240,26 +894,42 @@ def check_connection_health(tv, test_symbol="AAPL", test_exchange="NASDAQ"):
 # ===================================================================
 # CACHE STATISTICS
 # ===================================================================
+def _cache_files():
+    """
+    Cache files of the active backend, plus legacy CSVs not migrated yet.
+    A CSV with an active-format sibling is the tracked source copy, not a
+    second cache entry (counted / cleared once, through its sibling).
+    """
+    extension = get_cache_backend().extension
+    names = os.listdir(CACHE_DIR)
+    active = {f for f in names if f.endswith(extension)}
+    legacy = [f for f in names if f.endswith('.csv') and f[:-4] + extension not in active]
+    return sorted(active) + legacy
+
 def get_cache_stats():
-    """Get statistics about the cache."""
+    """
+    Get statistics about the cache.
+    V4: sizes + last bars come from the manifest (one small file read);
+    only files missing from it are opened (and then added).
+    """
     ensure_cache_dir()
-    files = [f for f in os.listdir(CACHE_DIR) if f.endswith('.csv')]
+    files = _cache_files()
     
     total_size = 0
     fresh = 0
     stale = 0
+    now = pd.Timestamp(datetime.now())
     
     for f in files:
         path = os.path.join(CACHE_DIR, f)
-        total_size += os.path.getsize(path)
+        entry = get_manifest_entry(path) or _index_cache_file(path)
+        total_size += entry['bytes'] if entry else os.path.getsize(path)
         
-        parts = f.replace(".csv", "").split("_", 1)
-        if len(parts) == 2:
-            exchange, symbol = parts
-            if is_cache_fresh(symbol, exchange):
-                fresh += 1
-            else:
-                stale += 1
+        if entry and entry.get('last_bar') and (now - pd.Timestamp(entry['last_bar'])).days <= MAX_DATA_AGE_DAYS:
+            fresh += 1
+        else:
+            stale += 1
+    save_manifest()
     
     return {
         'total_files': len(files),
@@ -270,9 +940,20 @@ def get_cache_stats():
     }
 
 def clear_cache():
-    """Clear all cached data."""
+    """Clear all cached data (tracked CSVs that were migrated are kept)."""
+    global _manifest
     ensure_cache_dir()
-    files = [f for f in os.listdir(CACHE_DIR) if f.endswith('.csv')]
+    files = _cache_files()
+    with _memory_lock:
+        _memory_cache.clear()
+        _manifest_changes.clear()
+        _manifest = {}
     for f in files:
         os.remove(os.path.join(CACHE_DIR, f))
+    if os.path.exists(get_manifest_path()):
+        os.remove(get_manifest_path())
+    # Pattern indexes / indicator stores are derived from the cache → drop them too
+    for f in os.listdir(CACHE_DIR):
+        if f.endswith(('.idx.npz', '.ind.npz')):
+            os.remove(os.path.join(CACHE_DIR, f))
     return len(files)
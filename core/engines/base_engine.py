@@ -3,11 +3,61 @@ import numpy as np
 import os
 from collections import defaultdict
 
+# Signal codes (int8) for the encoded +/-/. series
+SIGNAL_UP = 1
+SIGNAL_DOWN = -1
+SIGNAL_NEUTRAL = 0
+
+WARMUP_BARS = 252            # History scans start after the 252-bar threshold warmup
+MAX_STREAK_SUBPATTERN = 7    # Streak scans enumerate sub-patterns with end_pos < start_pos + 8
+
+
+def encode_pattern(pattern_str):
+    """Convert a '+'/'-' pattern string into its int8 signal codes."""
+    return np.array([SIGNAL_UP if c == '+' else SIGNAL_DOWN for c in pattern_str], dtype=np.int8)
+
+
+def encode_signals(pct_change, effective_std, multiplier=1.0):
+    """Vectorized +/-/. encoding of a return series (or symbols × bars matrix) against its threshold (int8 codes)."""
+    ret = np.asarray(pct_change, dtype=np.float64)
+    thresh = np.asarray(effective_std, dtype=np.float64) * multiplier
+    
+    signals = np.full(ret.shape, SIGNAL_NEUTRAL, dtype=np.int8)
+    signals[ret > thresh] = SIGNAL_UP
+    signals[ret < -thresh] = SIGNAL_DOWN
+    return signals
+
+
+def active_pattern_starts(signals, pct_change, effective_std, max_lookback=15):
+    """
+    First position of get_active_pattern's backward walk for every bar: the
+    walk covers at most max_lookback bars and stops after the last neutral bar
+    (moves exactly on the threshold are skipped, not stops).
+    The active pattern at bar t = non-neutral signals in [start[t], t].
+    """
+    signals = np.asarray(signals)
+    n = len(signals)
+    on_threshold = np.abs(np.asarray(pct_change, dtype=np.float64)) == np.asarray(effective_std, dtype=np.float64)
+    stops = (signals == SIGNAL_NEUTRAL) & ~on_threshold
+    # Position of the last stop at or before each bar (-1 = none yet)
+    last_stop = np.maximum.accumulate(np.where(stops, np.arange(n), -1)) if n else np.empty(0, dtype=np.int64)
+    return np.maximum(last_stop + 1, np.arange(n) - max_lookback + 1)
+
+
+def pattern_at(signals, start, end):
+    """'+'/'-' pattern of the non-neutral signals in [start, end] (oldest first)."""
+    return ''.join('+' if code == SIGNAL_UP else '-' for code in signals[start:end + 1] if code != SIGNAL_NEUTRAL)
+
+
 class BasePatternEngine:
     """
     Base class for all market-specific trading engines.
     Provides common utilities for pattern recognition and statistical analysis.
     """
+    # History scan used by get_pattern_stats (see PatternIndex modes)
+    INDEX_MODE = 'streak'
+    INDEX_PRICE_MODE = 'close'
+
     def __init__(self, min_len=1, max_len=8):
         self.min_len = min_len
         self.max_len = max_len
@@ -25,36 +75,46 @@ class BasePatternEngine:
             else: break  # Neutral day = STOP (Core Logic 1)
         return pat_str
 
-    def get_active_pattern(self, pct_change, effective_std, max_lookback=15):
+    def encode_signals(self, pct_change, effective_std, multiplier=1.0):
+        """
+        Encode the full signal series as int8 codes in one vectorized pass:
+        SIGNAL_UP ('+'), SIGNAL_DOWN ('-'), SIGNAL_NEUTRAL ('.' incl. NaN bars).
+        
+        Computed once per asset per threshold and shared by get_active_pattern
+        and every get_pattern_stats suffix lookup.
+        """
+        return encode_signals(pct_change, effective_std, multiplier)
+
+    def get_active_pattern(self, pct_change, effective_std, max_lookback=15, signals=None):
         """
         Rule 2: Dynamic Lookback — Pure Streak Extraction (Non-Fixed)
         
         Walks backwards from today, building a pattern string of ALL consecutive
         significant moves. Breaks immediately on the first 'Neutral' day.
         """
+        if signals is None:
+            signals = self.encode_signals(pct_change, effective_std)
+        
         pattern_chars = []
+        n = len(signals)
         
         # Increase safety lookback or remove fixed loop if strictly streak-based
         for i in range(1, max_lookback + 1):
-            idx = len(pct_change) - i
+            idx = n - i
             if idx < 0:
                 break
-                
-            ret = pct_change.iloc[idx]
-            thresh = effective_std.iloc[idx]
             
-            if pd.isna(ret) or pd.isna(thresh):
-                break
-            
-            # Neutral day = STOP (strict rule)
-            if abs(ret) < thresh:
-                break
-            
-            # Significant move: classify
-            if ret > thresh:
+            code = signals[idx]
+            if code == SIGNAL_UP:
                 pattern_chars.append('+')
-            elif ret < -thresh:
+            elif code == SIGNAL_DOWN:
                 pattern_chars.append('-')
+            elif abs(pct_change.iloc[idx]) == effective_std.iloc[idx]:
+                # Move exactly on the threshold: not neutral, not a signal → skip
+                continue
+            else:
+                # Neutral day (or NaN) = STOP (strict rule)
+                break
         
         if not pattern_chars:
             return ""
@@ -64,8 +124,89 @@ class BasePatternEngine:
         pattern_chars.reverse()
         return ''.join(pattern_chars)
     
+    def match_pattern_ends(self, signals, pattern_str, streak_scan=False):
+        """
+        Vectorized history scan over the encoded signals.
+        
+        Returns the end index of every window equal to pattern_str that has an
+        N+1 bar (end <= n - 2), after the WARMUP_BARS warmup:
+        - streak_scan=False: window END must be >= warmup (sliding window scan)
+        - streak_scan=True:  window START must be >= warmup and the pattern may
+          be at most MAX_STREAK_SUBPATTERN long (streak enumeration scan)
+        """
+        n = len(signals)
+        length = len(pattern_str)
+        if length == 0 or (streak_scan and length > MAX_STREAK_SUBPATTERN):
+            return np.empty(0, dtype=np.intp)
+        
+        first_end = WARMUP_BARS + length - 1 if streak_scan else max(WARMUP_BARS, length - 1)
+        last_end = n - 2
+        if first_end > last_end:
+            return np.empty(0, dtype=np.intp)
+        
+        # Compare each pattern char against the signal column aligned to it
+        mask = np.ones(last_end - first_end + 1, dtype=bool)
+        for k, code in enumerate(encode_pattern(pattern_str)):
+            offset = length - 1 - k
+            mask &= signals[first_end - offset:last_end + 1 - offset] == code
+        
+        return np.flatnonzero(mask) + first_end
+    
+    def build_pattern_index(self, prices, pct_change, effective_std, signals=None, sma50=None,
+                            index_path=None, fixed_threshold=None):
+        """
+        Build the per-asset PatternIndex (lengths 1-8) for this engine's scan mode.
+        Suffix lookups then become dictionary hits instead of history rescans.
+        
+        With index_path + fixed_threshold the index is persisted next to the
+        cache file and only appended bars are counted on the next run.
+        Dynamic thresholds re-encode history every bar → always a full build.
+        """
+        from .pattern_index import PatternIndex, next_bar_returns, regime_codes
+        
+        if signals is None:
+            signals = self.encode_signals(pct_change, effective_std)
+        regimes = None
+        if sma50 is not None:
+            close = prices['close'] if self.INDEX_PRICE_MODE == 'intraday' else prices
+            regimes = regime_codes(close, sma50)
+        next_returns = next_bar_returns(prices, self.INDEX_PRICE_MODE)
+        
+        persist = (index_path is not None and fixed_threshold is not None
+                   and isinstance(pct_change.index, pd.DatetimeIndex))
+        if not persist:
+            return PatternIndex.build(signals, next_returns, mode=self.INDEX_MODE, regimes=regimes)
+        
+        path = f"{index_path}.{self.INDEX_MODE}.idx.npz"
+        times = pct_change.index.values.astype('datetime64[ns]').astype(np.int64)
+        
+        index = PatternIndex.load(path)
+        if (index is not None and index.mode == self.INDEX_MODE
+                and index.price_mode == self.INDEX_PRICE_MODE
+                and index.threshold == fixed_threshold):
+            unchanged = index.n_bars == len(times) and len(index.times) and index.times[0] == times[0]
+            if index.sync(signals, next_returns, regimes, times):
+                if not unchanged:
+                    self._save_pattern_index(index, path)
+                return index
+        
+        # Missing / stale / revised history → full rebuild
+        index = PatternIndex.build(signals, next_returns, mode=self.INDEX_MODE, regimes=regimes)
+        index.times = times
+        index.threshold = fixed_threshold
+        index.price_mode = self.INDEX_PRICE_MODE
+        self._save_pattern_index(index, path)
+        return index
+
+    def _save_pattern_index(self, index, path):
+        """Persist the index; a failed write only costs a rebuild next run."""
+        try:
+            index.save(path)
+        except OSError:
+            pass
+
     def select_best_fit(self, prices, pct_change, effective_std, active_pattern, 
-                        min_count=30, direction_override=None):
+                        min_count=30, direction_override=None, signals=None, index=None):
         """
         Rule 3: Best Fit Sub-pattern Selection (V7.2 — Hybrid Approach)
         
@@ -100,12 +241,16 @@ class BasePatternEngine:
         
         fallback_candidate = None  # Stores the first marginal pattern found
         
+        # Encode once, reused by every sub-pattern scan
+        if signals is None:
+            signals = self.encode_signals(pct_change, effective_std)
+        
         for sub_pat in sub_patterns:
             length = len(sub_pat)
             
             # Mode A: Overlapping sliding window scan
             future_returns = self.get_pattern_stats(
-                prices, pct_change, effective_std, sub_pat, length
+                prices, pct_change, effective_std, sub_pat, length, signals=signals, index=index
             )
             
             if not future_returns:
@@ -165,7 +310,7 @@ class BasePatternEngine:
         # No sub-pattern met Count >= min_count → No Trade / Pass
         return None
 
-    def aggregate_voting(self, df, pct_change, effective_std, active_pattern, min_count=15, **kwargs):
+    def aggregate_voting(self, df, pct_change, effective_std, active_pattern, min_count=15, signals=None, index=None, **kwargs):
         """
         V4.5: FINAL LOGIC — AVERAGE OF WINNING PATTERNS
         1. Break active_pattern into suffixes.
@@ -184,20 +329,37 @@ class BasePatternEngine:
             if sub:
                 suffixes.append(sub)
 
-        # 2. Local Pattern Decision & Weighted Aggregation
-        p_winners = [] # List of (sub_pat, win_count, lose_count, mean_return)
-        n_winners = []
-        all_decisions = [] 
-        
+        # Encode once, reused by every suffix scan
+        if signals is None:
+            signals = self.encode_signals(pct_change, effective_std, kwargs.get('multiplier', 1.0))
+
+        # 2. Per-suffix N+1 counts (up, down, returns)
+        suffix_stats = []
         for sub_pat in suffixes:
-            future_returns = self.get_pattern_stats(df, pct_change, effective_std, sub_pat, len(sub_pat), **kwargs)
+            future_returns = self.get_pattern_stats(df, pct_change, effective_std, sub_pat, len(sub_pat), signals=signals, index=index, **kwargs)
             if not future_returns:
                 continue
                 
             p_count_i = sum(1 for r in future_returns if r > 0)
             n_count_i = sum(1 for r in future_returns if r < 0)
+            suffix_stats.append((sub_pat, p_count_i, n_count_i, future_returns))
+        
+        return self.vote(active_pattern, suffix_stats, min_count)
+
+    def vote(self, active_pattern, suffix_stats, min_count=15):
+        """
+        Winner-takes-all decision of aggregate_voting (steps 2-5).
+        suffix_stats: (sub_pat, up_count, down_count, future_returns) per suffix
+        with at least one occurrence, longest suffix first (the mean return is
+        only taken for winning suffixes).
+        """
+        # 2. Local Pattern Decision & Weighted Aggregation
+        p_winners = [] # List of (sub_pat, win_count, lose_count, mean_return)
+        n_winners = []
+        all_decisions = [] 
+        
+        for sub_pat, p_count_i, n_count_i, future_returns in suffix_stats:
             total_i = p_count_i + n_count_i
-            mean_ret_i = np.mean(future_returns) if future_returns else 0.0
             
             # Label as Weak if count < min_count
             is_weak = total_i < min_count
@@ -205,11 +367,11 @@ class BasePatternEngine:
             
             if p_count_i > n_count_i:
                 if not is_weak:
-                    p_winners.append((sub_pat, p_count_i, n_count_i, mean_ret_i))
+                    p_winners.append((sub_pat, p_count_i, n_count_i, np.mean(future_returns)))
                 all_decisions.append(f"{sub_pat}:{p_count_i}/{n_count_i}(P{tag_suffix})")
             elif n_count_i > p_count_i:
                 if not is_weak:
-                    n_winners.append((sub_pat, n_count_i, p_count_i, mean_ret_i))
+                    n_winners.append((sub_pat, n_count_i, p_count_i, np.mean(future_returns)))
                 all_decisions.append(f"{sub_pat}:{n_count_i}/{p_count_i}(N{tag_suffix})")
             else:
                 all_decisions.append(f"{sub_pat}:{p_count_i}/{n_count_i}(T{tag_suffix})")
@@ -256,77 +418,66 @@ class BasePatternEngine:
             'breakdown': "; ".join(all_decisions)
         }
 
-    def get_pattern_stats(self, prices, pct_change, effective_std, pattern_str, length, multiplier=1.0):
+    def replay_voting(self, active_pattern, bar, replay_index, min_count=15, current_trend=None):
+        """
+        aggregate_voting as it ran on df.iloc[:bar + 1], read from a
+        PointInTimeIndex over the full history (same counts, same returns order).
+        """
+        if not active_pattern:
+            return None
+        
+        suffix_stats = []
+        for i in range(len(active_pattern)):
+            sub_pat = active_pattern[i:]
+            visible = replay_index.counts_at(sub_pat, bar, current_trend)
+            if visible is None:
+                continue
+            suffix_stats.append((sub_pat, *visible))
+        
+        return self.vote(active_pattern, suffix_stats, min_count)
+
+    def get_pattern_stats(self, prices, pct_change, effective_std, pattern_str, length, multiplier=1.0, signals=None, index=None):
         """
         Mode A: Overlapping Sliding Window — Streak-based pattern counting.
         
-        1. Build signal series: '+', '-', '.' for every bar
+        1. Encode signal series: '+', '-', '.' for every bar (shared int8 codes)
         2. Find continuous streaks (broken only by '.')
         3. Enumerate all sub-patterns within each streak
         4. If sub-pattern matches target, record N+1 future return
         
         This is consistent with generate_master_stats.py scanning logic.
         """
-        n = len(pct_change)
-        future_returns = []
-        
-        # Step 1: Build full signal series
-        signals = []
-        for i in range(n):
-            ret = pct_change.iloc[i]
-            thresh = effective_std.iloc[i] * multiplier
-            
-            if pd.isna(ret) or pd.isna(thresh):
-                signals.append('.')
-            elif ret > thresh:
-                signals.append('+')
-            elif ret < -thresh:
-                signals.append('-')
-            else:
-                signals.append('.')  # Neutral
+        # Pattern index hit (built with the same encoding and scan mode)
+        if index is not None and index.covers(pattern_str):
+            return index.future_returns(pattern_str)
         
-        # Step 2: Scan streaks (continuous non-neutral runs)
-        i = 252  # Start after warmup
-        while i < n - 1:  # -1 because we need N+1 return
-            if signals[i] == '.':
-                i += 1
-                continue
-            
-            # Find streak boundaries
-            streak_start = i
-            while i < n and signals[i] != '.':
-                i += 1
-            streak_end = i
-            
-            streak_chars = signals[streak_start:streak_end]
-            streak_len = len(streak_chars)
-            
-            # Step 3: Enumerate all sub-patterns (overlapping, step=1)
-            for start_pos in range(streak_len):
-                for end_pos in range(start_pos + 1, min(start_pos + 8, streak_len + 1)):
-                    sub = ''.join(streak_chars[start_pos:end_pos])
-                    
-                    # Check if this sub-pattern matches our target
-                    if sub == pattern_str:
-                        # The absolute index of the last char of this sub-pattern
-                        abs_idx = streak_start + end_pos - 1
-                        
-                        # Step 4: Record N+1 future return (if available)
-                        if abs_idx + 1 < n:
-                            next_ret = (prices.iloc[abs_idx + 1] - prices.iloc[abs_idx]) / prices.iloc[abs_idx]
-                            future_returns.append(next_ret)
-        
-        return future_returns
-
-    def calculate_dynamic_threshold(self, pct_change, min_floor=None):
+        # Step 1: Encoded signal series (reuse caller's encoding when given)
+        if signals is None:
+            signals = self.encode_signals(pct_change, effective_std, multiplier)
+        
+        # Steps 2-3: Streak sub-pattern matches (start after warmup, len <= 7)
+        match_ends = self.match_pattern_ends(signals, pattern_str, streak_scan=True)
+        
+        # Step 4: Record N+1 future return
+        price_arr = np.asarray(prices, dtype=np.float64)
+        next_ret = (price_arr[match_ends + 1] - price_arr[match_ends]) / price_arr[match_ends]
+        return list(next_ret)
+
+    def calculate_dynamic_threshold(self, pct_change, min_floor=None, indicators=None):
         """
         Calculates the adaptive threshold based on:
         1. Case 2: 20-day Rolling SD (Adaptive)
         2. Case 1: 252-day Rolling SD (Yearly Base Floor)
         3. Config Floor: Absolute minimum move (e.g., 0.6% for US, 1.0% for Thai)
+        
+        indicators: IndicatorSet synced to the same bars (rolling SDs come from the store)
         """
-        short_std = pct_change.rolling(20).std()
-        long_std = pct_change.rolling(252).std()
+        if indicators is not None:
+            short_std = indicators.rolling_std(20, 'intraday')
+            long_std = indicators.rolling_std(252, 'intraday')
+        else:
+            short_std = pct_change.rolling(20).std()
+            long_std = pct_change.rolling(252).std()
         
         # Merge Case 1 and Case 2
         effective_std = np.maximum(short_std, long_std.fillna(0))
@@ -0,0 +1,108 @@
+"""
+group_matrix.py - Cross-Sectional (symbols x bars) Group Matrix
+================================================================
+Aligns every symbol of an asset group into one 2-D matrix so the per-bar
+work of analyze() runs once for the whole group:
+- signals are encoded for all symbols in one pass
+- active patterns (Dynamic Lookback) are read off the last column
+- suffix N+1 statistics are counted with one vectorized window scan
+  per suffix length, for all symbols at once
+
+Rows are right-aligned: the last column is every symbol's last bar and
+shorter histories are NaN-padded on the left (padding encodes as neutral,
+so no window ever crosses into it).
+
+Counts follow the Mean Reversion sliding-window scan exactly (PatternIndex
+'window' mode): occurrence END >= WARMUP_BARS of the symbol's own history
+and an N+1 bar (end <= n - 2).
+"""
+
+import numpy as np
+
+from .base_engine import SIGNAL_UP, SIGNAL_NEUTRAL, WARMUP_BARS, pattern_at
+from .pattern_index import pattern_key
+
+
+def align_frames(frames, columns=('open', 'close')):
+    """
+    Right-align the frames' columns into (symbols x bars) float64 matrices.
+    Returns ({column: matrix}, first_col) where first_col[s] is the column of
+    row s's first bar.
+    """
+    lengths = np.array([len(df) for df in frames], dtype=np.int64)
+    n_cols = int(lengths.max()) if len(frames) else 0
+    first_col = n_cols - lengths
+
+    matrices = {}
+    for col in columns:
+        mat = np.full((len(frames), n_cols), np.nan)
+        for row, df in enumerate(frames):
+            mat[row, first_col[row]:] = df[col].to_numpy(dtype=np.float64)
+        matrices[col] = mat
+    return matrices, first_col
+
+
+def active_patterns(signals, pct_change, effective_std, max_lookback=15):
+    """
+    get_active_pattern for the last bar of every row: walk back at most
+    max_lookback bars, skip moves exactly on the threshold, stop at the
+    first other neutral bar (or NaN).
+    """
+    tail = signals[:, -max_lookback:]
+    width = tail.shape[1]
+    on_threshold = np.abs(pct_change[:, -width:]) == effective_std[:, -width:]
+    stops = (tail == SIGNAL_NEUTRAL) & ~on_threshold
+
+    # Column of the last stop per row (-1 = walk ran the full lookback)
+    last_stop = np.where(stops.any(axis=1), width - 1 - np.argmax(stops[:, ::-1], axis=1), -1)
+    return [pattern_at(tail[row], last_stop[row] + 1, width - 1) for row in range(len(tail))]
+
+
+def window_suffix_stats(signals, next_returns, first_col, patterns):
+    """
+    aggregate_voting's per-suffix N+1 stats for every row in one scan per length.
+
+    Returns, per row, [(sub_pat, up_count, down_count, future_returns)] for every
+    suffix of patterns[row] with at least one occurrence, longest suffix first
+    (the input BasePatternEngine.vote expects). future_returns keeps the
+    chronological order of the single-symbol scan.
+    """
+    n_rows, n_cols = signals.shape
+    suffix_stats = [[] for _ in range(n_rows)]
+    max_len = max((len(p) for p in patterns), default=0)
+    if max_len == 0 or n_cols < 2:
+        return suffix_stats
+
+    cols = np.arange(n_cols)
+    eligible = (cols >= (first_col + WARMUP_BARS)[:, None]) & (cols <= n_cols - 2)
+    ret_up = next_returns > 0
+    ret_down = next_returns < 0
+
+    bits = np.zeros((n_rows, n_cols), dtype=np.int64)
+    valid = np.ones((n_rows, n_cols), dtype=bool)
+    codes = np.full((n_rows, n_cols), SIGNAL_NEUTRAL, dtype=signals.dtype)
+    for length in range(1, max_len + 1):
+        # Extend the window ending at every column one bar into the past
+        # (older = more significant bit, same packing as pattern_key)
+        codes[:, length - 1:] = signals[:, :n_cols - length + 1]
+        codes[:, :length - 1] = SIGNAL_NEUTRAL
+        valid &= codes != SIGNAL_NEUTRAL
+        bits |= (codes == SIGNAL_UP).astype(np.int64) << (length - 1)
+
+        rows = np.array([row for row, p in enumerate(patterns) if len(p) >= length], dtype=np.int64)
+        targets = np.array([pattern_key(patterns[row][-length:]) for row in rows], dtype=np.int64)
+        match = valid[rows] & eligible[rows] & ((bits[rows] | (1 << length)) == targets[:, None])
+
+        totals = match.sum(axis=1)
+        ups = (match & ret_up[rows]).sum(axis=1)
+        downs = (match & ret_down[rows]).sum(axis=1)
+        for i, row in enumerate(rows.tolist()):
+            if totals[i]:
+                suffix_stats[row].append(
+                    (patterns[row][-length:], int(ups[i]), int(downs[i]), next_returns[row, match[i]])
+                )
+
+    # Scanned shortest → longest; vote() walks longest → shortest
+    for stats in suffix_stats:
+        stats.reverse()
+    return suffix_stats
@@ -0,0 +1,422 @@
+"""
+pattern_index.py - Per-Asset Pattern Occurrence Index
+======================================================
+One pass over the encoded signal series maps every pattern of length
+1..MAX_INDEX_LEN to:
+- the end positions of its historical occurrences (ascending)
+- N+1 up/down/flat counts and return sums (per trend regime)
+
+Patterns are stored as bit-packed integer keys: a leading 1 bit marks the
+length, then one bit per char, oldest first ('+' = 1, '-' = 0).
+    '+'   -> 0b11   (3)
+    '-+-' -> 0b1010 (10)
+
+Eligibility follows the engines' history scans exactly:
+- 'window' (Mean Reversion): window END >= WARMUP_BARS
+- 'streak' (Trend / Base):   window START >= WARMUP_BARS, length <= 7
+and every occurrence needs an N+1 bar (end <= n - 2).
+
+Incremental mode (fixed threshold only): the index is saved next to the
+cache file and sync() counts only the bars appended since the last run
+(plus the last old bar, which just gained its N+1). Head bars trimmed by
+MAX_CACHE_BARS are un-counted the same way. Any revised bar, a threshold
+change or a different scan mode → full rebuild.
+
+Point-in-time replay: PointInTimeIndex answers "what did the index hold
+at bar t" from one full-history build (see BasePatternEngine.replay_voting).
+"""
+
+import os
+import numpy as np
+
+from .base_engine import (
+    SIGNAL_UP, SIGNAL_DOWN, SIGNAL_NEUTRAL, WARMUP_BARS, MAX_STREAK_SUBPATTERN, encode_signals
+)
+
+MAX_INDEX_LEN = 8
+
+# Trend regime of the bar a pattern ends on (close vs SMA50)
+REGIME_UNKNOWN = 0   # SMA not available yet → counts for both trends
+REGIME_BULL = 1
+REGIME_BEAR = 2
+
+# Stats columns per (key, regime)
+STAT_UP, STAT_DOWN, STAT_FLAT, STAT_RET_SUM = range(4)
+
+_EMPTY_ENDS = np.empty(0, dtype=np.int64)
+
+
+def pattern_key(pattern_str):
+    """Bit-pack a '+'/'-' pattern string into its integer key."""
+    key = 1
+    for c in pattern_str:
+        key = (key << 1) | (c == '+')
+    return key
+
+
+def key_to_pattern(key):
+    """Inverse of pattern_key."""
+    length = int(key).bit_length() - 1
+    return ''.join('+' if (key >> (length - 1 - i)) & 1 else '-' for i in range(length))
+
+
+def regime_codes(close, sma50):
+    """Per-bar regime codes: REGIME_BULL if close > SMA50, REGIME_BEAR otherwise, REGIME_UNKNOWN if SMA is NaN."""
+    close_arr = np.asarray(close, dtype=np.float64)
+    sma_arr = np.asarray(sma50, dtype=np.float64)
+    regimes = np.where(close_arr > sma_arr, REGIME_BULL, REGIME_BEAR).astype(np.int8)
+    regimes[np.isnan(sma_arr)] = REGIME_UNKNOWN
+    return regimes
+
+
+def next_bar_returns(prices, price_mode='intraday'):
+    """
+    N+1 return for every bar position e (NaN for the last bar):
+    - 'intraday': (close[e+1] - open[e+1]) / open[e+1]   (df with open/close)
+    - 'close':    (prices[e+1] - prices[e]) / prices[e]   (close series)
+    """
+    if price_mode == 'intraday':
+        open_arr = np.asarray(prices['open'], dtype=np.float64)
+        close_arr = np.asarray(prices['close'], dtype=np.float64)
+        step = (close_arr[1:] - open_arr[1:]) / open_arr[1:]
+    else:
+        price_arr = np.asarray(prices, dtype=np.float64)
+        step = (price_arr[1:] - price_arr[:-1]) / price_arr[:-1]
+    return np.append(step, np.nan)
+
+
+class PatternIndex:
+    """
+    Occurrence index for one asset at one threshold.
+
+    future_returns(pattern) returns the same list the engines' get_pattern_stats
+    scans produce (same values, same chronological order); counts(pattern)
+    returns the aggregated N+1 statistics without touching the returns.
+    """
+    def __init__(self, mode='window', max_len=MAX_INDEX_LEN):
+        if mode not in ('window', 'streak'):
+            raise ValueError(f"Unknown index mode: {mode}")
+        self.mode = mode
+        self.max_len = max_len
+        self.n_bars = 0
+        self.signals = np.empty(0, dtype=np.int8)
+        self.next_returns = np.empty(0, dtype=np.float64)
+        self.regimes = None
+        self.times = None     # int64 bar timestamps (persisted indexes only)
+        self.threshold = None # fixed threshold the signals were encoded with
+        self.price_mode = None
+        self.ends = {}    # key -> int64 array of end positions (ascending)
+        self.stats = {}   # key -> float64 array (3 regimes x 4 stat columns)
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(cls, signals, next_returns, mode='window', regimes=None, max_len=MAX_INDEX_LEN):
+        """Build the index from pre-encoded signals and per-bar N+1 returns."""
+        index = cls(mode, max_len)
+        index.signals = np.asarray(signals, dtype=np.int8)
+        index.next_returns = np.asarray(next_returns, dtype=np.float64)
+        index.regimes = None if regimes is None else np.asarray(regimes, dtype=np.int8)
+        index.n_bars = len(index.signals)
+        index._add_ends(0, index.n_bars - 2)
+        return index
+
+    @classmethod
+    def from_frame(cls, df, pct_change, effective_std, mode='window', price_mode='intraday',
+                   sma50=None, multiplier=1.0, max_len=MAX_INDEX_LEN):
+        """
+        Build straight from the engine inputs.
+        price_mode='intraday' expects df with open/close, 'close' expects a close series.
+        sma50 enables the regime-aware counts used by the Trend engine.
+        """
+        signals = encode_signals(pct_change, effective_std, multiplier)
+        next_returns = next_bar_returns(df, price_mode)
+        regimes = None
+        if sma50 is not None:
+            close = df['close'] if price_mode == 'intraday' else df
+            regimes = regime_codes(close, sma50)
+        return cls.build(signals, next_returns, mode, regimes, max_len)
+
+    def sync(self, signals, next_returns, regimes=None, times=None):
+        """
+        Bring a loaded index up to date with the current bars.
+        
+        The stored bars must be an unchanged contiguous run of the new series
+        (same timestamps, signals, N+1 returns and regimes); head bars dropped
+        by the cache trim are un-counted, appended bars are counted.
+        Returns True if the index could be synced, False if a rebuild is needed.
+        """
+        signals = np.asarray(signals, dtype=np.int8)
+        next_returns = np.asarray(next_returns, dtype=np.float64)
+        if regimes is not None:
+            regimes = np.asarray(regimes, dtype=np.int8)
+        if times is None or self.times is None or len(self.times) == 0 or len(times) == 0:
+            return False
+        if (regimes is None) != (self.regimes is None):
+            return False
+        
+        # Locate the first current bar inside the stored run (head trim offset)
+        head = int(np.searchsorted(self.times, times[0]))
+        if head >= self.n_bars or self.times[head] != times[0]:
+            return False
+        overlap = self.n_bars - head
+        if len(times) < overlap or overlap <= WARMUP_BARS:
+            return False
+        
+        # Stored bars must be unchanged (revised bars invalidate their counts)
+        if not np.array_equal(self.times[head:], times[:overlap]):
+            return False
+        if not np.array_equal(self.signals[head:], signals[:overlap]):
+            return False
+        if not np.array_equal(self.next_returns[head:-1], next_returns[:overlap - 1], equal_nan=True):
+            return False
+        # Regimes only matter on eligible ends (SMA restarts at the new head)
+        if regimes is not None and not np.array_equal(self.regimes[head + WARMUP_BARS:], regimes[WARMUP_BARS:overlap]):
+            return False
+        
+        if head:
+            self._trim_head(head)
+        
+        self.signals = signals
+        self.next_returns = next_returns
+        self.regimes = regimes
+        self.times = np.asarray(times, dtype=np.int64)
+        self.n_bars = len(signals)
+        
+        # Last old bar just gained its N+1 bar; appended bars are new ends
+        self._add_ends(overlap - 1, self.n_bars - 2)
+        return True
+
+    def _trim_head(self, head):
+        """Drop the first `head` bars: un-count occurrences that fall inside the new warmup and shift positions."""
+        min_start = WARMUP_BARS + head
+        for key in list(self.ends):
+            ends = self.ends[key]
+            length = int(key).bit_length() - 1
+            starts = ends - (length - 1) if self.mode == 'streak' else ends
+            cut = int(np.searchsorted(starts, min_start))
+            if cut:
+                removed = ends[:cut]
+                rets = self.next_returns[removed]
+                regimes = self.regimes[removed] if self.regimes is not None else np.zeros(cut, dtype=np.int8)
+                delta = np.zeros((3, 4), dtype=np.float64)
+                np.add.at(delta[:, STAT_UP], regimes, rets > 0)
+                np.add.at(delta[:, STAT_DOWN], regimes, rets < 0)
+                np.add.at(delta[:, STAT_FLAT], regimes, rets == 0)
+                np.add.at(delta[:, STAT_RET_SUM], regimes, rets)
+                self.stats[key] = self.stats[key] - delta
+            if cut == len(ends):
+                del self.ends[key]
+                del self.stats[key]
+            else:
+                self.ends[key] = ends[cut:] - head
+
+    def _add_ends(self, first_end, last_end):
+        """Index every eligible pattern ending in [first_end, last_end]."""
+        first_end = max(first_end, WARMUP_BARS)
+        if last_end < first_end:
+            return
+
+        ends = np.arange(first_end, last_end + 1, dtype=np.int64)
+        bits = np.zeros(len(ends), dtype=np.int64)
+        valid = np.ones(len(ends), dtype=bool)
+
+        key_parts = []
+        end_parts = []
+        for length in range(1, self.max_len + 1):
+            if self.mode == 'streak' and length > MAX_STREAK_SUBPATTERN:
+                break
+            # Extend every window one char into the past (older = more significant)
+            pos = ends - (length - 1)
+            in_range = pos >= 0
+            codes = self.signals[np.where(in_range, pos, 0)]
+            valid &= in_range & (codes != SIGNAL_NEUTRAL)
+            bits |= (codes == SIGNAL_UP).astype(np.int64) << (length - 1)
+
+            eligible = valid
+            if self.mode == 'streak':
+                eligible = valid & (pos >= WARMUP_BARS)
+            if not eligible.any():
+                if not valid.any():
+                    break
+                continue
+            key_parts.append(bits[eligible] | (1 << length))
+            end_parts.append(ends[eligible])
+
+        if not key_parts:
+            return
+
+        keys = np.concatenate(key_parts)
+        all_ends = np.concatenate(end_parts)
+
+        # Group by key; stable sort keeps each key's ends in chronological order
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        all_ends = all_ends[order]
+        unique_keys, starts = np.unique(keys, return_index=True)
+
+        # N+1 outcome and regime of every occurrence
+        rets = self.next_returns[all_ends]
+        regimes = self.regimes[all_ends] if self.regimes is not None else np.zeros(len(all_ends), dtype=np.int8)
+        group = np.repeat(np.arange(len(unique_keys)), np.diff(np.append(starts, len(keys))))
+        cell = group * 3 + regimes
+        size = len(unique_keys) * 3
+        new_stats = np.zeros((size, 4), dtype=np.float64)
+        new_stats[:, STAT_UP] = np.bincount(cell, weights=rets > 0, minlength=size)
+        new_stats[:, STAT_DOWN] = np.bincount(cell, weights=rets < 0, minlength=size)
+        new_stats[:, STAT_FLAT] = np.bincount(cell, weights=rets == 0, minlength=size)
+        new_stats[:, STAT_RET_SUM] = np.bincount(cell, weights=rets, minlength=size)
+        new_stats = new_stats.reshape(len(unique_keys), 3, 4)
+
+        for i, (key, ends_of_key) in enumerate(zip(unique_keys.tolist(), np.split(all_ends, starts[1:]))):
+            if key in self.ends:
+                self.ends[key] = np.concatenate([self.ends[key], ends_of_key])
+                self.stats[key] = self.stats[key] + new_stats[i]
+            else:
+                self.ends[key] = ends_of_key
+                self.stats[key] = new_stats[i]
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self, path):
+        """Write the index atomically (tmp file + rename) as a .npz archive."""
+        keys = np.array(sorted(self.ends), dtype=np.int64)
+        lengths = np.array([len(self.ends[k]) for k in keys.tolist()], dtype=np.int64)
+        ends_flat = np.concatenate([self.ends[k] for k in keys.tolist()]) if len(keys) else _EMPTY_ENDS
+        stats = np.stack([self.stats[k] for k in keys.tolist()]) if len(keys) else np.zeros((0, 3, 4))
+        
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"  # Per-process tmp: workers may share a cache file
+        np.savez(
+            tmp_path,
+            meta=np.array([self.mode, str(self.max_len), str(self.price_mode), repr(self.threshold)]),
+            signals=self.signals,
+            next_returns=self.next_returns,
+            regimes=self.regimes if self.regimes is not None else np.empty(0, dtype=np.int8),
+            has_regimes=np.array(self.regimes is not None),
+            times=self.times if self.times is not None else _EMPTY_ENDS,
+            keys=keys,
+            lengths=lengths,
+            ends=ends_flat,
+            stats=stats
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index. Returns None if missing or unreadable."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                mode, max_len, price_mode, threshold = data['meta'].tolist()
+                index = cls(mode, int(max_len))
+                index.price_mode = price_mode
+                index.threshold = float(threshold) if threshold != 'None' else None
+                index.signals = data['signals']
+                index.next_returns = data['next_returns']
+                index.regimes = data['regimes'] if bool(data['has_regimes']) else None
+                index.times = data['times']
+                index.n_bars = len(index.signals)
+                keys = data['keys'].tolist()
+                stats = data['stats']
+                for i, ends_of_key in enumerate(np.split(data['ends'], np.cumsum(data['lengths'])[:-1])):
+                    index.ends[keys[i]] = ends_of_key
+                    index.stats[keys[i]] = stats[i]
+            return index
+        except Exception:
+            return None
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def covers(self, pattern_str):
+        """True if the pattern length is within the indexed range."""
+        return 0 < len(pattern_str) <= self.max_len
+
+    def _allowed_regimes(self, current_trend):
+        if current_trend is None or self.regimes is None:
+            return [REGIME_UNKNOWN, REGIME_BULL, REGIME_BEAR]
+        return [REGIME_UNKNOWN, REGIME_BULL if current_trend == "BULL" else REGIME_BEAR]
+
+    def match_ends(self, pattern_str, current_trend=None):
+        """End positions of every eligible occurrence (chronological)."""
+        ends = self.ends.get(pattern_key(pattern_str), _EMPTY_ENDS)
+        if current_trend is not None and self.regimes is not None and len(ends):
+            excluded = REGIME_BEAR if current_trend == "BULL" else REGIME_BULL
+            ends = ends[self.regimes[ends] != excluded]
+        return ends
+
+    def future_returns(self, pattern_str, current_trend=None):
+        """N+1 returns of every occurrence — same list the history scans return."""
+        return list(self.next_returns[self.match_ends(pattern_str, current_trend)])
+
+    def counts(self, pattern_str, current_trend=None):
+        """Aggregated N+1 statistics for a pattern (regime-filtered if current_trend given)."""
+        stats = self.stats.get(pattern_key(pattern_str))
+        if stats is None:
+            return {'up': 0, 'down': 0, 'flat': 0, 'total': 0, 'ret_sum': 0.0}
+        row = stats[self._allowed_regimes(current_trend)].sum(axis=0)
+        up, down, flat = int(row[STAT_UP]), int(row[STAT_DOWN]), int(row[STAT_FLAT])
+        return {
+            'up': up,
+            'down': down,
+            'flat': flat,
+            'total': up + down + flat,
+            'ret_sum': float(row[STAT_RET_SUM])
+        }
+
+
+class PointInTimeIndex:
+    """
+    Prefix view of a full-history PatternIndex for point-in-time replay.
+
+    On df.iloc[:t + 1] the engines only see occurrences that end at or before
+    t - 1 (they need their N+1 bar), and those are exactly the first
+    occurrences of the full index: signals, N+1 returns and regimes are all
+    causal. Each pattern's returns are laid out once with cumulative up/down
+    counts, so a lookup at bar t is one searchsorted + a slice.
+
+    Patterns longer than the index (window mode) are matched from the
+    occurrences of their suffix one char shorter, same as the engines' scan.
+    """
+    def __init__(self, index):
+        self.index = index
+        self._occurrences = {}   # (key, trend) -> (ends, returns, cum_up, cum_down)
+
+    def _lookup(self, pattern_str, current_trend):
+        trend = current_trend if self.index.regimes is not None else None
+        cache_key = (pattern_key(pattern_str), trend)
+        entry = self._occurrences.get(cache_key)
+        if entry is None:
+            if len(pattern_str) > self.index.max_len:
+                ends = self._long_pattern_ends(pattern_str, trend)
+            else:
+                ends = self.index.match_ends(pattern_str, trend)
+            rets = self.index.next_returns[ends]
+            entry = (ends, rets, np.cumsum(rets > 0), np.cumsum(rets < 0))
+            self._occurrences[cache_key] = entry
+        return entry
+
+    def _long_pattern_ends(self, pattern_str, current_trend):
+        """Ends of a pattern longer than max_len (window mode only; streak scans stop at 7)."""
+        if self.index.mode != 'window':
+            return _EMPTY_ENDS
+        # Occurrences of the pattern minus its oldest char, whose preceding bar matches that char
+        ends = self._lookup(pattern_str[1:], current_trend)[0]
+        first = ends - (len(pattern_str) - 1)
+        ends = ends[first >= 0]
+        first = first[first >= 0]
+        return ends[self.index.signals[first] == (SIGNAL_UP if pattern_str[0] == '+' else SIGNAL_DOWN)]
+
+    def counts_at(self, pattern_str, bar, current_trend=None):
+        """
+        (up, down, returns) of the occurrences visible at bar position `bar`,
+        returns in chronological order; None if the pattern has not occurred yet.
+        """
+        ends, rets, cum_up, cum_down = self._lookup(pattern_str, current_trend)
+        visible = int(np.searchsorted(ends, bar - 1, side='right'))
+        if not visible:
+            return None
+        return int(cum_up[visible - 1]), int(cum_down[visible - 1]), rets[:visible]
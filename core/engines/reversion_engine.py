@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
 import math
-from .base_engine import BasePatternEngine
+from .base_engine import BasePatternEngine, active_pattern_starts, pattern_at
 
 class MeanReversionEngine(BasePatternEngine):
     """
@@ -12,6 +12,9 @@ class MeanReversionEngine(BasePatternEngine):
     - Direction = FADE (bet against the anomaly move)
     - Strict Gatekeeper at the end ensures quality
     """
+    INDEX_MODE = 'window'
+    INDEX_PRICE_MODE = 'intraday'
+
     def analyze(self, df, symbol, settings):
         if df is None or len(df) < 50:
             return []
@@ -22,49 +25,50 @@ class MeanReversionEngine(BasePatternEngine):
         
         # STRICT INTRADAY LOGIC
         pct_change = ((close - open_price) / open_price)
-        exchange = settings.get('exchange', '').upper()
-        
-        # Market Detection
-        is_thai = any(ex in exchange for ex in ['SET', 'MAI', 'TH'])
-        is_china = any(ex in exchange for ex in ['HKEX', 'SHSE', 'SZSE', 'CHINA'])
         
         # 2. THRESHOLD LOGIC
-        fixed_thresh = settings.get('fixed_threshold')
-        if fixed_thresh is not None:
-            # V5.2: Support Fixed Threshold from config
-            fixed_val = float(fixed_thresh) / 100.0
-            effective_std = pd.Series(fixed_val, index=pct_change.index)
-        else:
-            # V5.3: Prioritize min_threshold from config, fallback to market-specific defaults
-            min_floor = settings.get('min_threshold', 0.01 if is_thai else 0.005)
-            effective_std = self.calculate_dynamic_threshold(pct_change, min_floor)
+        effective_std, fixed_val = self._threshold(pct_change, settings)
             
         current_std = effective_std.iloc[-1]
         
         if abs(pct_change.iloc[-1]) < current_std:
             return []
             
+        # Encode the signal series once (shared by all suffix scans)
+        signals = self.encode_signals(pct_change, effective_std)
+        
         # =====================================================
         # Rule 2: Dynamic Lookback — Get Active Pattern
         # =====================================================
-        active_pattern = self.get_active_pattern(pct_change, effective_std)
+        active_pattern = self.get_active_pattern(pct_change, effective_std, signals=signals)
         if not active_pattern:
             return []
+        
+        # One-pass occurrence index: every suffix lookup below is a dict hit
+        # (incremental + persisted next to the cache when the threshold is fixed)
+        index = self.build_pattern_index(
+            df, pct_change, effective_std, signals=signals,
+            index_path=settings.get('pattern_index_path'), fixed_threshold=fixed_val
+        )
  
         # =====================================================
         # V4.4: AGGREGATE VOTING (Winner-Takes-All)
         # =====================================================
         min_matches = settings.get('min_matches', 30)
-        vote_result = self.aggregate_voting(df, pct_change, effective_std, active_pattern, min_count=min_matches)
+        vote_result = self.aggregate_voting(df, pct_change, effective_std, active_pattern, min_count=min_matches, signals=signals, index=index)
         
         if not vote_result:
             return []
  
+        return [self._result(active_pattern, vote_result, min_matches, current_std, pct_change.iloc[-1])]
+
+    def _result(self, active_pattern, vote_result, min_matches, current_std, change):
+        """Result row for one forecast (shared by analyze and replay)."""
         # 4. QUALITY FLAG
         stats_mock = {'win_rate': vote_result['prob'], 'total': vote_result['total_events']}
         is_tradeable = self.check_trustworthy(stats_mock, 60.0, min_matches)
  
-        results = [{
+        return {
             'engine': 'MEAN_REVERSION',
             'pattern': active_pattern,
             'forecast': vote_result['forecast'],
@@ -78,60 +82,129 @@ class MeanReversionEngine(BasePatternEngine):
             'is_reversal': True,
             'is_tradeable': is_tradeable,
             'threshold': round(current_std * 100, 2),
-            'change_pct': round(pct_change.iloc[-1] * 100, 2),
+            'change_pct': round(change * 100, 2),
             'rr': 1.0
-        }]
+        }
+
+    def _threshold(self, pct_change, settings):
+        """THRESHOLD LOGIC → (effective_std series, fixed threshold fraction or None)"""
+        exchange = settings.get('exchange', '').upper()
+        
+        # Market Detection
+        is_thai = any(ex in exchange for ex in ['SET', 'MAI', 'TH'])
+        
+        fixed_thresh = settings.get('fixed_threshold')
+        if fixed_thresh is not None:
+            # V5.2: Support Fixed Threshold from config
+            fixed_val = float(fixed_thresh) / 100.0
+            return pd.Series(fixed_val, index=pct_change.index), fixed_val
+        # V5.3: Prioritize min_threshold from config, fallback to market-specific defaults
+        min_floor = settings.get('min_threshold', 0.01 if is_thai else 0.005)
+        return self.calculate_dynamic_threshold(pct_change, min_floor, settings.get('indicators')), None
+
+    def replay(self, df, symbol, settings, start=0):
+        """
+        Point-in-time replay: yields (t, results) for every bar t >= start, where
+        results is exactly what analyze() returns on df.iloc[:t + 1].
+        
+        Every input is causal (intraday returns, rolling SD thresholds, signals),
+        so it is computed once on the full frame; the pattern index is built once
+        and read through a PointInTimeIndex → O(n) instead of n analyze() runs.
+        """
+        from .pattern_index import PointInTimeIndex
+        
+        if df is None:
+            return
+        pct_change = ((df['close'] - df['open']) / df['open'])
+        effective_std, _ = self._threshold(pct_change, settings)
+        signals = self.encode_signals(pct_change, effective_std)
+        replay_index = PointInTimeIndex(self.build_pattern_index(df, pct_change, effective_std, signals=signals))
         
+        pct_arr = pct_change.to_numpy(dtype=np.float64)
+        std_arr = np.asarray(effective_std, dtype=np.float64)
+        starts = active_pattern_starts(signals, pct_change, effective_std)
+        min_matches = settings.get('min_matches', 30)
+        
+        for t in range(max(start, 49), len(df)):
+            # No active pattern ⇔ analyze() stops at the threshold / pattern checks
+            active_pattern = pattern_at(signals, starts[t], t)
+            if not active_pattern:
+                yield t, []
+                continue
+            vote_result = self.replay_voting(active_pattern, t, replay_index, min_count=min_matches)
+            if not vote_result:
+                yield t, []
+                continue
+            yield t, [self._result(active_pattern, vote_result, min_matches, std_arr[t], pct_arr[t])]
+
+    def analyze_group(self, frames, settings):
+        """
+        Cross-sectional analyze(): every frame of an asset group (same settings)
+        in one (symbols × bars) matrix. Returns [analyze(df) results] per frame.
+
+        Fixed thresholds only (the 0.5% groups); dynamic SD thresholds go
+        through analyze() one frame at a time.
+        """
+        from .group_matrix import align_frames, active_patterns, window_suffix_stats
+
+        fixed_thresh = settings.get('fixed_threshold')
+        if fixed_thresh is None:
+            return [self.analyze(df, None, settings) for df in frames]
+        fixed_val = float(fixed_thresh) / 100.0
+        min_matches = settings.get('min_matches', 30)
+
+        results = [[] for _ in frames]
+        rows = [i for i, df in enumerate(frames) if df is not None and len(df) >= 50]
+        if not rows:
+            return results
+
+        # STRICT INTRADAY LOGIC on the whole group at once
+        prices, first_col = align_frames([frames[i] for i in rows])
+        open_m, close_m = prices['open'], prices['close']
+        pct_change = (close_m - open_m) / open_m
+        effective_std = np.full(pct_change.shape, fixed_val)
+
+        # Today's gate: |last move| < threshold → no signal
+        live = ~(np.abs(pct_change[:, -1]) < fixed_val)
+        if not live.any():
+            return results
+        rows = [row for row, keep in zip(rows, live) if keep]
+        pct_change, effective_std = pct_change[live], effective_std[live]
+        open_m, close_m, first_col = open_m[live], close_m[live], first_col[live]
+
+        signals = self.encode_signals(pct_change, effective_std)
+        patterns = active_patterns(signals, pct_change, effective_std)
+
+        # N+1 intraday return of every bar (last column has none)
+        next_returns = np.full(pct_change.shape, np.nan)
+        next_returns[:, :-1] = pct_change[:, 1:]
+        suffix_stats = window_suffix_stats(signals, next_returns, first_col, patterns)
+
+        for i, row in enumerate(rows):
+            if not patterns[i]:
+                continue
+            vote_result = self.vote(patterns[i], suffix_stats[i], min_matches)
+            if vote_result:
+                results[row] = [self._result(patterns[i], vote_result, min_matches, fixed_val, pct_change[i, -1])]
         return results
 
-    def get_pattern_stats(self, df, pct_change, effective_std, pattern_str, length, **kwargs):
+    def get_pattern_stats(self, df, pct_change, effective_std, pattern_str, length, signals=None, index=None, **kwargs):
         """
         V4.3/V4.4: Standardized Intraday History Scan for Mean Reversion.
         Calculates Profit based on (NextClose - NextOpen)/NextOpen
         """
-        n = len(pct_change)
-        future_returns = []
+        # Pattern index hit (lengths 1-8); longer suffixes fall through to the scan
+        if index is not None and index.covers(pattern_str):
+            return index.future_returns(pattern_str)
         
-        # Prepare arrays
-        pct_arr = pct_change.values
-        thresh_arr = effective_std.values
-        open_arr = df['open'].values
-        close_arr = df['close'].values
-        
-        # Step 1: Build full signal series
-        signals = []
-        for i in range(n):
-            ret = pct_arr[i]
-            thresh = thresh_arr[i]
-            
-            if np.isnan(ret) or np.isnan(thresh):
-                signals.append('.')
-            elif ret > thresh:
-                signals.append('+')
-            elif ret < -thresh:
-                signals.append('-')
-            else:
-                signals.append('.')  # Neutral
+        # Step 1: Encoded signal series (reuse caller's encoding when given)
+        if signals is None:
+            signals = self.encode_signals(pct_change, effective_std)
         
-        # Step 2: Scan streaks
-        start_idx = 252 # Use standard warmup
-        target_len = len(pattern_str)
+        # Step 2: Sliding window scan (window end after standard warmup)
+        match_ends = self.match_pattern_ends(signals, pattern_str)
         
-        for i in range(start_idx, n - 1): # -1 for next day
-             if i - target_len + 1 < 0: continue
-             
-             window_sigs = signals[i-target_len+1 : i+1]
-             if '.' in window_sigs:
-                 continue
-                  
-             current_pat = "".join(window_sigs)
-             
-             if current_pat == pattern_str:
-                  # MATCH FOUND
-                  # Calculate N+1 Intraday Return
-                  next_o = open_arr[i+1]
-                  next_c = close_arr[i+1]
-                  next_ret = (next_c - next_o) / next_o
-                  future_returns.append(next_ret)
-                  
-        return future_returns
+        # N+1 Intraday Return for every match
+        next_o = df['open'].values[match_ends + 1]
+        next_c = df['close'].values[match_ends + 1]
+        return list((next_c - next_o) / next_o)
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from .base_engine import BasePatternEngine
+from .base_engine import BasePatternEngine, active_pattern_starts, pattern_at
 
 
 def calculate_adx(high, low, close, period=14):
@@ -44,6 +44,9 @@ class TrendMomentumEngine(BasePatternEngine):
     - Regime Context: Historical stats only compare same-trend events
     - Strict Gatekeeper at the end ensures quality
     """
+    INDEX_MODE = 'streak'
+    INDEX_PRICE_MODE = 'intraday'
+
     def analyze(self, df, symbol, settings):
         if df is None or len(df) < 50:
             return []
@@ -61,52 +64,61 @@ class TrendMomentumEngine(BasePatternEngine):
         is_us = any(ex in exchange for ex in ['NASDAQ', 'NYSE', 'US', 'CME', 'COMEX', 'NYMEX'])
         is_tw = any(ex in exchange for ex in ['TWSE', 'TW'])
         
+        # Shared indicator store (None → compute from the frame)
+        indicators = settings.get('indicators')
+        
         # 1. ADX FILTER
-        adx = calculate_adx(high, low, close)
+        adx = indicators.adx(14) if indicators is not None else calculate_adx(high, low, close)
         current_adx = adx.iloc[-1]
         if (is_us or is_tw) and current_adx < 20:
             return []
 
         # 2. TREND CONTEXT
-        sma50 = close.rolling(50).mean()
+        sma50 = indicators.sma(50) if indicators is not None else close.rolling(50).mean()
         current_trend = "BULL" if close.iloc[-1] > sma50.iloc[-1] else "BEAR"
         
         # 3. THRESHOLD LOGIC
-        fixed_thresh = settings.get('fixed_threshold')
-        if fixed_thresh is not None:
-            # V5.2: Support Fixed Threshold from config
-            fixed_val = float(fixed_thresh) / 100.0
-            effective_std = pd.Series(fixed_val, index=pct_change.index)
-        else:
-            # V5.3: Prioritize min_threshold from config, fallback to market-specific defaults
-            min_floor = settings.get('min_threshold', 0.006 if is_us else 0.005)
-            effective_std = self.calculate_dynamic_threshold(pct_change, min_floor)
+        effective_std, fixed_val = self._threshold(pct_change, settings)
             
         current_std = effective_std.iloc[-1]
         
         if abs(pct_change.iloc[-1]) < current_std:
             return []
             
-        active_pattern = self.get_active_pattern(pct_change, effective_std)
+        # Encode the signal series once (shared by all suffix scans)
+        signals = self.encode_signals(pct_change, effective_std)
+            
+        active_pattern = self.get_active_pattern(pct_change, effective_std, signals=signals)
         if not active_pattern:
             return []
 
+        # One-pass occurrence index with regime-tagged occurrences
+        # (incremental + persisted next to the cache when the threshold is fixed)
+        index = self.build_pattern_index(
+            df, pct_change, effective_std, signals=signals, sma50=sma50,
+            index_path=settings.get('pattern_index_path'), fixed_threshold=fixed_val
+        )
+
         # =====================================================
         # V4.4: AGGREGATE VOTING (Winner-Takes-All)
         # =====================================================
         vote_result = self.aggregate_voting(
             df, pct_change, effective_std, active_pattern, min_count=30,
-            sma50=sma50, current_trend=current_trend
+            signals=signals, index=index, sma50=sma50, current_trend=current_trend
         )
         
         if not vote_result:
             return []
 
+        return [self._result(active_pattern, vote_result, current_adx, current_std)]
+
+    def _result(self, active_pattern, vote_result, current_adx, current_std):
+        """Result row for one forecast (shared by analyze and replay)."""
         # Quality Flag
         stats_mock = {'win_rate': vote_result['prob'], 'total': vote_result['total_events']}
         is_tradeable = self.check_trustworthy(stats_mock, 60.0, 15)
 
-        results = [{
+        return {
             'engine': 'TREND_MOMENTUM',
             'pattern': active_pattern,
             'forecast': vote_result['forecast'],
@@ -123,82 +135,101 @@ class TrendMomentumEngine(BasePatternEngine):
             'threshold': round(current_std * 100, 2),
             'vol_target_size': None,
             'rr': 1.0
-        }]
-            
-        return results
+        }
+
+    def _threshold(self, pct_change, settings):
+        """THRESHOLD LOGIC → (effective_std series, fixed threshold fraction or None)"""
+        is_us = any(ex in settings.get('exchange', '').upper() for ex in ['NASDAQ', 'NYSE', 'US', 'CME', 'COMEX', 'NYMEX'])
+        
+        fixed_thresh = settings.get('fixed_threshold')
+        if fixed_thresh is not None:
+            # V5.2: Support Fixed Threshold from config
+            fixed_val = float(fixed_thresh) / 100.0
+            return pd.Series(fixed_val, index=pct_change.index), fixed_val
+        # V5.3: Prioritize min_threshold from config, fallback to market-specific defaults
+        min_floor = settings.get('min_threshold', 0.006 if is_us else 0.005)
+        return self.calculate_dynamic_threshold(pct_change, min_floor, settings.get('indicators')), None
+
+    def replay(self, df, symbol, settings, start=0):
+        """
+        Point-in-time replay: yields (t, results) for every bar t >= start, where
+        results is exactly what analyze() returns on df.iloc[:t + 1].
+        
+        ADX, SMA50, thresholds and signals are causal → computed once on the full
+        frame; the regime-tagged pattern index is built once and read through a
+        PointInTimeIndex → O(n) instead of n analyze() runs.
+        """
+        from .pattern_index import PointInTimeIndex
+        
+        if df is None:
+            return
+        close = df['close']
+        pct_change = ((close - df['open']) / df['open'])
+        exchange = settings.get('exchange', '').upper()
+        adx_gate = any(ex in exchange for ex in ['NASDAQ', 'NYSE', 'US', 'CME', 'COMEX', 'NYMEX', 'TWSE', 'TW'])
+        
+        indicators = settings.get('indicators')
+        adx = indicators.adx(14) if indicators is not None else calculate_adx(df['high'], df['low'], close)
+        sma50 = indicators.sma(50) if indicators is not None else close.rolling(50).mean()
+        effective_std, _ = self._threshold(pct_change, settings)
+        signals = self.encode_signals(pct_change, effective_std)
+        replay_index = PointInTimeIndex(self.build_pattern_index(df, pct_change, effective_std, signals=signals, sma50=sma50))
+        
+        adx_arr = np.asarray(adx, dtype=np.float64)
+        bull = close.to_numpy(dtype=np.float64) > np.asarray(sma50, dtype=np.float64)
+        std_arr = np.asarray(effective_std, dtype=np.float64)
+        starts = active_pattern_starts(signals, pct_change, effective_std)
+        
+        for t in range(max(start, 49), len(df)):
+            # 1. ADX FILTER
+            if adx_gate and adx_arr[t] < 20:
+                yield t, []
+                continue
+            # No active pattern ⇔ analyze() stops at the threshold / pattern checks
+            active_pattern = pattern_at(signals, starts[t], t)
+            if not active_pattern:
+                yield t, []
+                continue
+            current_trend = "BULL" if bull[t] else "BEAR"
+            vote_result = self.replay_voting(active_pattern, t, replay_index, min_count=30, current_trend=current_trend)
+            if not vote_result:
+                yield t, []
+                continue
+            yield t, [self._result(active_pattern, vote_result, adx_arr[t], std_arr[t])]
 
-    def get_pattern_stats(self, df, pct_change, effective_std, pattern_str, length, sma50, current_trend):
+    def get_pattern_stats(self, df, pct_change, effective_std, pattern_str, length, sma50, current_trend, signals=None, index=None):
         """
         Regime-Aware History Scan (Mode A: Overlapping Sliding Window).
         
         Uses streak-based scanning consistent with Core Logic 1:
-        1. Build signal series: '+', '-', '.' for every bar
+        1. Encode signal series: '+', '-', '.' for every bar (shared int8 codes)
         2. Find continuous streaks (broken only by '.')
         3. Enumerate all sub-patterns within each streak
         4. Only count matches in the SAME trend context (BULL/BEAR)
         
         This ensures "Apples to Apples" comparison with proper streak detection.
         """
-        n = len(pct_change)
-        future_returns = []
+        # Pattern index hit (occurrences tagged with their BULL/BEAR regime)
+        if index is not None and index.covers(pattern_str):
+            return index.future_returns(pattern_str, current_trend)
+        
+        # Step 1: Encoded signal series (reuse caller's encoding when given)
+        if signals is None:
+            signals = self.encode_signals(pct_change, effective_std)
+        
+        # Steps 2-3: Streak sub-pattern matches (start after warmup, len <= 7)
+        match_ends = self.match_pattern_ends(signals, pattern_str, streak_scan=True)
         
-        pct_arr = pct_change.values
-        eff_std_arr = effective_std.values
         open_arr = df['open'].values
         close_arr = df['close'].values
         
-        # Step 1: Build full signal series
-        signals = []
-        for i in range(n):
-            ret = pct_arr[i]
-            thresh = eff_std_arr[i]
-            
-            if pd.isna(ret) or pd.isna(thresh):
-                signals.append('.')
-            elif ret > thresh:
-                signals.append('+')
-            elif ret < -thresh:
-                signals.append('-')
-            else:
-                signals.append('.')  # Neutral
-        
-        # Step 2: Scan streaks (continuous non-neutral runs)
-        i = 252  # Start after warmup
-        while i < n - 1:  # -1 because we need N+1 return
-            if signals[i] == '.':
-                i += 1
-                continue
-            
-            # Find streak boundaries
-            streak_start = i
-            while i < n and signals[i] != '.':
-                i += 1
-            streak_end = i
-            
-            streak_chars = signals[streak_start:streak_end]
-            streak_len = len(streak_chars)
-            
-            # Step 3: Enumerate all sub-patterns (overlapping, step=1)
-            for start_pos in range(streak_len):
-                for end_pos in range(start_pos + 1, min(start_pos + 8, streak_len + 1)):
-                    sub = ''.join(streak_chars[start_pos:end_pos])
-                    
-                    # Check if this sub-pattern matches our target
-                    if sub == pattern_str:
-                        # The absolute index of the last char of this sub-pattern
-                        abs_idx = streak_start + end_pos - 1
-                        
-                        # Regime filter: only count if same trend context
-                        if not pd.isna(sma50.iloc[abs_idx]):
-                            hist_trend = "BULL" if close_arr[abs_idx] > sma50.iloc[abs_idx] else "BEAR"
-                            if hist_trend != current_trend:
-                                continue
-                        
-                        # Step 4: Record N+1 Intraday Return
-                        if abs_idx + 1 < n:
-                            next_o = open_arr[abs_idx + 1]
-                            next_c = close_arr[abs_idx + 1]
-                            next_ret = (next_c - next_o) / next_o
-                            future_returns.append(next_ret)
-        
-        return future_returns
+        # Regime filter: only count if same trend context (unknown SMA always counts)
+        sma_arr = np.asarray(sma50, dtype=np.float64)[match_ends]
+        is_bull = close_arr[match_ends] > sma_arr
+        same_regime = np.isnan(sma_arr) | (is_bull == (current_trend == "BULL"))
+        match_ends = match_ends[same_regime]
+        
+        # Step 4: Record N+1 Intraday Return
+        next_o = open_arr[match_ends + 1]
+        next_c = close_arr[match_ends + 1]
+        return list((next_c - next_o) / next_o)
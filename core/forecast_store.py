@@ -0,0 +1,218 @@
+"""
+core/forecast_store.py - Forecast Store (SQLite)
+================================================
+ที่เก็บ forecast ของ performance log แบบไม่ต้อง rewrite ทั้งไฟล์
+
+- logs/performance_log.db (sqlite3, stdlib) เป็นที่เก็บหลัก
+- UNIQUE index บน (scan_date, symbol, pattern, forecast, target_date)
+  → dedup ด้วย INSERT OR IGNORE (ไม่ต้อง merge ใน pandas)
+- verification = UPDATE ตาม rowid (in-place)
+- logs/performance_log.csv ยังคงอยู่สำหรับ report scripts:
+  forecast ใหม่ถูก append ท้ายไฟล์, หลัง verify export ทั้งไฟล์ 1 ครั้ง
+- ถ้า CSV ถูกแก้จากภายนอก (backfill / cleanup scripts) store จะ re-import ให้เอง
+  (เทียบ size + mtime_ns ที่บันทึกไว้ตอน export ล่าสุด)
+"""
+import os
+import sqlite3
+import pandas as pd
+
+KEY_COLUMNS = ['scan_date', 'symbol', 'pattern', 'forecast', 'target_date']
+TABLE = 'forecasts'
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _to_records(df, columns):
+    """DataFrame → list of tuples (NaN → None) ตามลำดับ columns"""
+    df = df.reindex(columns=columns).astype(object)
+    df = df.where(pd.notna(df), None)
+    for col in KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(lambda v: '' if v is None else str(v))
+    return list(df.itertuples(index=False, name=None))
+
+
+class ForecastStore:
+    """SQLite forecast store ที่ sync กับ CSV export"""
+
+    def __init__(self, db_path, csv_path, columns):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.default_columns = list(columns)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self._sync_from_csv()
+
+    # ------------------------------------------------------------------
+    # Schema
+    # ------------------------------------------------------------------
+    def columns(self):
+        rows = self.conn.execute(f"PRAGMA table_info({TABLE})").fetchall()
+        return [r[1] for r in rows]
+
+    def _create_table(self, columns):
+        """
+        สร้าง table ใหม่ตาม columns ที่ให้มา (header ของ CSV เดิม / default_columns ถ้ายังไม่มี CSV)
+        columns อื่นจะถูกเพิ่มผ่าน _ensure_columns เมื่อ record ที่ append มีจริงเท่านั้น
+        → export ครั้งแรกไม่เพิ่ม column ว่างลงใน CSV ที่ track ไว้
+        """
+        cols = list(columns)
+        for col in KEY_COLUMNS:
+            if col not in cols:
+                cols.append(col)
+        self.conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        self.conn.execute(f"CREATE TABLE {TABLE} ({', '.join(_quote(c) for c in cols)})")
+        key_sql = ', '.join(_quote(c) for c in KEY_COLUMNS)
+        self.conn.execute(f"CREATE UNIQUE INDEX idx_{TABLE}_key ON {TABLE} ({key_sql})")
+        if 'actual' in cols:
+            self.conn.execute(f"CREATE INDEX idx_{TABLE}_actual ON {TABLE} (actual, target_date)")
+        return cols
+
+    def _ensure_columns(self, columns):
+        existing = self.columns()
+        for col in columns:
+            if col not in existing:
+                self.conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(col)}")
+                existing.append(col)
+        return existing
+
+    # ------------------------------------------------------------------
+    # CSV sync
+    # ------------------------------------------------------------------
+    def _csv_stamp(self):
+        try:
+            st = os.stat(self.csv_path)
+        except OSError:
+            return None
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _mark_synced(self):
+        self._set_meta('csv_stamp', self._csv_stamp())
+        self.conn.commit()
+
+    def _sync_from_csv(self):
+        """Import CSV ถ้า store ยังไม่มี table หรือ CSV ถูกแก้จากภายนอก"""
+        stamp = self._csv_stamp()
+        has_table = bool(self.columns())
+        if has_table and (stamp is None or stamp == self._get_meta('csv_stamp')):
+            return
+
+        df = None
+        if stamp is not None:
+            try:
+                df = pd.read_csv(self.csv_path)
+            except pd.errors.EmptyDataError:
+                df = None
+
+        cols = self._create_table(list(df.columns) if df is not None else self.default_columns)
+        if df is not None and not df.empty:
+            placeholders = ', '.join('?' for _ in cols)
+            col_sql = ', '.join(_quote(c) for c in cols)
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO {TABLE} ({col_sql}) VALUES ({placeholders})",
+                _to_records(df, cols)
+            )
+        if stamp is None:
+            self.export_csv()
+        self._mark_synced()
+
+    def export_csv(self):
+        """เขียน CSV ทั้งไฟล์จาก store (atomic)"""
+        df = self.read_frame()
+        tmp_path = f"{self.csv_path}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.csv_path)
+        self._mark_synced()
+
+    # ------------------------------------------------------------------
+    # Read / Write
+    # ------------------------------------------------------------------
+    def read_frame(self, where=None, params=(), with_rowid=False):
+        """อ่าน forecasts เป็น DataFrame (key columns ว่าง → NaN เหมือน read_csv)"""
+        select = "rowid AS _rowid, *" if with_rowid else "*"
+        sql = f"SELECT {select} FROM {TABLE}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += " ORDER BY rowid"
+        df = pd.read_sql_query(sql, self.conn, params=params)
+        for col in KEY_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].replace('', None)
+        return df
+
+    def pending(self, up_to_date):
+        """PENDING forecasts ที่ target_date <= up_to_date (ใช้ index actual/target_date)"""
+        return self.read_frame("actual = 'PENDING' AND target_date <= ?", (up_to_date,), with_rowid=True)
+
+    def append(self, records):
+        """
+        Append forecasts (dedup ด้วย UNIQUE key) แล้ว append แถวที่เพิ่มจริงลงท้าย CSV
+
+        Returns:
+            int: จำนวน records ที่เพิ่มจริง
+        """
+        if not records:
+            return 0
+        df_new = pd.DataFrame(records)
+        cols = self._ensure_columns(list(df_new.columns))
+        col_sql = ', '.join(_quote(c) for c in df_new.columns)
+        placeholders = ', '.join('?' for _ in df_new.columns)
+        sql = f"INSERT OR IGNORE INTO {TABLE} ({col_sql}) VALUES ({placeholders})"
+
+        inserted = []
+        for pos, rec in enumerate(_to_records(df_new, list(df_new.columns))):
+            if self.conn.execute(sql, rec).rowcount:
+                inserted.append(pos)
+        self.conn.commit()
+
+        if inserted:
+            self._append_csv(df_new.iloc[inserted], cols)
+        return len(inserted)
+
+    def _append_csv(self, df_rows, cols):
+        """Append แถวใหม่ท้าย CSV ตาม header เดิม (header ไม่ตรงกับ store → export ทั้งไฟล์)"""
+        try:
+            header = list(pd.read_csv(self.csv_path, nrows=0).columns)
+        except (OSError, pd.errors.EmptyDataError):
+            header = None
+        if header != cols:
+            self.export_csv()
+            return
+        df_rows.reindex(columns=header).to_csv(self.csv_path, mode='a', header=False, index=False)
+        self._mark_synced()
+
+    def update_rows(self, updates, export=True):
+        """
+        In-place update ตาม rowid ใน transaction เดียว
+
+        Args:
+            updates: list of (rowid, {column: value})
+            export: export CSV หลัง update
+        """
+        if not updates:
+            return 0
+        self._ensure_columns(sorted({c for _, vals in updates for c in vals}))
+        with self.conn:
+            for rowid, vals in updates:
+                set_sql = ', '.join(f"{_quote(c)} = ?" for c in vals)
+                self.conn.execute(
+                    f"UPDATE {TABLE} SET {set_sql} WHERE rowid = ?",
+                    list(vals.values()) + [rowid]
+                )
+        if export:
+            self.export_csv()
+        return len(updates)
+
+    def close(self):
+        self.conn.close()
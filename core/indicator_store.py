@@ -0,0 +1,596 @@
+"""
+core/indicator_store.py - Indicator Store (per symbol, incremental)
+===================================================================
+Indicator series (ATR, ADX, SMA, rolling SD) computed once per symbol and
+kept next to the OHLCV cache, so engines / backtest / reports share them
+instead of recomputing the same rolling windows on every call.
+
+- One store per cache file: data/cache/EXCHANGE_SYMBOL.ind.npz
+  entries keyed by indicator + params ("sma:50:close", "adx:14", ...),
+  the bar interval is recorded and a different interval → rebuild
+- Rolling means are streamed with a replica of pandas' online kernel
+  (Kahan-compensated add/remove, same as Series.rolling(n).mean());
+  the kernel state is saved at a checkpoint
+  CHECKPOINT_LAG bars before the last bar
+- Bars appended / last bars revised (delta merge) → resume from the
+  checkpoint: only the tail is computed
+- Head bars trimmed (MAX_CACHE_BARS) → resume from the checkpoint shifted
+  by the trimmed bars; the first `lookback` bars are recomputed as a fresh
+  rolling over the frame (same NaN warm-up), later bars keep the longer
+  history (a fresh Series.rolling differs only by round-off there)
+- Older bars revised → full rebuild
+- The kept bars are validated with running per-bar hashes of times + OHLC
+- Saved after every sync that changed it; keys first read through get()
+  are saved by save_indicators() once the caller has read all it needs.
+  Streaming mode (set_write_back) keeps changes in memory until
+  flush_indicators()
+- Rolling SD is streamed the same way with a replica of pandas' Welford
+  kernel (roll_var); its constant-run handling differs between pandas 2.x
+  and 3.x (requirements.txt allows any pandas>=2.0.0), the installed
+  version's is replicated and recorded in the store (STORE_TAG).
+  Checked against Series.rolling(n).std() by tests/test_indicator_store.py
+"""
+import os
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from core.data_cache import get_pattern_index_path
+
+STORE_VERSION = 4          # V4: bar times + running bar hashes (head trims resume)
+CHECKPOINT_LAG = 64         # kernel state kept this many bars back (covers delta_bars=50 revisions)
+INDICATOR_LRU_SIZE = 512    # Symbols kept in memory per run
+INPUT_COLUMNS = ['open', 'high', 'low', 'close']
+_HASH_MULT = np.array([0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9, 0x94D049BB133111EB,
+                       0xD6E8FEB86659FD93, 0xC2B2AE3D27D4EB4F], dtype=np.uint64)
+_HASH_MASK = (1 << 64) - 1
+
+# roll_var constant-run handling changed in pandas 3 (see _roll_var); stores
+# written under another pandas major version are rebuilt (STORE_TAG)
+PANDAS_MAJOR = int(pd.__version__.split('.')[0])
+ROLL_VAR_RECOMPUTE = PANDAS_MAJOR >= 3
+VAR_INV_COND_TOL = np.finfo(np.float64).eps * 1e3
+STORE_TAG = f"{STORE_VERSION}:pd{PANDAS_MAJOR}"
+
+
+# ===================================================================
+# STREAMING KERNELS
+# ===================================================================
+def _roll_mean(values, window, start, stop, state=None):
+    """
+    pandas roll_mean (fixed window, min_periods=window) over bars [start, stop).
+
+    values: full input array (bars < start are read for removals)
+    state:  kernel state after bar start-1 (None → start must be 0)
+    Returns (out[start:stop], state after bar stop-1).
+    """
+    # Only the bars the window can reach (removals start at start - window)
+    offset = max(start - window, 0)
+    vals = values[offset:stop]
+    vals = vals.tolist() if isinstance(vals, np.ndarray) else vals
+    out = np.empty(stop - start, dtype=np.float64)
+    if state is None:
+        nobs, sum_x, neg_ct, comp_add, comp_remove, same, prev = 0, 0.0, 0, 0.0, 0.0, 0, vals[0]
+    else:
+        nobs, sum_x, neg_ct, comp_add, comp_remove, same, prev = state
+        nobs, neg_ct, same = int(nobs), int(neg_ct), int(same)
+
+    for i in range(start, stop):
+        if i >= window:
+            val = vals[i - window - offset]
+            if val == val:
+                nobs -= 1
+                y = -val - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+                if math.copysign(1.0, val) < 0:
+                    neg_ct -= 1
+        val = vals[i - offset]
+        if val == val:
+            nobs += 1
+            y = val - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            if math.copysign(1.0, val) < 0:
+                neg_ct += 1
+            # pandas GH#42064: a run of equal values returns the value itself
+            same = same + 1 if val == prev else 1
+            prev = val
+
+        if nobs >= window and nobs > 0:
+            if same >= nobs:
+                result = prev
+            else:
+                result = sum_x / nobs
+                if neg_ct == 0 and result < 0:
+                    result = 0.0
+                elif neg_ct == nobs and result > 0:
+                    result = 0.0
+        else:
+            result = math.nan
+        out[i - start] = result
+
+    return out, (nobs, sum_x, neg_ct, comp_add, comp_remove, same, prev)
+
+
+def _roll_var(values, window, start, stop, state=None):
+    """
+    pandas roll_var (fixed window, min_periods=window, ddof=1) over bars [start, stop).
+
+    Welford's online variance with Kahan-compensated add / remove; same
+    arguments and return shape as _roll_mean. Constant runs follow the
+    installed pandas (ROLL_VAR_RECOMPUTE):
+    - pandas 2.x: a window of equal values returns 0 (GH#42064 run counter)
+    - pandas 3.x: an add / remove that cancels the sum of squares down to
+      InvCondTol of its previous value recomputes the window from scratch
+    """
+    # Only the bars the window can reach (removals start at start - window)
+    offset = max(start - window, 0)
+    vals = values[offset:stop]
+    vals = vals.tolist() if isinstance(vals, np.ndarray) else vals
+    out = np.empty(stop - start, dtype=np.float64)
+    if state is None:
+        nobs, mean_x, ssqdm_x, comp_add, comp_remove, same, prev, unstable = 0, 0.0, 0.0, 0.0, 0.0, 0, vals[0], False
+    else:
+        nobs, mean_x, ssqdm_x, comp_add, comp_remove, same, prev, unstable = state
+        nobs, same, unstable = int(nobs), int(same), bool(unstable)
+
+    def add(val, nobs, mean_x, ssqdm_x, comp_add):
+        nobs += 1
+        prev_m2 = ssqdm_x
+        prev_mean = mean_x - comp_add
+        y = val - comp_add
+        t = y - mean_x
+        comp_add = t + mean_x - y
+        mean_x = mean_x + t / nobs
+        ssqdm_x = ssqdm_x + (val - prev_mean) * (val - mean_x)
+        return nobs, mean_x, ssqdm_x, comp_add, prev_m2 * VAR_INV_COND_TOL > ssqdm_x
+
+    for i in range(start, stop):
+        if i >= window:
+            val = vals[i - window - offset]
+            if val == val:
+                nobs -= 1
+                if nobs:
+                    prev_m2 = ssqdm_x
+                    prev_mean = mean_x - comp_remove
+                    y = val - comp_remove
+                    t = y - mean_x
+                    comp_remove = t + mean_x - y
+                    mean_x = mean_x - t / nobs
+                    ssqdm_x = ssqdm_x - (val - prev_mean) * (val - mean_x)
+                    unstable = unstable or prev_m2 * VAR_INV_COND_TOL > ssqdm_x
+                else:
+                    mean_x = ssqdm_x = 0.0
+                    unstable = False
+        val = vals[i - offset]
+        if val == val:
+            same = same + 1 if val == prev else 1
+            prev = val
+            nobs, mean_x, ssqdm_x, comp_add, cancelled = add(val, nobs, mean_x, ssqdm_x, comp_add)
+            unstable = unstable or cancelled
+
+        if ROLL_VAR_RECOMPUTE and unstable:
+            # pandas 3: ill-conditioned → re-add the current window from zero
+            nobs, mean_x, ssqdm_x, comp_add, comp_remove = 0, 0.0, 0.0, 0.0, 0.0
+            for j in range(max(i - window + 1, 0), i + 1):
+                val = vals[j - offset]
+                if val == val:
+                    nobs, mean_x, ssqdm_x, comp_add, _ = add(val, nobs, mean_x, ssqdm_x, comp_add)
+            unstable = False
+
+        if nobs >= window and nobs > 1:
+            if not ROLL_VAR_RECOMPUTE and same >= nobs:
+                result = 0.0
+            else:
+                result = ssqdm_x / (nobs - 1)
+        else:
+            result = math.nan
+        out[i - start] = result
+
+    return out, (nobs, mean_x, ssqdm_x, comp_add, comp_remove, same, prev, unstable)
+
+
+def _true_range(inputs):
+    """max(high - low, |high - prev close|, |low - prev close|), NaN-skipping like DataFrame.max(axis=1)"""
+    high, low, close = inputs['high'], inputs['low'], inputs['close']
+    prev_close = np.empty_like(close)
+    prev_close[:1] = np.nan
+    prev_close[1:] = close[:-1]
+    tr1 = high - low
+    tr2 = np.abs(high - prev_close)
+    tr3 = np.abs(low - prev_close)
+    return np.fmax(np.fmax(tr1, tr2), tr3)
+
+
+# ===================================================================
+# INDICATORS
+# ===================================================================
+class SMA:
+    """close.rolling(window).mean()"""
+    columns = ('value',)
+    streaming = True
+
+    def __init__(self, window, column='close'):
+        self.window = int(window)
+        self.column = column
+        self.key = f"sma:{self.window}:{column}"
+        self.lookback = self.window
+
+    def compute(self, inputs, arrays, state, start, stop):
+        out, state['mean'] = _roll_mean(inputs[self.column], self.window, start, stop, state.get('mean'))
+        arrays['value'][start:stop] = out
+
+
+class ATR:
+    """True range rolling(period).mean() (same as calc_atr / calculate_atr)"""
+    columns = ('value',)
+    streaming = True
+
+    def __init__(self, period=14):
+        self.period = int(period)
+        self.key = f"atr:{self.period}"
+        self.lookback = self.period + 1       # true range reads the previous close
+
+    def compute(self, inputs, arrays, state, start, stop):
+        out, state['tr'] = _roll_mean(_true_range(inputs), self.period, start, stop, state.get('tr'))
+        arrays['value'][start:stop] = out
+
+
+class ADX:
+    """Average Directional Index (same arithmetic as trend_engine.calculate_adx)"""
+    columns = ('value', 'dx')
+    streaming = True
+
+    def __init__(self, period=14):
+        self.period = int(period)
+        self.key = f"adx:{self.period}"
+        self.lookback = 2 * self.period + 1   # rolling mean of DX over rolling means
+
+    def compute(self, inputs, arrays, state, start, stop):
+        high, low = inputs['high'], inputs['low']
+        plus_dm = np.empty_like(high)
+        minus_dm = np.empty_like(low)
+        plus_dm[:1] = minus_dm[:1] = np.nan
+        plus_dm[1:] = np.diff(high)
+        minus_dm[1:] = np.diff(low)
+        plus_dm[plus_dm < 0] = 0
+        minus_dm[minus_dm > 0] = 0
+        minus_dm = np.abs(minus_dm)
+        true_plus_dm = np.where((plus_dm > minus_dm) & (plus_dm > 0), plus_dm, 0)
+        true_minus_dm = np.where((minus_dm > plus_dm) & (minus_dm > 0), minus_dm, 0)
+
+        atr, state['tr'] = _roll_mean(_true_range(inputs), self.period, start, stop, state.get('tr'))
+        plus_avg, state['plus'] = _roll_mean(true_plus_dm, self.period, start, stop, state.get('plus'))
+        minus_avg, state['minus'] = _roll_mean(true_minus_dm, self.period, start, stop, state.get('minus'))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plus_di = 100 * (plus_avg / atr)
+            minus_di = 100 * (minus_avg / atr)
+            arrays['dx'][start:stop] = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+        out, state['dx'] = _roll_mean(arrays['dx'], self.period, start, stop, state.get('dx'))
+        arrays['value'][start:stop] = out
+
+
+class RollingStd:
+    """
+    Rolling SD of the bar returns
+    source='intraday': (close - open) / open  (engines)
+    source='close':    close.pct_change()     (backtest / reports)
+    """
+    columns = ('value',)
+    streaming = True
+
+    def __init__(self, window, source='intraday'):
+        if source not in ('intraday', 'close'):
+            raise ValueError(f"Unknown return source: {source}")
+        self.window = int(window)
+        self.source = source
+        self.key = f"std:{self.window}:{source}"
+        self.lookback = self.window + 1       # pct_change reads the previous close
+
+    def compute(self, inputs, arrays, state, start, stop):
+        close = inputs['close']
+        if self.source == 'intraday':
+            returns = (close - inputs['open']) / inputs['open']
+        else:
+            returns = np.empty_like(close)
+            returns[:1] = np.nan
+            returns[1:] = close[1:] / close[:-1] - 1
+        var, state['var'] = _roll_var(returns, self.window, start, stop, state.get('var'))
+        arrays['value'][start:stop] = np.sqrt(np.maximum(var, 0))   # zsqrt: negative round-off → 0
+
+
+INDICATORS = {'sma': SMA, 'atr': ATR, 'adx': ADX, 'std': RollingStd}
+
+
+def parse_key(key):
+    """"sma:50:close" → SMA(50, 'close')"""
+    name, *params = key.split(':')
+    return INDICATORS[name](*[int(p) if p.isdigit() else p for p in params])
+
+
+# ===================================================================
+# STORE
+# ===================================================================
+def _bar_sums(times, inputs):
+    """Running sum of per-bar hashes of time + OHLC: sums[j] - sums[i] fingerprints bars [i, j)"""
+    h = times.view(np.uint64) * _HASH_MULT[0]
+    for mult, col in zip(_HASH_MULT[1:], INPUT_COLUMNS):
+        h = (h ^ (h >> np.uint64(31))) + inputs[col].view(np.uint64) * mult
+    h = (h ^ (h >> np.uint64(29))) * _HASH_MULT[1]
+    sums = np.zeros(len(h) + 1, dtype=np.uint64)
+    np.cumsum(h, out=sums[1:])
+    return sums
+
+
+def _span(sums, start, stop):
+    """Fingerprint of bars [start, stop) (wrap-around difference)"""
+    return (int(sums[stop]) - int(sums[start])) & _HASH_MASK
+
+
+class IndicatorSet:
+    """Indicators of one symbol, synced to the latest bar series seen"""
+
+    def __init__(self, path, interval=None):
+        self.path = path
+        self.interval = interval
+        self.n_bars = 0
+        self.times = None          # int64 ns bar times of the synced series
+        self.sums = None           # _bar_sums of the synced series
+        self.checkpoint = 0        # kernel states are taken after bar checkpoint-1
+        self.entries = {}          # key -> {'arrays': {column: values}, 'state': {name: kernel state}}
+        self.unsaved = False       # keys computed by get() since the last save
+        self.index = None
+        self._inputs = None
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+    def sync(self, df, interval=None):
+        """
+        Bring every stored indicator up to date with df.
+        Returns True if anything was recomputed (caller saves).
+        """
+        interval = interval or self.interval
+        times = df.index.values.astype('datetime64[ns]').astype(np.int64)
+        inputs = {col: df[col].to_numpy(dtype=np.float64) for col in INPUT_COLUMNS}
+        n_bars = len(times)
+        self.index = df.index
+        self._inputs = inputs
+
+        sums = _bar_sums(times, inputs)
+
+        # Bars trimmed off the head since the last sync (MAX_CACHE_BARS trim)
+        shift = None
+        if interval == self.interval and self.n_bars and n_bars:
+            shift = int(np.searchsorted(self.times, times[0]))
+            if shift >= self.n_bars or self.times[shift] != times[0]:
+                shift = None
+        if shift == 0 and n_bars == self.n_bars and sums[-1] == self.sums[-1]:
+            return False
+
+        # Resume from the checkpoint if the bars before it are unchanged
+        resume = 0
+        if (shift is not None and self.checkpoint > shift and n_bars >= self.checkpoint - shift
+                and _span(self.sums, shift, self.checkpoint) == _span(sums, 0, self.checkpoint - shift)):
+            resume = self.checkpoint - shift
+        else:
+            shift = 0
+
+        new_checkpoint = max(resume, n_bars - CHECKPOINT_LAG)
+        for key in list(self.entries):
+            self._compute(key, resume, new_checkpoint, n_bars, shift)
+
+        self.interval = interval
+        self.times = times
+        self.sums = sums
+        self.checkpoint = new_checkpoint
+        self.n_bars = n_bars
+        return True
+
+    def _compute(self, key, resume, checkpoint, n_bars, shift=0):
+        """
+        (Re)compute one entry from bar `resume` and take its kernel state at `checkpoint`.
+        shift: bars trimmed off the head since the entry was computed.
+        """
+        indicator = parse_key(key)
+        entry = self.entries.get(key)
+        if entry is None or not indicator.streaming or (shift and resume <= indicator.lookback):
+            resume = 0
+        arrays = {}
+        for col in indicator.columns:
+            arrays[col] = np.empty(n_bars, dtype=np.float64)
+            if resume:
+                arrays[col][:resume] = entry['arrays'][col][shift:shift + resume]
+        state = dict(entry['state']) if resume else {}
+
+        if indicator.streaming:
+            indicator.compute(self._inputs, arrays, state, resume, checkpoint)
+            checkpoint_state = dict(state)
+            indicator.compute(self._inputs, arrays, state, checkpoint, n_bars)
+            if resume and shift:
+                # Head trimmed: warm-up bars as a fresh rolling over this frame gives them
+                head = {col: np.empty(n_bars, dtype=np.float64) for col in indicator.columns}
+                indicator.compute(self._inputs, head, {}, 0, indicator.lookback)
+                for col in indicator.columns:
+                    arrays[col][:indicator.lookback] = head[col][:indicator.lookback]
+        else:
+            indicator.compute(self._inputs, arrays, state, 0, n_bars)
+            checkpoint_state = {}
+
+        for values in arrays.values():
+            values.flags.writeable = False
+        self.entries[key] = {'arrays': arrays, 'state': checkpoint_state}
+
+    # ------------------------------------------------------------------
+    # Queries (pd.Series aligned to the synced frame)
+    # ------------------------------------------------------------------
+    def get(self, key):
+        """Indicator values for the synced bars (computed on first use, see save_indicators)."""
+        if key not in self.entries:
+            self._compute(key, 0, self.checkpoint, self.n_bars)
+            self.unsaved = True
+        return pd.Series(self.entries[key]['arrays']['value'], index=self.index, copy=False)
+
+    def sma(self, window, column='close'):
+        return self.get(SMA(window, column).key)
+
+    def atr(self, period=14):
+        return self.get(ATR(period).key)
+
+    def adx(self, period=14):
+        return self.get(ADX(period).key)
+
+    def rolling_std(self, window, source='intraday'):
+        return self.get(RollingStd(window, source).key)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self):
+        """Write the store atomically; a failed write only costs a rebuild next run."""
+        self.unsaved = False
+        payload = {
+            'meta': np.array([STORE_TAG, str(self.interval), str(self.checkpoint)]),
+            'times': self.times if self.times is not None else np.empty(0, dtype=np.int64),
+            'sums': self.sums if self.sums is not None else np.zeros(1, dtype=np.uint64),
+            'keys': np.array(sorted(self.entries)),
+        }
+        for key, entry in self.entries.items():
+            for col, values in entry['arrays'].items():
+                payload[f"{key}|{col}"] = values
+            for name, state in entry['state'].items():
+                payload[f"{key}|state|{name}"] = np.array(state, dtype=np.float64)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"  # Per-process tmp: workers may share a cache file
+        try:
+            np.savez(tmp_path, **payload)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved store. Returns None if missing, unreadable or from another version."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                version, interval, checkpoint = data['meta'].tolist()
+                if version != STORE_TAG:
+                    return None
+                store = cls(path, None if interval == 'None' else interval)
+                store.times = data['times']
+                store.sums = data['sums']
+                store.n_bars = len(store.times)
+                store.checkpoint = int(checkpoint)
+                for key in data['keys'].tolist():
+                    indicator = parse_key(key)
+                    arrays = {col: data[f"{key}|{col}"] for col in indicator.columns}
+                    state = {}
+                    for name in data.files:
+                        if name.startswith(f"{key}|state|"):
+                            state[name.rsplit('|', 1)[1]] = tuple(data[name].tolist())
+                    store.entries[key] = {'arrays': arrays, 'state': state}
+            return store
+        except Exception:
+            return None
+
+
+# ===================================================================
+# IN-PROCESS HANDLES (LRU)
+# ===================================================================
+_lock = threading.RLock()
+_handles = OrderedDict()
+_dirty = set()          # paths changed since the last save (write-back mode)
+_write_back = False
+
+
+def set_write_back(enabled):
+    """
+    Streaming mode: keep changed stores in memory and write them on
+    flush_indicators() instead of after every sync.
+    """
+    global _write_back
+    with _lock:
+        _write_back = bool(enabled)
+        if not _write_back:
+            _flush_locked()
+
+
+def _changed(store):
+    with _lock:
+        if _write_back:
+            _dirty.add(store.path)
+        else:
+            store.save()
+
+
+def _flush_locked():
+    written = 0
+    for path in list(_dirty):
+        store = _handles.get(path)
+        if store is not None:
+            store.save()
+            written += 1
+    _dirty.clear()
+    return written
+
+
+def save_indicators(store):
+    """
+    Save the keys a caller's get() calls computed for the first time: one
+    write after all of them are resolved instead of one per key.
+    """
+    if store is not None and store.unsaved:
+        _changed(store)
+
+
+def flush_indicators():
+    """Write every store changed in write-back mode. Returns the number written."""
+    with _lock:
+        return _flush_locked()
+
+
+def get_indicator_path(symbol, exchange):
+    """Store file next to the symbol's cache file."""
+    return f"{get_pattern_index_path(symbol, exchange)}.ind.npz"
+
+
+def get_indicators(df, symbol, exchange, interval=None):
+    """
+    Indicator store of a symbol, synced to df (the symbol's cached bar series).
+    interval: Interval / name of the bars (None → keep the recorded one).
+    Returns None if df can't be keyed by bar time (caller computes directly).
+    """
+    if df is None or df.empty or not isinstance(df.index, pd.DatetimeIndex):
+        return None
+    if any(col not in df.columns for col in INPUT_COLUMNS):
+        return None
+    interval = None if interval is None else str(getattr(interval, 'value', interval))
+    path = get_indicator_path(symbol, exchange)
+    with _lock:
+        store = _handles.get(path)
+        if store is None:
+            store = IndicatorSet.load(path) or IndicatorSet(path, interval)
+            _handles[path] = store
+            while len(_handles) > INDICATOR_LRU_SIZE:
+                old_path, old_store = _handles.popitem(last=False)
+                if old_path in _dirty:
+                    _dirty.discard(old_path)
+                    old_store.save()
+        _handles.move_to_end(path)
+        if store.sync(df, interval):
+            _changed(store)
+    return store
+
+
+def drop_indicator_handles():
+    """Forget in-memory stores (next access re-reads from disk)."""
+    with _lock:
+        _flush_locked()
+        _handles.clear()
@@ -8,6 +8,8 @@ Functions:
 - verify_forecast(): เช็คผลจริง + อัปเดต correct
 - get_accuracy(): คำนวณ % accuracy
 - backtest(): ทดสอบ accuracy ด้วย historical data
+
+Storage: logs/performance_log.db (core/forecast_store.py) + CSV export (logs/performance_log.csv)
 """
 
 import os
@@ -15,10 +17,26 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from tvDatafeed import TvDatafeed, Interval
+from core import run_metrics
 
 # Path to log file
 LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
 LOG_FILE = os.path.join(LOG_DIR, 'performance_log.csv')
+DB_FILE = os.path.join(LOG_DIR, 'performance_log.db')
+
+# HKEX: performance log may store name (TENCENT) instead of code (700)
+HKEX_SYMBOL_MAP = {
+    'TENCENT': '700',
+    'ALIBABA': '9988',
+    'MEITUAN': '3690',
+    'XIAOMI': '1810',
+    'BAIDU': '9888',
+    'JD-COM': '9618',
+    'BYD': '1211',
+    'LI-AUTO': '2015',
+    'XPENG': '9868',
+    'NIO': '9866'
+}
 
 # CSV Columns
 COLUMNS = [
@@ -54,9 +72,28 @@ def _ensure_log_file():
         print(f"📁 Created: {LOG_FILE}")
 
 
+_store = None
+
+
+def get_forecast_store():
+    """
+    Forecast store (SQLite) ที่ sync กับ LOG_FILE
+
+    เปิดครั้งเดียวต่อ process - ถ้า CSV ถูกแก้จาก script อื่นระหว่างรัน จะ re-import ตอนเปิดครั้งถัดไป
+    """
+    global _store
+    from core.forecast_store import ForecastStore
+    if _store is None:
+        _ensure_log_file()
+        _store = ForecastStore(DB_FILE, LOG_FILE, COLUMNS)
+    else:
+        _store._sync_from_csv()
+    return _store
+
+
 def log_forecast(results, group_info=None):
     """
-    บันทึก forecast ลง CSV
+    บันทึก forecast ลง forecast store (+ append ท้าย CSV)
     
     Args:
         results: list of dicts จาก main.py (filtered_data)
@@ -65,7 +102,7 @@ def log_forecast(results, group_info=None):
     Returns:
         int: จำนวน records ที่บันทึก
     """
-    _ensure_log_file()
+    store = get_forecast_store()
     
     if not results:
         return 0
@@ -103,59 +140,15 @@ def log_forecast(results, group_info=None):
         }
         records.append(record)
     
-    # Load existing CSV
-    df_existing = pd.read_csv(LOG_FILE)
-    df_new = pd.DataFrame(records)
-    
-    if df_existing.empty:
-        # First time logging - use new data directly
-        print("📝 [Note] First time logging - creating new log file")
-        df_combined = df_new
-        logged_count = len(records)
-    else:
-        # Deduplication: เช็คว่ามีข้อมูลซ้ำหรือไม่
-        # ถ้า scan_date, symbol, pattern, forecast, target_date เหมือนกัน → ถือว่าซ้ำ
-        # ใช้ merge เพื่อหา duplicates
-        merge_cols = ['scan_date', 'symbol', 'pattern', 'forecast', 'target_date']
-        
-        # เช็คว่า record ใหม่ซ้ำกับที่มีอยู่หรือไม่
-        if not df_new.empty:
-            # Merge เพื่อหา duplicates
-            merged = df_existing.merge(
-                df_new[merge_cols], 
-                on=merge_cols, 
-                how='inner',
-                indicator=True
-            )
-            
-            # หา records ที่ไม่ซ้ำ
-            df_new_unique = df_new[~df_new.set_index(merge_cols).index.isin(
-                df_existing.set_index(merge_cols).index
-            )]
-            
-            if len(df_new_unique) > 0:
-                # Fix FutureWarning: Ensure both DataFrames have same columns before concat
-                # Add missing columns to df_new_unique with None
-                for col in df_existing.columns:
-                    if col not in df_new_unique.columns:
-                        df_new_unique[col] = None
-                # Ensure column order matches
-                df_new_unique = df_new_unique[df_existing.columns]
-                df_combined = pd.concat([df_existing, df_new_unique], ignore_index=True)
-                logged_count = len(df_new_unique)
-                skipped_count = len(records) - logged_count
-                if skipped_count > 0:
-                    print(f"⚠️ Skipped {skipped_count} duplicate forecast(s) (already logged today)")
-            else:
-                # ทั้งหมดซ้ำ → ไม่ต้องบันทึก
-                df_combined = df_existing
-                logged_count = 0
-                print(f"⚠️ All {len(records)} forecast(s) already logged today (skipped duplicates)")
-        else:
-            df_combined = df_existing
-            logged_count = 0
-    
-    df_combined.to_csv(LOG_FILE, index=False)
+    # Deduplication: UNIQUE (scan_date, symbol, pattern, forecast, target_date) → INSERT OR IGNORE
+    with run_metrics.timed('log_write'):
+        logged_count = store.append(records)
+    run_metrics.count('forecasts.logged', logged_count)
+    skipped_count = len(records) - logged_count
+    if logged_count == 0:
+        print(f"⚠️ All {len(records)} forecast(s) already logged today (skipped duplicates)")
+    elif skipped_count > 0:
+        print(f"⚠️ Skipped {skipped_count} duplicate forecast(s) (already logged today)")
     
     if logged_count > 0:
         print(f"📝 Logged {logged_count} new forecast(s) to {LOG_FILE}")
@@ -172,41 +165,38 @@ def verify_forecast(tv=None):
     Returns:
         dict: สรุปผลการ verify
     """
-    _ensure_log_file()
-    
-    df = pd.read_csv(LOG_FILE)
+    store = get_forecast_store()
     
-    if df.empty:
-        print("📊 No forecasts to verify (log file is empty)")
-        return {'verified': 0, 'correct': 0, 'incorrect': 0}
-    
-    # Filter PENDING rows ที่ target_date <= วันนี้
+    # Filter PENDING rows ที่ target_date <= วันนี้ (indexed query, ไม่ต้องโหลดทั้ง log)
     today = datetime.now().strftime('%Y-%m-%d')
-    pending = df[(df['actual'] == 'PENDING') & (df['target_date'] <= today)]
+    pending = store.pending(today)
     
     if pending.empty:
         print("📊 No pending forecasts to verify (all forecasts are either verified or target_date is in future)")
         return {'verified': 0, 'correct': 0, 'incorrect': 0}
     
-    # Count how many are waiting for market close (only for today's forecasts)
+    # Market-close gate (vectorized, is_market_closed ครั้งเดียวต่อ exchange)
+    # ถ้า target_date ผ่านมาแล้ว 1 วันขึ้นไป → verify ได้เลย (ไม่ต้องรอให้ตลาดปิด)
+    # ถ้า target_date = วันนี้ → ต้องรอให้ตลาดปิดก่อน
     from core.market_time import is_market_closed
-    waiting_count = 0
-    for _, row in pending.iterrows():
-        exchange = row.get('exchange', 'SET')
-        target_date_str = row['target_date']
-        target_date = datetime.strptime(target_date_str, '%Y-%m-%d').date()
-        today = datetime.now().date()
-        days_passed = (today - target_date).days
-        
-        # ถ้า target_date = วันนี้ → ต้องรอให้ตลาดปิดก่อน
-        if days_passed == 0:
-            is_closed, _, _ = is_market_closed(exchange)
-            if not is_closed:
-                waiting_count += 1
+    pending = pending.copy()
+    pending['exchange'] = pending['exchange'].fillna('SET')
+    target_dates = pd.to_datetime(pending['target_date'], format='%Y-%m-%d')
+    due_today = (target_dates.dt.date == datetime.now().date()).to_numpy()
+    
+    closed_by_exchange = {
+        exchange: is_market_closed(exchange)[0]
+        for exchange in pending.loc[due_today, 'exchange'].unique()
+    }
+    waiting = due_today & ~pending['exchange'].map(closed_by_exchange).fillna(True).astype(bool).to_numpy()
+    waiting_count = int(waiting.sum())
     
     if waiting_count > 0:
         print(f"⏳ {waiting_count} forecast(s) waiting for market close (will verify after market closes)")
     
+    pending = pending[~waiting]
+    pending['target_day'] = target_dates[~waiting]
+    
     # Connect to TradingView if needed
     if tv is None:
         try:
@@ -215,58 +205,21 @@ def verify_forecast(tv=None):
             print(f"⚠️ Cannot connect to TradingView: {e}")
             return {'verified': 0, 'correct': 0, 'incorrect': 0, 'error': str(e)}
     
+    # Map symbol name to symbol code (for HKEX stocks)
+    # Performance log may store name (TENCENT) instead of code (700)
+    pending['fetch_symbol'] = pending['symbol'].replace(HKEX_SYMBOL_MAP)
+    
     verified = 0
     correct = 0
     incorrect = 0
+    updates = []
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    for idx, row in pending.iterrows():
+    # Batched: โหลดข้อมูล 1 ครั้งต่อ (symbol, exchange) แล้ว join target_date ทั้งกลุ่มทีเดียว
+    from core.data_cache import get_data_with_cache
+    for (symbol, exchange), group in pending.groupby(['fetch_symbol', 'exchange'], sort=False):
         try:
-            # Fetch latest price
-            symbol = row['symbol']
-            exchange = row['exchange']
-            target_date_str = row['target_date']
-            
-            # Map symbol name to symbol code (for HKEX stocks)
-            # Performance log may store name (TENCENT) instead of code (700)
-            symbol_map = {
-                'TENCENT': '700',
-                'ALIBABA': '9988',
-                'MEITUAN': '3690',
-                'XIAOMI': '1810',
-                'BAIDU': '9888',
-                'JD-COM': '9618',
-                'BYD': '1211',
-                'LI-AUTO': '2015',
-                'XPENG': '9868',
-                'NIO': '9866'
-            }
-            if symbol in symbol_map:
-                symbol = symbol_map[symbol]
-            
-            # Check if market is closed before verifying
-            # ถ้า target_date ผ่านมาแล้วหลายวัน → verify ได้เลย (ไม่ต้องรอให้ตลาดปิดในวันนี้)
-            # ถ้า target_date = วันนี้ → ต้องรอให้ตลาดปิดก่อน
-            from core.market_time import is_market_closed
-            
-            target_date = datetime.strptime(target_date_str, '%Y-%m-%d').date()
-            today = datetime.now().date()
-            days_passed = (today - target_date).days
-            
-            # ถ้า target_date ผ่านมาแล้ว 1 วันขึ้นไป → verify ได้เลย (ไม่ต้องรอให้ตลาดปิด)
-            if days_passed >= 1:
-                # target_date ผ่านมาแล้ว → verify ได้เลย
-                pass  # Continue to verify
-            else:
-                # target_date = วันนี้ → ต้องรอให้ตลาดปิดก่อน
-                is_closed, status_msg, close_time_ict = is_market_closed(exchange)
-                if not is_closed:
-                    # ตลาดยังไม่ปิด → ข้าม (รอให้ตลาดปิดก่อน)
-                    continue
-            
-            # Get historical data to find price at target_date
             # Use cache to avoid connection issues
-            from core.data_cache import get_data_with_cache
             try:
                 data = get_data_with_cache(
                     tv=tv,
@@ -284,60 +237,50 @@ def verify_forecast(tv=None):
                 print(f"⚠️ No data available for {symbol} ({exchange})")
                 continue
             
-            # Get price at scan date and target date
-            price_at_scan = row['price_at_scan']
-            
-            # Try to find price at target_date, otherwise use latest price
-            target_date_dt = datetime.strptime(target_date_str, '%Y-%m-%d')
-            data_index = pd.to_datetime(data.index)
-            
-            # Find closest date to target_date
-            target_idx = None
-            for i, date in enumerate(data_index):
-                if date.date() == target_date:
-                    target_idx = i
-                    break
+            # Close by calendar date (first bar of each date) → reindex ตาม target_date
+            closes = pd.Series(data['close'].to_numpy(), index=pd.to_datetime(data.index).normalize())
+            closes = closes[~closes.index.duplicated(keep='first')]
+            price_actual = closes.reindex(group['target_day'].to_numpy()).to_numpy()
             
-            if target_idx is not None:
-                # Use price at target_date
-                price_actual = data['close'].iloc[target_idx]
-            else:
+            missing = np.isnan(price_actual)
+            if missing.any():
                 # Fallback: use latest price (shouldn't happen if target_date passed)
-                price_actual = data['close'].iloc[-1]
-                print(f"⚠️ Target date {target_date_str} not found in data, using latest price")
+                for target_date_str in group['target_date'].to_numpy()[missing]:
+                    print(f"⚠️ Target date {target_date_str} not found in data, using latest price")
+                price_actual = np.where(missing, data['close'].iloc[-1], price_actual)
             
             # Determine actual direction
-            realized_change = ((price_actual - price_at_scan) / price_at_scan * 100) if price_at_scan > 0 else 0
-            
-            if price_actual > price_at_scan:
-                actual = 'UP'
-            elif price_actual < price_at_scan:
-                actual = 'DOWN'
-            else:
-                actual = 'NEUTRAL'
+            price_at_scan = group['price_at_scan'].to_numpy(dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                realized_change = np.where(
+                    price_at_scan > 0, (price_actual - price_at_scan) / price_at_scan * 100, 0.0
+                )
+            actual = np.where(price_actual > price_at_scan, 'UP',
+                              np.where(price_actual < price_at_scan, 'DOWN', 'NEUTRAL'))
             
             # Check if correct
-            is_correct = 1 if row['forecast'] == actual else 0
+            is_correct = (group['forecast'].to_numpy() == actual).astype(int)
             
-            # Update row
-            df.loc[idx, 'actual'] = actual
-            df.loc[idx, 'price_actual'] = round(price_actual, 2)
-            df.loc[idx, 'realized_change'] = round(realized_change, 2)
-            df.loc[idx, 'correct'] = is_correct
-            df.loc[idx, 'last_update'] = now
+            for rowid, act, price, change, ok in zip(group['_rowid'].to_numpy(), actual,
+                                                     price_actual, realized_change, is_correct):
+                updates.append((int(rowid), {
+                    'actual': str(act),
+                    'price_actual': round(float(price), 2),
+                    'realized_change': round(float(change), 2),
+                    'correct': int(ok),
+                    'last_update': now
+                }))
             
-            verified += 1
-            if is_correct:
-                correct += 1
-            else:
-                incorrect += 1
+            verified += len(group)
+            correct += int(is_correct.sum())
+            incorrect += int(len(group) - is_correct.sum())
                 
         except Exception as e:
-            print(f"⚠️ Error verifying {row['symbol']}: {e}")
+            print(f"⚠️ Error verifying {symbol}: {e}")
             continue
     
-    # Save updated CSV
-    df.to_csv(LOG_FILE, index=False)
+    # Save updates (single transaction + CSV export)
+    store.update_rows(updates)
     
     print(f"✅ Verified: {verified} | Correct: {correct} | Incorrect: {incorrect}")
     return {'verified': verified, 'correct': correct, 'incorrect': incorrect}
@@ -353,9 +296,7 @@ def get_accuracy(days=30):
     Returns:
         dict: สรุป accuracy
     """
-    _ensure_log_file()
-    
-    df = pd.read_csv(LOG_FILE)
+    df = get_forecast_store().read_frame()
     
     if df.empty:
         return {'total': 0, 'accuracy': 0}
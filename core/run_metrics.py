@@ -0,0 +1,134 @@
+"""
+core/run_metrics.py - Run Instrumentation (per-stage timings + counters)
+=======================================================================
+เก็บเวลาแต่ละ stage + counters ของ 1 run แล้วเขียนเป็น JSON line ต่อท้าย
+data/run_report.jsonl (ข้าง data/system_heartbeat.txt) เพื่อดูว่า stage ไหน
+ช้าผิดปกติเมื่อ daily run ใช้เวลานานขึ้น
+
+- timed('stage'):   context manager จับเวลา (ms) ของ 1 ครั้ง
+- count('name', n): counter (cache hit/miss/delta, fetch ok/fail, ...)
+- Stage summary: count, total, mean, p50, p95, max + histogram (bucket ≤ ms)
+- --workers: call_collected() เก็บ metrics ใน worker process แล้วส่งกลับมา merge()
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+RUN_REPORT = "data/run_report.jsonl"
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 60000)
+
+_lock = threading.Lock()
+_samples = {}    # stage -> list of durations (ms)
+_counters = {}   # name -> int
+_started = time.time()
+
+
+def reset():
+    """Start a new run (clears all samples and counters)."""
+    global _started
+    with _lock:
+        _samples.clear()
+        _counters.clear()
+        _started = time.time()
+
+
+def observe(stage, ms):
+    with _lock:
+        _samples.setdefault(stage, []).append(ms)
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, (time.perf_counter() - start) * 1000)
+
+
+# ===================================================================
+# WORKER PROCESSES
+# ===================================================================
+def export():
+    """Raw samples + counters (picklable, for merge() in the parent process)."""
+    with _lock:
+        return {'samples': {k: list(v) for k, v in _samples.items()}, 'counters': dict(_counters)}
+
+
+def merge(raw):
+    """Add a worker's export() into this process's run."""
+    if not raw:
+        return
+    with _lock:
+        for stage, values in raw['samples'].items():
+            _samples.setdefault(stage, []).extend(values)
+        for name, n in raw['counters'].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def call_collected(fn, *args, **kwargs):
+    """
+    Run fn in a pool worker with fresh metrics.
+    Returns (fn result, export()) — the parent merges the export.
+    """
+    with _lock:
+        _samples.clear()
+        _counters.clear()
+    return fn(*args, **kwargs), export()
+
+
+# ===================================================================
+# REPORT
+# ===================================================================
+def _stage_summary(values):
+    arr = np.asarray(values, dtype=np.float64)
+    edges = np.asarray(HISTOGRAM_BUCKETS_MS, dtype=np.float64)
+    bucket_counts = np.bincount(np.searchsorted(edges, arr, side='left'), minlength=len(edges) + 1)
+    histogram = {f"le_{int(edge)}": int(n) for edge, n in zip(edges, bucket_counts)}
+    histogram['inf'] = int(bucket_counts[-1])
+    return {
+        'count': int(len(arr)),
+        'total_ms': round(float(arr.sum()), 3),
+        'mean_ms': round(float(arr.mean()), 3),
+        'p50_ms': round(float(np.percentile(arr, 50)), 3),
+        'p95_ms': round(float(np.percentile(arr, 95)), 3),
+        'max_ms': round(float(arr.max()), 3),
+        'histogram': histogram,
+    }
+
+
+def snapshot():
+    """Current run as a dict: stage summaries + counters."""
+    with _lock:
+        samples = {k: list(v) for k, v in _samples.items()}
+        counters = dict(_counters)
+    return {
+        'started': datetime.fromtimestamp(_started).strftime("%Y-%m-%d %H:%M:%S"),
+        'duration_s': round(time.time() - _started, 2),
+        'stages': {stage: _stage_summary(values) for stage, values in sorted(samples.items()) if values},
+        'counters': dict(sorted(counters.items())),
+    }
+
+
+def write_run_report(path=RUN_REPORT, **extra):
+    """Append the run as one JSON line. Returns the record written (None on failure)."""
+    record = snapshot()
+    record.update(extra)
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"⚠️ Run report write failed: {e}")
+        return None
+    return record
@@ -22,10 +22,16 @@ from core.data_cache import (
     has_cache, 
     is_cache_fresh, 
     load_cache, 
+    get_cache_path,
     is_connection_healthy,
-    set_connection_healthy
+    set_connection_healthy,
+    prefetch_many,
+    tv_client_factory,
+    TokenBucket,
+    ASYNC_MAX_IN_FLIGHT
 )
 from core.performance import log_forecast, verify_forecast
+from core import run_metrics
 
 # Fix encoding for Windows console
 if sys.platform == 'win32':
@@ -39,6 +45,7 @@ load_dotenv()
 # Rate Limiting Config (reduced since cache handles most requests)
 REQUEST_DELAY = 0.3  # V4.8: Optimized for Delta fetch
 BACKOFF_BASE = 2.0   # Exponential backoff multiplier
+PREFETCH_BATCH = 8   # --workers: symbols fetched concurrently per prefetch_many round
 
 # Import thresholds from config (V6.0 - Configurable)
 # สามารถปรับได้ใน config.py โดยไม่ต้องแก้ code
@@ -69,26 +76,39 @@ def _is_true_flag(val) -> bool:
         return v in ("true", "1", "yes", "y", "t")
     return False
 
-def fetch_and_analyze(tv, asset_info, history_bars, interval, fixed_threshold=None):
+def fetch_asset_data(tv, asset_info, history_bars, interval):
     """
-    Fetch data with smart caching and analyze.
+    Fetch one symbol with smart caching (None = no data / fetch failure).
     All retry/timeout/fallback logic is handled by data_cache.py.
     """
-    symbol = asset_info['symbol']
-    exchange = asset_info['exchange']
-    
     try:
         df = get_data_with_cache(
             tv=tv,
-            symbol=symbol,
-            exchange=exchange,
+            symbol=asset_info['symbol'],
+            exchange=asset_info['exchange'],
             interval=interval,
             full_bars=history_bars,
             delta_bars=50
         )
+    except Exception:
+        return None
+    if df is None or df.empty:
+        return None
+    return df
+
+def fetch_and_analyze(tv, asset_info, history_bars, interval, fixed_threshold=None):
+    """
+    Fetch data with smart caching and analyze.
+    All retry/timeout/fallback logic is handled by data_cache.py.
+    """
+    symbol = asset_info['symbol']
+    exchange = asset_info['exchange']
+    
+    try:
+        df = fetch_asset_data(tv, asset_info, history_bars, interval)
         
-        if df is not None and not df.empty:
-            results_list = processor.analyze_asset(df, symbol=symbol, exchange=exchange, fixed_threshold=fixed_threshold)
+        if df is not None:
+            results_list = processor.analyze_asset(df, symbol=symbol, exchange=exchange, fixed_threshold=fixed_threshold, persist_index=True)
             display_name = asset_info.get('name', symbol)
             for res in results_list:
                 res['symbol'] = display_name
@@ -100,6 +120,189 @@ def fetch_and_analyze(tv, asset_info, history_bars, interval, fixed_threshold=No
         return None
 
 
+def record_asset_results(group_name, asset, pattern_results, fetch_summary, session_fetched, all_results, price_map):
+    """
+    Merge one symbol's analysis into the run state (shared by sequential and --workers mode).
+    Returns True on success, False if the symbol failed (no data).
+    """
+    if pattern_results is not None:
+        fetch_summary['success'] += 1
+        # Mark as fetched in this session (ถ้ายังไม่ได้ mark จาก cache path)
+        session_fetched.add(asset['symbol'].upper())
+        session_fetched.add(asset['symbol'])
+        for res in pattern_results:
+            res['group'] = group_name
+            res['exchange'] = asset['exchange'] # Add actual exchange
+            all_results.append(res)
+            # Update Price Map for Global Homework Check
+            price_map[res['symbol']] = res['price']
+        return True
+    
+    fetch_summary['failed'] += 1
+    # ไม่ mark เป็น fetched (ให้ลองใหม่ได้ถ้า retry)
+    fetch_summary['failed_symbols'].append(asset['symbol'])
+    return False
+
+def run_parallel_scan(tv, jobs, workers):
+    """
+    --workers mode: split network fetching from CPU analysis.
+    
+    - Producer thread: fetches through data_cache; online, PREFETCH_BATCH symbols
+      at a time concurrently (prefetch_many, token-bucket rate limit), offline
+      cache-served symbols go straight through
+    - Process pool: processor.analyze_asset for each fetched DataFrame.
+      In cache-only mode workers map the cache file themselves
+      (processor.analyze_cached_asset) so all processes share one page cache.
+    
+    Returns [(job, pattern_results)] in job order, so the merge into
+    all_results / forecast_tomorrow.csv is identical to the sequential loop.
+    pattern_results is None when no data could be fetched.
+    """
+    import asyncio
+    import threading
+    import queue
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    data_queue = queue.Queue(maxsize=workers * 4)  # Backpressure: don't run far ahead of the pool
+    
+    # Symbols sharing one cache file (e.g. XAUUSD 15m/30m) must be analyzed
+    # from the producer's snapshot, not from a file a later job may rewrite
+    path_counts = {}
+    for job in jobs:
+        path = get_cache_path(job['asset']['symbol'], job['asset']['exchange'])
+        path_counts[path] = path_counts.get(path, 0) + 1
+    
+    # One event loop, token bucket and client pool for the whole run: the
+    # rate limit holds across batches instead of restarting full each batch
+    loop = asyncio.new_event_loop()
+    bucket = TokenBucket()
+    client_pool = {}
+    
+    def fetch_batch(conn, batch):
+        """Online: fetch a batch of jobs concurrently (prefetch_many) → [(pos, df or None)]."""
+        assets = [{'symbol': jobs[pos]['asset']['symbol'], 'exchange': jobs[pos]['asset']['exchange'],
+                   'interval': jobs[pos]['interval'], 'history_bars': jobs[pos]['history']} for pos in batch]
+        if client_pool.get('tv') is not conn:   # first batch / reconnected
+            factory = tv_client_factory(conn)
+            client_pool['tv'] = conn
+            client_pool['clients'] = [conn] + [factory() for _ in range(ASYNC_MAX_IN_FLIGHT - 1)]
+        try:
+            frames = loop.run_until_complete(prefetch_many(conn, assets, delta_bars=50, bucket=bucket,
+                                                           clients=client_pool['clients']))
+        except Exception:
+            frames = {}
+        return [(pos, frames.get((a['symbol'], a['exchange']))) for pos, a in zip(batch, assets)]
+    
+    def producer():
+        conn = tv
+        consecutive_failures = 0
+        pos = 0
+        while pos < len(jobs):
+            # V5.0: Smart Cooldown (same policy as the sequential loop)
+            if consecutive_failures >= 10 and is_connection_healthy():
+                print(f"\n⚠️ Too many failures ({consecutive_failures}). Pausing for 10s and reconnecting...")
+                time.sleep(10)
+                conn = TvDatafeed()
+                consecutive_failures = 0
+            elif consecutive_failures >= 10:
+                print(f"\n⚠️ Connection unstable. Switching to cache-only mode...")
+                set_connection_healthy(False)
+                consecutive_failures = 0
+            
+            if is_connection_healthy():
+                # Overlap network latency: up to PREFETCH_BATCH jobs in flight together
+                # (token bucket paces requests; jobs sharing a cache file go in separate batches)
+                batch, batch_paths = [], set()
+                while pos < len(jobs) and len(batch) < PREFETCH_BATCH:
+                    path = get_cache_path(jobs[pos]['asset']['symbol'], jobs[pos]['asset']['exchange'])
+                    if path in batch_paths:
+                        break
+                    batch_paths.add(path)
+                    batch.append(pos)
+                    pos += 1
+                fetched = fetch_batch(conn, batch)
+            else:
+                asset = jobs[pos]['asset']
+                # Cache-only: let the worker map the file (no load/pickle here)
+                if path_counts[get_cache_path(asset['symbol'], asset['exchange'])] == 1:
+                    data_queue.put((pos, None, True))
+                    pos += 1
+                    continue
+                try:
+                    df = get_data_with_cache(
+                        tv=conn,
+                        symbol=asset['symbol'],
+                        exchange=asset['exchange'],
+                        interval=jobs[pos]['interval'],
+                        full_bars=jobs[pos]['history'],
+                        delta_bars=50
+                    )
+                except Exception:
+                    df = None
+                fetched = [(pos, df)]
+                pos += 1
+            
+            for job_pos, df in fetched:
+                if df is None or df.empty:
+                    df = None
+                    consecutive_failures += 1
+                else:
+                    consecutive_failures = 0
+                data_queue.put((job_pos, df, False))
+        loop.close()
+        data_queue.put(None)
+    
+    outcomes = [None] * len(jobs)
+    futures = {}
+    # Workers must not be forked from this process: the producer thread holds
+    # run_metrics / data_cache locks while fetching, and a child forked at that
+    # moment inherits them locked → deadlock. forkserver (spawn off Unix) starts
+    # workers from a clean, single-threaded process.
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method)) as pool:
+        fetcher = threading.Thread(target=producer, daemon=True)
+        fetcher.start()
+        
+        fetched = 0
+        while True:
+            item = data_queue.get()
+            if item is None:
+                break
+            pos, df, from_cache_file = item
+            fetched += 1
+            sys.stdout.write(f"\r   [{fetched}/{len(jobs)}] Fetched {jobs[pos]['asset']['symbol']}...")
+            sys.stdout.flush()
+            asset = jobs[pos]['asset']
+            if from_cache_file:
+                futures[pos] = pool.submit(
+                    run_metrics.call_collected, processor.analyze_cached_asset, asset['symbol'], asset['exchange'],
+                    fixed_threshold=jobs[pos]['fixed_threshold'], persist_index=True
+                )
+                continue
+            if df is None:
+                continue
+            futures[pos] = pool.submit(
+                run_metrics.call_collected, processor.analyze_asset, df, symbol=asset['symbol'],
+                exchange=asset['exchange'], fixed_threshold=jobs[pos]['fixed_threshold'], persist_index=True
+            )
+        fetcher.join()
+        
+        for pos, future in futures.items():
+            try:
+                results_list, worker_metrics = future.result()
+            except Exception:
+                continue  # Worker crash = same as a failed fetch_and_analyze
+            run_metrics.merge(worker_metrics)
+            if results_list is None:
+                continue  # No cache for a cache-only symbol
+            display_name = jobs[pos]['asset'].get('name', jobs[pos]['asset']['symbol'])
+            for res in results_list:
+                res['symbol'] = display_name
+            outcomes[pos] = results_list
+    
+    return list(zip(jobs, outcomes))
+
 
 def show_all_forecasts(results):
     """
@@ -405,8 +608,35 @@ def get_auth_token(session_id):
 def main():
     import time
     import os
-    start_time = time.time()
+    import argparse
     
+    parser = argparse.ArgumentParser(description="Fractal N+1 Prediction Runner")
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Analysis processes (default: 1 = sequential). Fetching stays in one rate-limited producer')
+    parser.add_argument('--batch', action='store_true',
+                        help='Group mode: analyze each asset group as one (symbols x bars) matrix after fetching it')
+    parser.add_argument('--stream', action='store_true',
+                        help='Streaming intraday mode: analyze config.STREAM_GROUPS bar by bar until Ctrl+C')
+    parser.add_argument('--simulate', type=int, default=0, metavar='N',
+                        help='With --stream: replay the last N cached bars per symbol (no network)')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='With --simulate: seconds between replayed bars (default: 0)')
+    parser.add_argument('--poll', type=float, default=None,
+                        help=f'With --stream: live poll period in seconds (default: {config.STREAM_POLL_SECONDS})')
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+    if args.batch and workers > 1:
+        print("⚠️ --batch analyzes each group in-process: ignoring --workers")
+        workers = 1
+    
+    # Simulated stream: cached bars only, no TradingView login
+    if args.stream and args.simulate > 0:
+        from core.bar_stream import run_stream
+        run_stream(simulate_bars=args.simulate, delay=args.delay)
+        return
+    
+    start_time = time.time()
+    run_metrics.reset()
     
     print("🚀 Starting Fractal N+1 Prediction System...")
     
@@ -440,14 +670,21 @@ def main():
     except Exception as e:
         print(f"❌ Connection Failed: {e}")
         return
+    
+    if args.stream:
+        from core.bar_stream import run_stream
+        run_stream(tv=tv, poll_seconds=args.poll)
+        return
 
     # =========================================================
     # STARTUP: Legacy cleanup + Health check + Cache stats
     # =========================================================
-    from core.data_cache import cleanup_legacy_pkl, check_connection_health, get_cache_stats
+    from core.data_cache import cleanup_legacy_pkl, migrate_csv_cache, check_connection_health, get_cache_stats
     
     # Clean up old .pkl files (runs once, harmless if none exist)
     cleanup_legacy_pkl()
+    # V4 cache: convert EXCHANGE_SYMBOL.csv → binary .npy (runs once)
+    migrate_csv_cache()
     
     # Quick connection test
     if not check_connection_health(tv):
@@ -483,7 +720,8 @@ def main():
     # Priority 1: เช็คจาก performance_log.csv (มี scan_date column)
     if os.path.exists(perf_log_file):
         try:
-            perf_df = pd.read_csv(perf_log_file)
+            with run_metrics.timed('resume_load'):
+                perf_df = pd.read_csv(perf_log_file)
             if not perf_df.empty:
                 # เช็คว่า scan_date = วันนี้ (scan วันนี้แล้ว)
                 if 'scan_date' in perf_df.columns:
@@ -515,7 +753,8 @@ def main():
         try:
             file_mtime = datetime.datetime.fromtimestamp(os.path.getmtime(results_file))
             file_date = file_mtime.strftime("%Y-%m-%d")
-            forecast_df = pd.read_csv(results_file)
+            with run_metrics.timed('resume_load'):
+                forecast_df = pd.read_csv(results_file)
             
             if not forecast_df.empty and 'symbol' in forecast_df.columns:
                 # Pre-load cached results with NaN protection (สำหรับแสดงผล)
@@ -543,7 +782,8 @@ def main():
     # Load perf_log_df for market time check
     if os.path.exists(perf_log_file):
         try:
-            perf_log_df = pd.read_csv(perf_log_file)
+            with run_metrics.timed('resume_load'):
+                perf_log_df = pd.read_csv(perf_log_file)
         except Exception:
             pass
     
@@ -563,6 +803,7 @@ def main():
     price_map = {} # symbol -> latest_price
     
     consecutive_failures = 0
+    scan_jobs = []  # --workers mode: symbols that passed the skip checks (config order)
     
     # Iterate through Asset Groups
     for group_name, settings in config.ASSET_GROUPS.items():
@@ -571,6 +812,7 @@ def main():
         assets = settings['assets']
         interval = settings['interval']
         history = settings['history_bars']
+        group_batch = []  # --batch mode: (asset, df) fetched this group, analyzed after the loop
         
         for i, asset in enumerate(assets):
             display_name = asset.get('name', asset['symbol'])
@@ -631,14 +873,22 @@ def main():
                 fetch_summary['total'] += 1
                 continue
             
-            sys.stdout.write(f"\r   [{i+1}/{len(assets)}] Scanning {asset['symbol']}...")
-            sys.stdout.flush()
-            
             fetch_summary['total'] += 1
             
             # Check for fixed threshold override in config
             fixed_thresh = settings.get('fixed_threshold', None)
             
+            # --workers mode: queue the symbol, fetch/analyze after the skip pass
+            if workers > 1:
+                scan_jobs.append({
+                    'group': group_name, 'asset': asset, 'interval': interval,
+                    'history': history, 'fixed_threshold': fixed_thresh
+                })
+                continue
+            
+            sys.stdout.write(f"\r   [{i+1}/{len(assets)}] Scanning {asset['symbol']}...")
+            sys.stdout.flush()
+            
             # V5.0: Smart Fetch - เช็ค cache ก่อน, retry เฉพาะเมื่อจำเป็น
             # Fast path: ถ้ามี cache fresh และ connection bad → ใช้ cache เลย (ไม่ต้อง fetch)
             symbol = asset['symbol']
@@ -646,11 +896,38 @@ def main():
             has_fresh_cache = has_cache(symbol, exchange) and is_cache_fresh(symbol, exchange)
             connection_bad = not is_connection_healthy()
             
+            # --batch mode: fetch now, analyze the whole group as one matrix after the loop
+            if args.batch:
+                if has_fresh_cache and connection_bad:
+                    # Tail pre-screen: quiet bar → no forecast, no full-history load
+                    if not processor.prescreen_asset(symbol, exchange, fixed_threshold=fixed_thresh):
+                        record_asset_results(group_name, asset, [], fetch_summary,
+                                             session_fetched, all_results, price_map)
+                        consecutive_failures = 0
+                        continue
+                    df = load_cache(symbol, exchange, mmap=True)
+                    if df is not None and df.empty:
+                        df = None
+                else:
+                    df = fetch_asset_data(tv, asset, history, interval)
+                
+                if df is not None:
+                    group_batch.append((asset, df))
+                    consecutive_failures = 0
+                else:
+                    record_asset_results(group_name, asset, None, fetch_summary,
+                                         session_fetched, all_results, price_map)
+                    consecutive_failures += 1
+                
+                if not connection_bad:
+                    time.sleep(REQUEST_DELAY)
+                continue
+            
             if has_fresh_cache and connection_bad:
                 # ใช้ cache โดยตรง ไม่ต้อง fetch
-                cached_df = load_cache(symbol, exchange)
-                if cached_df is not None and not cached_df.empty:
-                    results_list = processor.analyze_asset(cached_df, symbol=symbol, exchange=exchange, fixed_threshold=fixed_thresh)
+                # (tail pre-screen ก่อน: แท่งล่าสุดไม่ถึง threshold → ไม่ต้องโหลดทั้งไฟล์)
+                results_list = processor.analyze_cached_asset(symbol, exchange, fixed_threshold=fixed_thresh, persist_index=True)
+                if results_list is not None:
                     display_name = asset.get('name', symbol)
                     for res in results_list:
                         res['symbol'] = display_name
@@ -665,27 +942,39 @@ def main():
                 pattern_results = fetch_and_analyze(tv, asset, history, interval, fixed_thresh)
             
             # Update results
-            if pattern_results is not None:
-                fetch_summary['success'] += 1
+            if record_asset_results(group_name, asset, pattern_results, fetch_summary,
+                                    session_fetched, all_results, price_map):
                 consecutive_failures = 0 # Reset on success
-                # Mark as fetched in this session (ถ้ายังไม่ได้ mark จาก cache path)
-                session_fetched.add(symbol_upper)
-                session_fetched.add(asset['symbol'])
-                for res in pattern_results:
-                    res['group'] = group_name
-                    res['exchange'] = asset['exchange'] # Add actual exchange
-                    all_results.append(res)
-                    # Update Price Map for Global Homework Check
-                    price_map[res['symbol']] = res['price']
             else:
-                fetch_summary['failed'] += 1
                 consecutive_failures += 1 # Increment failure count
-                # ไม่ mark เป็น fetched (ให้ลองใหม่ได้ถ้า retry)
-                fetch_summary['failed_symbols'].append(asset['symbol'])
             
-            # Rate limiting: ถ้า connection bad → delay น้อยลง (ใช้ cache อยู่แล้ว)
-            delay = 0.1 if connection_bad else REQUEST_DELAY
-            time.sleep(delay)
+            # Rate limiting: only after a network fetch (cache-served symbols don't hit TradingView)
+            if not connection_bad:
+                time.sleep(REQUEST_DELAY)
+        
+        # --batch mode: one cross-sectional analysis for the group, merged in config order
+        if group_batch:
+            sys.stdout.write(f"\r   🧮 Group matrix: {len(group_batch)} symbols...")
+            sys.stdout.flush()
+            batch_results = processor.analyze_group(
+                [df for _, df in group_batch],
+                [asset['symbol'] for asset, _ in group_batch],
+                [asset['exchange'] for asset, _ in group_batch],
+                fixed_threshold=settings.get('fixed_threshold', None), persist_index=True
+            )
+            for (asset, _), results_list in zip(group_batch, batch_results):
+                display_name = asset.get('name', asset['symbol'])
+                for res in results_list:
+                    res['symbol'] = display_name
+                record_asset_results(group_name, asset, results_list, fetch_summary,
+                                     session_fetched, all_results, price_map)
+    
+    # --workers mode: fetch + analyze the queued symbols, merge in config order
+    if scan_jobs:
+        print(f"\n⚙️ Parallel scan: {len(scan_jobs)} symbols | {workers} analysis workers")
+        for job, pattern_results in run_parallel_scan(tv, scan_jobs, workers):
+            record_asset_results(job['group'], job['asset'], pattern_results, fetch_summary,
+                                 session_fetched, all_results, price_map)
     
     # Print Fetch Summary
     print("\n")
@@ -716,9 +1005,11 @@ def main():
     print("📊 Forward Testing: ตรวจการบ้าน (เช็คผลจริง vs ทาย)")
     print("="*80)
     try:
-        verify_result = verify_forecast(tv=tv)
+        with run_metrics.timed('verify'):
+            verify_result = verify_forecast(tv=tv)
         if verify_result:
             verified = verify_result.get('verified', 0)
+            run_metrics.count('forecasts.verified', verified)
             correct = verify_result.get('correct', 0)
             incorrect = verify_result.get('incorrect', 0)
             if verified > 0:
@@ -737,7 +1028,8 @@ def main():
     if display_results:
         # แสดงเฉพาะ PREDICT N+1 REPORT (มี Forecast ชัดเจน UP/DOWN)
         # ไม่แสดง ALL FORECASTS เพราะไม่ได้บอกทิศทางและมีข้อมูลซ้ำ
-        generate_report(display_results)
+        with run_metrics.timed('report'):
+            generate_report(display_results)
 
         # Step 3: Log forecasts based on configurable thresholds (V6.0)
         # Note: Log เฉพาะผลใหม่ (all_results) ไม่ใช่จาก CSV
@@ -859,13 +1151,14 @@ def main():
             print("✅ Reports & Logs updated.")
             
             # Save Heartbeat to file
-            with open("data/system_heartbeat.txt", "w", encoding="utf-8") as f:
-                f.write(f"SYSTEM HEARTBEAT | Updated: {now_dt}\n")
-                f.write("=" * 85 + "\n")
-                f.write(f"{'Market':<10} {'Patterns':>10} {'Tradeable':>10} {'UP':>6} {'DOWN':>6}   {'Top Signal'}\n")
-                for m_key, s in market_stats.items():
-                    f.write(f"{m_key:<10} {s['scanned']:>10} {s['tradeable']:>10} {s['up']:>6} {s['down']:>6}   {s['best_pattern']}\n")
-                f.write("-" * 85 + "\n")
+            with run_metrics.timed('heartbeat_write'):
+                with open("data/system_heartbeat.txt", "w", encoding="utf-8") as f:
+                    f.write(f"SYSTEM HEARTBEAT | Updated: {now_dt}\n")
+                    f.write("=" * 85 + "\n")
+                    f.write(f"{'Market':<10} {'Patterns':>10} {'Tradeable':>10} {'UP':>6} {'DOWN':>6}   {'Top Signal'}\n")
+                    for m_key, s in market_stats.items():
+                        f.write(f"{m_key:<10} {s['scanned']:>10} {s['tradeable']:>10} {s['up']:>6} {s['down']:>6}   {s['best_pattern']}\n")
+                    f.write("-" * 85 + "\n")
 
             # -------------------------------------------------------------
             # 7. Final Status
@@ -876,12 +1169,31 @@ def main():
     else:
         print("\n❌ No matching patterns found in any asset (and no CSV data available).")
     
+    # Write-back: every updated symbol cache hits disk once, at the end of the run
+    from core.data_cache import flush_cache
+    with run_metrics.timed('cache_flush'):
+        written = flush_cache()
+    if written:
+        print(f"💾 Cache write-back: {written} symbols")
+    
     # Print execution time
     end_time = time.time()
     duration = end_time - start_time
     minutes = int(duration // 60)
     seconds = int(duration % 60)
     print(f"\n⏱️ Total execution time: {minutes}m {seconds}s")
+    
+    # Run report: per-stage timings + counters (1 JSON line per run)
+    report = run_metrics.write_run_report(
+        mode='online' if is_connection_healthy() else 'offline', workers=workers,
+        symbols_total=fetch_summary['total'], symbols_failed=fetch_summary['failed'],
+        symbols_skipped=fetch_summary['skipped'],
+        total_s=round(duration, 2)
+    )
+    if report:
+        slowest = sorted(report['stages'].items(), key=lambda kv: kv[1]['total_ms'], reverse=True)[:3]
+        summary = " | ".join(f"{stage} {st['total_ms'] / 1000:.1f}s" for stage, st in slowest)
+        print(f"📈 Run report: {run_metrics.RUN_REPORT} ({summary})")
 
 if __name__ == "__main__":
     main()
@@ -14,6 +14,9 @@ import config
 import time
 from core.engines.reversion_engine import MeanReversionEngine
 from core.engines.trend_engine import TrendMomentumEngine
+from core.data_cache import get_pattern_index_path, load_cache, load_tail
+from core.indicator_store import get_indicators, save_indicators
+from core import run_metrics
 
 # Initialize Engines
 engines = {
@@ -21,93 +24,240 @@ engines = {
     'TREND_MOMENTUM': TrendMomentumEngine()
 }
 
-def analyze_asset(df, symbol=None, exchange=None, fixed_threshold=None, engine_type=None):
+# Pre-screen tail: last bar (fixed threshold) / 252-bar rolling SD + slack (dynamic)
+PRESCREEN_DYNAMIC_BARS = 260
+# Dynamic SD from a tail window may differ from the full-history rolling SD in
+# the last float bits → only screen out moves clearly below the threshold
+PRESCREEN_TOLERANCE = 1e-9
+
+def _resolve_settings(symbol, exchange, fixed_threshold, engine_type):
+    """Engine type + engine settings for a symbol (group config fills what the caller didn't pass)."""
+    # Determine Engine to use
+    # Priority: 1. passed engine_type, 2. config based on symbol, 3. Default (MEAN_REVERSION)
+    selected_engine_type = engine_type
+    settings = {'fixed_threshold': fixed_threshold, 'exchange': exchange or ''}
+    
+    if not selected_engine_type and symbol:
+        # Look up engine in config ASSET_GROUPS
+        for group_name, group_config in config.ASSET_GROUPS.items():
+            asset_symbols = [a['symbol'] for a in group_config['assets']]
+            if symbol in asset_symbols:
+                selected_engine_type = group_config.get('engine')
+                # Inherit settings from group if not explicitly passed
+                if settings.get('fixed_threshold') is None:
+                    settings['fixed_threshold'] = group_config.get('fixed_threshold')
+                
+                # V4.2: Explicitly pass the market floor (min_threshold)
+                settings['min_threshold'] = group_config.get('min_threshold')
+                
+                # V6.2: Enforce strict minimum of 30 matches for all markets
+                settings['min_matches'] = config.MIN_MATCHES_THRESHOLD
+
+                # Inherit exchange from config if not explicitly passed
+                if not exchange:
+                    for a in group_config['assets']:
+                        if a['symbol'] == symbol:
+                            settings['exchange'] = a.get('exchange', '')
+                            break
+                break
+    
+    # Fallback if no group found
+    if 'min_matches' not in settings:
+        settings['min_matches'] = config.MIN_MATCHES_THRESHOLD
+    
+    return selected_engine_type or 'MEAN_REVERSION', settings
+
+
+def _format_result(res, symbol, close, open_price, total_bars):
+    """Engine result → report row (close / open of the analyzed bar)."""
+    is_up = (res['forecast'] == 'UP')
+    prob_val = res['prob']
+    
+    return {
+        'status': 'MATCH_FOUND',
+        'symbol': symbol or 'Unknown',
+        'price': close,
+        'is_tradeable': res['is_tradeable'],
+        'acc_score': prob_val,
+        'rr_score': res.get('rr', 1.0),
+        'change_pct': ((close - open_price) / open_price) * 100,
+        'pattern': res['pattern'],
+        'forecast_dir': 1 if is_up else -1,
+        'forecast_label': res['forecast'],
+        'strategy_name': f"{res['engine']} (VOTING)",
+        'confidence': (prob_val - 50) * 2,
+        'total_p': res.get('total_p', 0),
+        'total_n': res.get('total_n', 0),
+        'avg_return': res.get('avg_return', 0.0) * 100,
+        'total_events': res.get('total_events', 0),
+        'winning_count': res.get('winning_count', 0),
+        'stats': res.get('winning_count', 0), # Map to stats for dashboard
+        'breakdown': res.get('breakdown', ''),
+        'threshold': res.get('threshold', 0),
+        'total_bars': total_bars
+    }
+
+
+def analyze_asset(df, symbol=None, exchange=None, fixed_threshold=None, engine_type=None, persist_index=False,
+                  cache_symbol=None):
     """
     Router function that delegates analysis to the appropriate specialized engine.
+    
+    persist_index=True keeps the pattern index next to the symbol's cache file
+    so the next run only counts the newly appended bars (fixed threshold only),
+    and reads ADX / SMA / rolling SD from the symbol's indicator store.
+    cache_symbol: cache key df was loaded under when it differs from symbol
+    (e.g. the per-interval stream caches); settings are still looked up by symbol.
     """
     try:
         if df is None:
             return []
             
         # V4.9.5: Ensure only clean (filtered) bars are counted and analyzed
-        df = df.dropna()
+        # (only copy when needed: memory-mapped cache views stay zero-copy)
+        if df.isna().values.any():
+            df = df.dropna()
         
         if len(df) < 50:
             return []
             
-        # Determine Engine to use
-        # Priority: 1. passed engine_type, 2. config based on symbol, 3. Default (MEAN_REVERSION)
-        selected_engine_type = engine_type
-        settings = {'fixed_threshold': fixed_threshold, 'exchange': exchange or ''}
+        selected_engine_type, settings = _resolve_settings(symbol, exchange, fixed_threshold, engine_type)
         
-        if not selected_engine_type and symbol:
-            # Look up engine in config ASSET_GROUPS
-            for group_name, group_config in config.ASSET_GROUPS.items():
-                asset_symbols = [a['symbol'] for a in group_config['assets']]
-                if symbol in asset_symbols:
-                    selected_engine_type = group_config.get('engine')
-                    # Inherit settings from group if not explicitly passed
-                    if settings.get('fixed_threshold') is None:
-                        settings['fixed_threshold'] = group_config.get('fixed_threshold')
-                    
-                    # V4.2: Explicitly pass the market floor (min_threshold)
-                    settings['min_threshold'] = group_config.get('min_threshold')
-                    
-                    # V6.2: Enforce strict minimum of 30 matches for all markets
-                    settings['min_matches'] = config.MIN_MATCHES_THRESHOLD
-
-                    # Inherit exchange from config if not explicitly passed
-                    if not exchange:
-                        for a in group_config['assets']:
-                            if a['symbol'] == symbol:
-                                settings['exchange'] = a.get('exchange', '')
-                                break
-                    break
+        # Incremental pattern index lives next to the cache file (df must be the cached series)
+        if persist_index and symbol and settings.get('exchange'):
+            cache_key = cache_symbol or symbol
+            settings['pattern_index_path'] = get_pattern_index_path(cache_key, settings['exchange'])
+            with run_metrics.timed('indicators'):
+                settings['indicators'] = get_indicators(df, cache_key, settings['exchange'])
         
-        # Fallback if no group found
-        if 'min_matches' not in settings:
-            settings['min_matches'] = config.MIN_MATCHES_THRESHOLD
-        
-        selected_engine_type = selected_engine_type or 'MEAN_REVERSION'
         engine = engines.get(selected_engine_type, engines['MEAN_REVERSION'])
         
         # Delegate to specialized engine
-        engine_results = engine.analyze(df, symbol, settings)
+        with run_metrics.timed('engine'):
+            engine_results = engine.analyze(df, symbol, settings)
+        save_indicators(settings.get('indicators'))   # keys the engine read for the first time
         
         # Post-process results for reporting consistency
-        formatted_results = []
-        for res in engine_results:
-            is_up = (res['forecast'] == 'UP')
-            prob_val = res['prob']
-            
-            formatted_results.append({
-                'status': 'MATCH_FOUND',
-                'symbol': symbol or 'Unknown',
-                'price': df['close'].iloc[-1],
-                'is_tradeable': res['is_tradeable'],
-                'acc_score': prob_val,
-                'rr_score': res.get('rr', 1.0),
-                'change_pct': ((df['close'].iloc[-1] - df['open'].iloc[-1]) / df['open'].iloc[-1]) * 100,
-                'pattern': res['pattern'],
-                'forecast_dir': 1 if is_up else -1,
-                'forecast_label': res['forecast'],
-                'strategy_name': f"{res['engine']} (VOTING)",
-                'confidence': (prob_val - 50) * 2,
-                'total_p': res.get('total_p', 0),
-                'total_n': res.get('total_n', 0),
-                'avg_return': res.get('avg_return', 0.0) * 100,
-                'total_events': res.get('total_events', 0),
-                'winning_count': res.get('winning_count', 0),
-                'stats': res.get('winning_count', 0), # Map to stats for dashboard
-                'breakdown': res.get('breakdown', ''),
-                'threshold': res.get('threshold', 0),
-                'total_bars': len(df)
-            })
-            
-        return formatted_results
+        return [_format_result(res, symbol, df['close'].iloc[-1], df['open'].iloc[-1], len(df)) for res in engine_results]
 
     except Exception as e:
         print(f"❌ Error in modular analysis for {symbol}: {e}")
         import traceback
         traceback.print_exc()
         return []
+
+def prescreen_asset(symbol, exchange, fixed_threshold=None, engine_type=None):
+    """
+    Tail-only pre-screen of a cached symbol: is the last bar a signal day?
+    
+    Reads only the tail of the cache (last bar for a fixed threshold, the last
+    PRESCREEN_DYNAMIC_BARS bars for the dynamic SD threshold) and applies the
+    engines' first gate (|today's move| < threshold → no forecast).
+    Returns False only when analyze_asset would certainly return [];
+    True when the full history has to be analyzed (signal day, no cache, or
+    NaN bars in the tail that dropna() would shift).
+    """
+    selected_engine_type, settings = _resolve_settings(symbol, exchange, fixed_threshold, engine_type)
+    engine = engines.get(selected_engine_type, engines['MEAN_REVERSION'])
+    is_fixed = settings.get('fixed_threshold') is not None
+    n_tail = 1 if is_fixed else PRESCREEN_DYNAMIC_BARS
+    
+    with run_metrics.timed('prescreen'):
+        tail = load_tail(symbol, exchange, n_tail)
+        if tail is None or tail.empty or tail.isna().values.any():
+            return True
+        
+        pct_change = (tail['close'] - tail['open']) / tail['open']
+        effective_std, _ = engine._threshold(pct_change, settings)
+        current_std = float(np.asarray(effective_std, dtype=np.float64)[-1])
+        if not is_fixed:
+            current_std *= 1 - PRESCREEN_TOLERANCE
+        quiet = abs(pct_change.iloc[-1]) < current_std
+    
+    run_metrics.count('prescreen.quiet' if quiet else 'prescreen.pass')
+    return not quiet
+
+def analyze_cached_asset(symbol, exchange, fixed_threshold=None, engine_type=None, persist_index=False):
+    """
+    Analyze straight from the symbol's cache file, memory-mapped.
+    Used by main.py --workers: every process maps the same file (shared page
+    cache) instead of receiving a pickled DataFrame copy.
+    A tail-only pre-screen runs first: quiet bars return [] without loading
+    the full history.
+    Returns None if the symbol has no cache.
+    """
+    if not prescreen_asset(symbol, exchange, fixed_threshold, engine_type):
+        return []
+    df = load_cache(symbol, exchange, mmap=True)
+    if df is None or df.empty:
+        return None
+    return analyze_asset(df, symbol=symbol, exchange=exchange, fixed_threshold=fixed_threshold,
+                         engine_type=engine_type, persist_index=persist_index)
+
+def analyze_group(frames, symbols, exchanges=None, fixed_threshold=None, engine_type=None, persist_index=False):
+    """
+    Group-level analyze_asset: symbols that resolve to the same engine settings
+    are analyzed together as one (symbols × bars) matrix when the engine
+    supports it (Mean Reversion, fixed threshold). Everything else goes through
+    analyze_asset one symbol at a time (persist_index applies to those).
+
+    Returns one analyze_asset result list per input frame (same order).
+    """
+    exchanges = exchanges or [None] * len(frames)
+    results = [[] for _ in frames]
+    batches = {}
+
+    for pos, (df, symbol, exchange) in enumerate(zip(frames, symbols, exchanges)):
+        if df is None:
+            continue
+        if df.isna().values.any():
+            df = df.dropna()
+        if len(df) < 50:
+            continue
+        selected_engine_type, settings = _resolve_settings(symbol, exchange, fixed_threshold, engine_type)
+        engine = engines.get(selected_engine_type, engines['MEAN_REVERSION'])
+        if not hasattr(engine, 'analyze_group') or settings.get('fixed_threshold') is None:
+            results[pos] = analyze_asset(df, symbol=symbol, exchange=exchange, fixed_threshold=fixed_threshold,
+                                         engine_type=engine_type, persist_index=persist_index)
+            continue
+        batch_key = (selected_engine_type, float(settings['fixed_threshold']), settings['min_matches'])
+        batches.setdefault(batch_key, (engine, settings, []))[2].append((pos, df))
+
+    for engine, settings, members in batches.values():
+        try:
+            with run_metrics.timed('engine'):
+                group_results = engine.analyze_group([df for _, df in members], settings)
+        except Exception as e:
+            print(f"❌ Error in group analysis ({len(members)} symbols): {e}")
+            import traceback
+            traceback.print_exc()
+            continue
+        for (pos, df), engine_results in zip(members, group_results):
+            results[pos] = [_format_result(res, symbols[pos], df['close'].iloc[-1], df['open'].iloc[-1], len(df))
+                            for res in engine_results]
+
+    return results
+
+def replay_asset(df, symbol=None, exchange=None, fixed_threshold=None, engine_type=None, start=None):
+    """
+    Point-in-time replay of analyze_asset over history.
+    
+    Returns [(bar_time, results)] for every bar from `start` (position, default:
+    first bar analyze_asset would accept) to the last bar, where results is what
+    analyze_asset(df.iloc[:t + 1]) returns — same engine, same voting, but one
+    pattern index build for the whole series (O(n) instead of O(n²)).
+    """
+    if df is None:
+        return []
+    if df.isna().values.any():
+        df = df.dropna()
+    
+    selected_engine_type, settings = _resolve_settings(symbol, exchange, fixed_threshold, engine_type)
+    engine = engines.get(selected_engine_type, engines['MEAN_REVERSION'])
+    
+    close = df['close'].to_numpy()
+    open_price = df['open'].to_numpy()
+    return [
+        (df.index[t], [_format_result(res, symbol, close[t], open_price[t], t + 1) for res in engine_results])
+        for t, engine_results in engine.replay(df, symbol, settings, start=start or 0)
+    ]
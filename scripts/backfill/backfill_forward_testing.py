@@ -12,10 +12,15 @@ backfill_forward_testing.py — Reconstruct Forward Testing from a Given Date
   3. สำหรับแต่ละ trading day (Feb 12 → yesterday):
      a. คำนวณ threshold (20d SD, 252d SD, floor)
      b. สร้าง active pattern จาก signals ล่าสุด (Dynamic Lookback)
-     c. ค้นหา pattern ที่ตรงใน master stats → Best Fit Selection
+     c. โหวตจาก suffix ทุกตัวที่อยู่ใน master stats (Average of Winning Patterns)
      d. เช็ค actual N+1 return
      e. เขียนลง performance_log.csv (Anti-Overlapping: 1 result/stock/day)
 
+V9 (Vectorized): ขั้น 3 ทำทีเดียวทุกวันต่อ stock (ไม่วน iloc รายวัน)
+  - encode signals ครั้งเดียว → integer key (pattern_key) ของทุก suffix ทุก scan day
+  - join กับ master stats ที่ pack เป็น array ตาม key (ไม่มี dict / iterrows)
+  - รวม records ทุก stock แล้วเขียน CSV ครั้งเดียว
+
 Usage:
   python scripts/backfill_forward_testing.py
   python scripts/backfill_forward_testing.py --start-date 2026-02-12
@@ -28,7 +33,6 @@ import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from collections import defaultdict
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
@@ -38,6 +42,8 @@ load_dotenv()
 from tvDatafeed import TvDatafeed, Interval
 import config
 from core.data_cache import get_data_with_cache
+from core.engines.base_engine import SIGNAL_UP, SIGNAL_NEUTRAL, WARMUP_BARS, encode_signals
+from core.engines.pattern_index import pattern_key, key_to_pattern
 
 # Fix encoding
 if sys.platform == 'win32':
@@ -60,6 +66,9 @@ COLUMNS = [
 MIN_MATCHES = config.MIN_MATCHES_THRESHOLD
 MIN_PROB = config.MIN_PROB_THRESHOLD
 
+# Dynamic Lookback: scan bar + 7 bars back → active pattern ยาวสุด 8 ตัว
+MAX_PATTERN_LEN = 8
+
 # Market config (Standardized to 0.5% floor globally)
 MARKET_FLOORS = {
     'GROUP_A_THAI':       0.005,
@@ -86,7 +95,11 @@ MARKET_DIRECTION = {
 
 
 def load_master_stats():
-    """โหลด Master Stats CSV เป็น lookup dict: {symbol: [{pattern, count, ...}]}"""
+    """
+    โหลด Master Stats CSV เป็น lookup: {symbol: stats table}
+    stats table = dict ของ arrays ที่ index ด้วย pattern_key (ยาวไม่เกิน MAX_PATTERN_LEN)
+    → join กับ active patterns ทุกวันได้ด้วย fancy indexing ทีเดียว
+    """
     if not os.path.exists(MASTER_STATS):
         print(f"❌ Master stats not found: {MASTER_STATS}")
         sys.exit(1)
@@ -96,23 +109,46 @@ def load_master_stats():
     df['Symbol'] = df['Symbol'].astype(str)
     print(f"📊 Loaded master stats: {len(df)} rows, {df['Symbol'].nunique()} symbols")
 
-    # Build lookup: symbol → list of {pattern, count, ...}
-    lookup = defaultdict(list)
-    for _, row in df.iterrows():
-        lookup[row['Symbol']].append({
-            'pattern': row['Pattern'],
-            'count': row['Count'],
-            'category': row.get('Category', 'Unknown'),
-            'pattern_name': row.get('Pattern_Name', 'Unknown'),
-            'bars': row.get('Bars', 0),
-            'max_streak_pos': row.get('Max_Streak_Pos', 0),
-            'max_streak_neg': row.get('Max_Streak_Neg', 0),
-            # New Stats (V8.0 Pure Stats)
-            'next_up': row.get('Next_Up', 0),
-            'next_down': row.get('Next_Down', 0),
-            'next_neutral': row.get('Next_Neutral', 0),
-            'reliability': row.get('Reliability', 0.0)
-        })
+    symbols = df['Symbol'].unique()
+    # เฉพาะ pattern +/- ที่ active pattern มีโอกาสตรง (ซ้ำ → แถวหลังสุดชนะ เหมือน dict เดิม)
+    df = df[df['Pattern'].astype(str).str.fullmatch(rf'[+-]{{1,{MAX_PATTERN_LEN}}}')]
+    df = df.drop_duplicates(subset=['Symbol', 'Pattern'], keep='last')
+
+    size = 1 << (MAX_PATTERN_LEN + 1)
+    keys = df['Pattern'].map(pattern_key).to_numpy(dtype=np.int64)
+    counts = df['Count'].to_numpy(dtype=np.float64)
+    # New Stats (V8.0 Pure Stats): คอลัมน์ที่ไม่มี → 0
+    next_up = (df['Next_Up'] if 'Next_Up' in df else pd.Series(0, index=df.index)).to_numpy(dtype=np.float64)
+    next_down = (df['Next_Down'] if 'Next_Down' in df else pd.Series(0, index=df.index)).to_numpy(dtype=np.float64)
+    bars = (df['Bars'] if 'Bars' in df else pd.Series(0, index=df.index)).fillna(0).to_numpy(dtype=np.float64)
+
+    # Pattern-level winner (count < MIN_MATCHES / เสมอ → ไม่โหวต)
+    eligible = ~(counts < MIN_MATCHES)
+    up_win = eligible & (next_up > next_down)
+    down_win = eligible & (next_down > next_up)
+    total_events = next_up + next_down
+    with np.errstate(divide='ignore', invalid='ignore'):
+        up_prob = np.where(total_events > 0, next_up / total_events * 100, 0.0)
+        down_prob = np.where(total_events > 0, next_down / total_events * 100, 0.0)
+
+    symbol_rows = df.groupby('Symbol', sort=False).indices
+    lookup = {}
+    for symbol in symbols:
+        rows = symbol_rows.get(symbol, np.empty(0, dtype=np.int64))
+        k = keys[rows]
+        table = {
+            'up_win': np.zeros(size, dtype=bool), 'down_win': np.zeros(size, dtype=bool),
+            'next_up': np.zeros(size), 'next_down': np.zeros(size),
+            'up_prob': np.zeros(size), 'down_prob': np.zeros(size), 'bars': np.zeros(size),
+        }
+        table['up_win'][k] = up_win[rows]
+        table['down_win'][k] = down_win[rows]
+        table['next_up'][k] = next_up[rows]
+        table['next_down'][k] = next_down[rows]
+        table['up_prob'][k] = up_prob[rows]
+        table['down_prob'][k] = down_prob[rows]
+        table['bars'][k] = bars[rows]
+        lookup[symbol] = table
 
     return lookup
 
@@ -132,118 +168,116 @@ def calculate_threshold(pct_change, floor, fixed=False):
     return effective
 
 
-def get_active_pattern(pct_change, effective_std, end_idx, max_length=7):
+def active_pattern_keys(signals, ends, max_length=MAX_PATTERN_LEN):
     """
-    Dynamic Lookback: scan backward from end_idx
-    สร้าง active pattern จาก signals ล่าสุด
-    หยุดเมื่อเจอ neutral day
-    Anti-Overlapping: ได้ pattern เดียวต่อ stock
+    Dynamic Lookback สำหรับทุก scan bar พร้อมกัน:
+    scan ถอยหลังจาก bar `ends` สูงสุด max_length bars หยุดเมื่อเจอ neutral day (รวม NaN)
+    → int64 array (len(ends), max_length): คอลัมน์ j = pattern_key ของ suffix ยาว j+1
+      (0 = suffix นี้ไม่มี, คอลัมน์สุดท้ายที่ไม่ใช่ 0 = active pattern เต็ม)
     """
-    signals = []
-    for i in range(end_idx, max(end_idx - max_length - 1, -1), -1):
-        if i < 0:
-            break
-        ret = pct_change.iloc[i]
-        thresh = effective_std.iloc[i]
-
-        if pd.isna(ret) or pd.isna(thresh):
-            break
-
-        if ret > thresh:
-            signals.insert(0, '+')
-        elif ret < -thresh:
-            signals.insert(0, '-')
-        else:
-            break  # neutral = จุดตัด
-
-    if not signals:
-        return None
-    return ''.join(signals)
-
-
-def select_best_fit(active_pattern, symbol_stats, min_count=3):
-    """
-    Best Fit Selection (V8.0 — Highest Probability):
-    System generates all valid sub-patterns from the active pattern (longest -> shortest).
-    It checks Master Stats for each.
-    
-    Selection Criteria:
-    1. Count >= min_count (Screening)
-    2. Highest 'Reliability' (Probability)
-    3. Tie-breaker: Longest Pattern
-    """
-    if not active_pattern or not symbol_stats:
-        return None
-
-    # Build lookup
-    stats_lookup = {s['pattern']: s for s in symbol_stats}
-    
-    candidates = []
-
-    # Collect all valid candidates
-    for length in range(len(active_pattern), 0, -1):
-        sub = active_pattern[-length:]
-        if sub not in stats_lookup:
-            continue
-        
-        info = stats_lookup[sub]
-        
-        # 1. Screen by Count
-        if info['count'] < min_count:
-            continue
-            
-        # 2. Calculate Reliability (if not present, estimate)
-        # Use 'reliability' from CSV if available, else calc from Next_Up/Next_Down
-        if 'reliability' in info and info['reliability'] > 0:
-            prob = info['reliability']
-        else:
-            # Fallback calc
-            total = info.get('next_up', 0) + info.get('next_down', 0) + info.get('next_neutral', 0)
-            if total > 0:
-                # Reliability = Max(Up, Down) / Total
-                prob = max(info.get('next_up', 0), info.get('next_down', 0)) / total * 100
-            else:
-                prob = 0
-        
-        candidates.append({
-            'pattern': sub,
-            'info': info,
-            'prob': prob,
-            'length': length
-        })
-    
-    if not candidates:
-        return None
-        
-    # Sort Candidates:
-    # 1. Probability (Descending)
-    # 2. Length (Descending) - Tie-breaker
-    candidates.sort(key=lambda x: (-x['prob'], -x['length']))
-    
-    # Return best candidate's stats
-    return candidates[0]['info']
-
-
-def determine_forecast(pattern_stats):
+    ends = np.asarray(ends, dtype=np.int64)
+    keys = np.zeros((len(ends), max_length), dtype=np.int64)
+    bits = np.zeros(len(ends), dtype=np.int64)
+    alive = np.ones(len(ends), dtype=bool)
+    for j in range(max_length):
+        pos = ends - j
+        codes = np.where(pos >= 0, signals[np.maximum(pos, 0)], SIGNAL_NEUTRAL)
+        alive &= codes != SIGNAL_NEUTRAL
+        # bar ที่เก่าที่สุดของ suffix = bit สูงสุด (ตาม pattern_key)
+        bits |= (codes == SIGNAL_UP).astype(np.int64) << j
+        keys[:, j] = np.where(alive, bits | (1 << (j + 1)), 0)
+    return keys
+
+
+def backfill_symbol(df, stats_table, floor, start_date, end_date, display_name, exchange, last_update):
     """
-    Determine direction from Master Stats (Pure Stats Logic)
-    Case 1: Up > Down -> Forecast UP
-    Case 2: Down > Up -> Forecast DOWN
-    Case 3: Equal -> NEUTRAL (No trade)
+    Vectorized backfill ของ 1 stock → (DataFrame ของ records ตาม COLUMNS, จำนวน trading days ในช่วง)
+    ผลเหมือน per-day loop เดิมทุกแถว: active pattern → โหวต suffix ที่อยู่ใน master stats
+    → average of winning patterns → เช็คกับ close ของ trading day ถัดไป (N+1)
     """
-    if not pattern_stats:
-        return None
-
-    n_up = pattern_stats.get('next_up', 0)
-    n_down = pattern_stats.get('next_down', 0)
-    
-    # Simple Majority Vote
-    if n_up > n_down:
-        return 'UP'
-    elif n_down > n_up:
-        return 'DOWN'
-    
-    return None # Neutral or Zero
+    close = df['close'].to_numpy()
+    pct_change = df['close'].pct_change()
+    # V4.6.9: Force FIXED=True for all markets per mentor standardization
+    effective_std = calculate_threshold(pct_change, floor, fixed=True)
+    signals = encode_signals(pct_change, effective_std)
+    pct_arr = pct_change.to_numpy()
+    std_arr = np.asarray(effective_std, dtype=np.float64)
+
+    # Trading days (index เรียงแล้ว) → bar สุดท้ายของแต่ละวัน = scan bar
+    days = df.index.normalize()
+    day_last = np.flatnonzero(np.r_[days[1:] != days[:-1], True])
+    day_dates = days[day_last]
+    in_range = (day_dates >= pd.Timestamp(start_date)) & (day_dates <= pd.Timestamp(end_date))
+    n_days = int(in_range.sum())
+
+    # scan day ต้องมี trading day ถัดไป (target_date) + warmup + signal วันนี้ไม่ neutral
+    day_pos = np.flatnonzero(in_range[:-1])
+    scan_idx = day_last[day_pos]
+    keep = (scan_idx >= WARMUP_BARS) & (signals[scan_idx] != SIGNAL_NEUTRAL)
+    day_pos, scan_idx = day_pos[keep], scan_idx[keep]
+    target_idx = day_last[day_pos + 1]
+
+    # 1-2. Active pattern keys → join master stats (suffix ยาว → สั้น)
+    keys = active_pattern_keys(signals, scan_idx)[:, ::-1]
+    up_win = stats_table['up_win'][keys]
+    down_win = stats_table['down_win'][keys]
+
+    # 3. รวมค่าพลังโหวต (Aggregation based on winners)
+    total_up_win = np.where(up_win, stats_table['next_up'][keys], 0).sum(axis=1)
+    total_down_win = np.where(down_win, stats_table['next_down'][keys], 0).sum(axis=1)
+
+    # 4. ตัดสินฝั่งชนะ (Tie = Skip)
+    is_up = total_up_win > total_down_win
+    decided = is_up | (total_down_win > total_up_win)
+    winners = np.where(is_up[:, None], up_win, down_win)
+    win_prob = np.where(is_up[:, None], stats_table['up_prob'][keys], stats_table['down_prob'][keys])
+    n_winners = winners.sum(axis=1)
+
+    sel = decided
+    if not sel.any():
+        return pd.DataFrame(columns=COLUMNS), n_days
+    keys, winners, win_prob, n_winners = keys[sel], winners[sel], win_prob[sel], n_winners[sel]
+    scan_idx, target_idx, day_pos = scan_idx[sel], target_idx[sel], day_pos[sel]
+    is_up = is_up[sel]
+
+    # Probability: Average of Individual Probabilities (Consensus)
+    prob = np.round(np.where(winners, win_prob, 0).sum(axis=1) / n_winners, 1)
+    total_bars = (np.where(winners, stats_table['bars'][keys], 0).sum(axis=1) / n_winners).astype(np.int64)
+    count = np.maximum(total_up_win[sel], total_down_win[sel]).astype(np.int64)
+    forecast = np.where(is_up, 'UP', 'DOWN')
+
+    # 6. ผลจริง (actual) = close วัน target เทียบ close วัน scan
+    price_scan = close[scan_idx]
+    price_actual = close[target_idx]
+    actual_change = (price_actual - price_scan) / price_scan * 100
+    thresh_pct = std_arr[scan_idx] * 100
+    actual = np.where(actual_change > thresh_pct, 'UP', np.where(actual_change < -thresh_pct, 'DOWN', 'NEUTRAL'))
+    # 7. Rule 4: NEUTRAL = LOSS
+    correct = (actual == forecast).astype(np.int64)
+    change_pct = pct_arr[scan_idx] * 100
+
+    records = pd.DataFrame({
+        'scan_date': day_dates[day_pos].strftime('%Y-%m-%d'),
+        'target_date': day_dates[day_pos + 1].strftime('%Y-%m-%d'),
+        'symbol': display_name,
+        'exchange': exchange,
+        'pattern': [key_to_pattern(k) for k in keys.max(axis=1)],
+        'forecast': forecast,
+        'prob': prob, # ค่า SCORE (Average)
+        'conf': prob, # โชว์ SCORE ซ้ำในช่อง CONF
+        'stats': count,
+        'price_at_scan': np.round(price_scan, 2),
+        'change_pct': np.round(change_pct, 2),
+        'threshold': np.round(thresh_pct, 2),
+        'avg_return': np.round(change_pct, 2),
+        'total_bars': total_bars,
+        'actual': actual,
+        'price_actual': np.round(price_actual, 2),
+        'realized_change': np.round(actual_change, 2),
+        'correct': correct,
+        'last_update': last_update
+    }, columns=COLUMNS)
+    return records, n_days
 
 
 def main():
@@ -278,7 +312,7 @@ def main():
     os.makedirs(LOG_DIR, exist_ok=True)
 
     all_records = []
-    stats = {'predictions': 0, 'verified': 0, 'correct': 0, 'incorrect': 0}
+    last_update = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     total_assets = sum(len(g.get('assets', [])) for g in config.ASSET_GROUPS.values())
     asset_count = 0
 
@@ -300,11 +334,11 @@ def main():
             asset_count += 1
 
             # ตรวจว่า symbol อยู่ใน master stats ไหม
-            symbol_stats = master_stats.get(display_name, [])
-            if not symbol_stats:
+            symbol_stats = master_stats.get(display_name)
+            if symbol_stats is None:
                 # ลอง symbol ด้วย
-                symbol_stats = master_stats.get(symbol, [])
-            if not symbol_stats:
+                symbol_stats = master_stats.get(symbol)
+            if symbol_stats is None:
                 print(f"  ⏭️  [{asset_count}/{total_assets}] {display_name}: not in master stats")
                 continue
 
@@ -323,192 +357,19 @@ def main():
                     print(f"  ⏭️  [{asset_count}/{total_assets}] {display_name}: insufficient data ({len(df) if df is not None else 0} bars)")
                     continue
 
-                pct_change = df['close'].pct_change()
-                # V4.6.9: Force FIXED=True for all markets per mentor standardization
-                effective_std = calculate_threshold(pct_change, floor, fixed=True)
-
-                # หา trading days ในช่วงที่ต้องการ
-                dates = df.index.normalize().unique().sort_values()
-                mask = (dates >= pd.Timestamp(start_date)) & (dates <= pd.Timestamp(end_date))
-                trading_days = dates[mask].tolist()
+                # 3. ทุก trading day ของ stock นี้ในครั้งเดียว
+                records, n_days = backfill_symbol(
+                    df, symbol_stats, floor, start_date, end_date, display_name, exchange, last_update
+                )
 
-                if not trading_days:
+                if n_days == 0:
                     print(f"  ⏭️  [{asset_count}/{total_assets}] {display_name}: no trading days in range")
                     continue
 
-                symbol_predictions = 0
-
-                for scan_day in trading_days:
-                    # หา index ของ scan_day ใน df
-                    scan_mask = df.index.normalize() == scan_day
-                    scan_indices = df.index[scan_mask]
-                    if len(scan_indices) == 0:
-                        continue
-
-                    scan_idx = df.index.get_loc(scan_indices[-1])
-                    if isinstance(scan_idx, slice):
-                        scan_idx = scan_idx.stop - 1
-
-                    if scan_idx < 252:
-                        continue  # ต้อง warmup
-
-                    scan_date_str = scan_day.strftime('%Y-%m-%d')
-                    
-                    # 1. สร้าง active pattern (Dynamic Lookback)
-                    active_pattern = get_active_pattern(pct_change, effective_std, scan_idx)
-
-                    if not active_pattern:
-                        continue  # วันนี้ neutral → ไม่มี pattern
-
-                    # === FINAL LOGIC — AVERAGE OF WINNING PATTERNS ===
-                    
-                    # 2. สร้าง Suffixes ทั้งหมด (จากยาวไปสั้น)
-                    suffixes = []
-                    for i in range(len(active_pattern)):
-                        sub = active_pattern[i:]
-                        if sub:
-                            suffixes.append(sub)
-
-                    # 2. ค้นหาผู้ชนะราย Pattern (Pattern-Level Decision)
-                    pattern_stats_map = {s['pattern']: s for s in symbol_stats}
-                    p_winners = []
-                    n_winners = []
-                    
-                    for sub_pat in suffixes:
-                        if sub_pat not in pattern_stats_map:
-                            continue
-                            
-                        info = pattern_stats_map[sub_pat]
-                        if info['count'] < MIN_MATCHES:
-                            continue
-                            
-                        p_win_i = info.get('next_up', 0)
-                        n_win_i = info.get('next_down', 0)
-                        
-                        # Rule: เสมอ หรือไม่มีข้อมูลฝั่งชนะ -> ข้าม
-                        if p_win_i > n_win_i:
-                            p_winners.append({'count': p_win_i, 'total': info.get('bars', 0), 'pattern': sub_pat})
-                        elif n_win_i > p_win_i:
-                            n_winners.append({'count': n_win_i, 'total': info.get('bars', 0), 'pattern': sub_pat})
-
-                    if not p_winners and not n_winners:
-                        continue
-
-                    # 3. รวมค่าพลังโหวต (Aggregation based on winners)
-                    total_up_win = sum(d['count'] for d in p_winners)
-                    total_down_win = sum(d['count'] for d in n_winners)
-
-                    # 4. ตัดสินฝั่งชนะของวันนี้
-                    if total_up_win > total_down_win:
-                        winning_side = 'P'
-                        winning_patterns = p_winners
-                        forecast = 'UP'
-                    elif total_down_win > total_up_win:
-                        winning_side = 'N'
-                        winning_patterns = n_winners
-                        forecast = 'DOWN'
-                    else:
-                        continue # Tie = Skip
-                    
-                    # Probability Calculation: Average of Individual Probabilities (Consensus)
-                    pattern_probs = []
-                    for d in winning_patterns:
-                        # d contains: 'count' (win count), 'total' (total bars), 'pattern'
-                        # To find the true probability of this pattern we need its original up/down splits.
-                        info_d = pattern_stats_map[d['pattern']]
-                        total_events_i = info_d.get('next_up', 0) + info_d.get('next_down', 0)
-                        p_i = (d['count'] / total_events_i * 100) if total_events_i > 0 else 0
-                        pattern_probs.append(p_i)
-                    
-                    avg_prob = np.mean(pattern_probs) if pattern_probs else 0.0
-                    final_prob = avg_prob
-
-                    # บันทึกค่า
-                    prob = round(final_prob, 1)
-                    best_fit_pattern = suffixes[0]
-                    count = int(max(total_up_win, total_down_win))
-
-                    # 5. หา target_date (N+1)
-                    all_dates = dates.tolist()
-                    try:
-                        scan_day_idx = all_dates.index(scan_day)
-                    except ValueError:
-                        continue
-
-                    if scan_day_idx + 1 >= len(all_dates):
-                        continue
-
-                    target_day = all_dates[scan_day_idx + 1]
-                    target_date_str = target_day.strftime('%Y-%m-%d')
-
-                    # 6. หาผลจริง (actual)
-                    target_mask = df.index.normalize() == target_day
-                    target_data = df[target_mask]
-                    if target_data.empty:
-                        actual, price_actual = 'PENDING', None
-                    else:
-                        price_actual = target_data['close'].iloc[-1]
-                        price_scan = df['close'].iloc[scan_idx]
-                        actual_change = (price_actual - price_scan) / price_scan * 100
-
-                        thresh_pct = effective_std.iloc[scan_idx] * 100
-                        if actual_change > thresh_pct:
-                            actual = 'UP'
-                        elif actual_change < -thresh_pct:
-                            actual = 'DOWN'
-                        else:
-                            actual = 'NEUTRAL'
-
-                    # 7. เช็ค correct/incorrect
-                    correct = None
-                    if actual not in ('PENDING',):
-                        if actual == 'NEUTRAL':
-                            correct = 0  # Rule 4: NEUTRAL = LOSS
-                        elif actual == forecast:
-                            correct = 1
-                        else:
-                            correct = 0
-
-                    # Price & threshold info
-                    price_scan = df['close'].iloc[scan_idx]
-                    change_pct = pct_change.iloc[scan_idx] * 100 if not pd.isna(pct_change.iloc[scan_idx]) else 0
-                    threshold_pct = effective_std.iloc[scan_idx] * 100
-
-                    record = {
-                        'scan_date': scan_date_str,
-                        'target_date': target_date_str,
-                        'symbol': display_name,
-                        'exchange': exchange,
-                        'pattern': best_fit_pattern,
-                        'forecast': forecast,
-                        'prob': prob, # ค่า SCORE (Average)
-                        'conf': prob, # โชว์ SCORE ซ้ำในช่อง CONF
-                        'stats': count,
-                        'price_at_scan': round(price_scan, 2),
-                        'change_pct': round(change_pct, 2),
-                        'threshold': round(threshold_pct, 2),
-                        'avg_return': round(change_pct, 2),
-                        'total_bars': int(np.mean([d['total'] for d in winning_patterns])),
-                        'actual': actual,
-                        'price_actual': round(price_actual, 2) if price_actual else None,
-                        'realized_change': round(actual_change, 2) if 'actual_change' in locals() else 0.0,
-                        'correct': correct,
-                        'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    }
-
-                    all_records.append(record)
-                    stats['predictions'] += 1
-                    symbol_predictions += 1
-
-                    if correct is not None:
-                        stats['verified'] += 1
-                        if correct == 1:
-                            stats['correct'] += 1
-                        else:
-                            stats['incorrect'] += 1
-
+                symbol_predictions = len(records)
                 if symbol_predictions > 0:
-                    print(f"  ✅ [{asset_count}/{total_assets}] {display_name:<12} | {symbol_predictions} predictions | {len(trading_days)} days")
+                    all_records.append(records)
+                    print(f"  ✅ [{asset_count}/{total_assets}] {display_name:<12} | {symbol_predictions} predictions | {n_days} days")
                 else:
                     sys.stdout.write(f"\r  ⏭️  [{asset_count}/{total_assets}] {display_name:<12} | no signal in range   ")
                     sys.stdout.flush()
@@ -519,10 +380,17 @@ def main():
             # time.sleep(0.1) # Reduced for speed during verification
 
     # ==========================================
-    # Save to performance_log.csv
+    # Save to performance_log.csv (bulk write ครั้งเดียว)
     # ==========================================
     if all_records:
-        df_new = pd.DataFrame(all_records, columns=COLUMNS)
+        df_new = pd.concat(all_records, ignore_index=True)
+        verified_mask = df_new['correct'].notna()
+        stats = {
+            'predictions': len(df_new),
+            'verified': int(verified_mask.sum()),
+            'correct': int((df_new['correct'] == 1).sum()),
+            'incorrect': int((verified_mask & (df_new['correct'] != 1)).sum()),
+        }
 
         # Anti-overlapping: 1 record per (scan_date, symbol)
         # ถ้ามีหลาย pattern ใน 1 วัน → เลือก count สูงสุด
@@ -535,8 +403,8 @@ def main():
             df_existing = pd.read_csv(LOG_FILE)
             if not df_existing.empty:
                 merge_cols = ['scan_date', 'symbol', 'pattern', 'target_date']
-                existing_keys = set(df_existing[merge_cols].apply(tuple, axis=1))
-                new_keys = df_new[merge_cols].apply(tuple, axis=1)
+                existing_keys = pd.MultiIndex.from_frame(df_existing[merge_cols])
+                new_keys = pd.MultiIndex.from_frame(df_new[merge_cols])
                 df_new = df_new[~new_keys.isin(existing_keys)]
                 df_combined = pd.concat([df_existing, df_new], ignore_index=True)
             else:
@@ -10,6 +10,7 @@ Usage:
     python scripts/backtest.py PTT SET            # หุ้นเดียว
     python scripts/backtest.py NVDA NASDAQ 300    # ระบุ test bars
     python scripts/backtest.py --quick            # ทดสอบ 4 หุ้นหลัก
+    python scripts/backtest.py PTT SET --replay   # replay engine จริง (forecast เดียวกับ main.py ทุก bar)
 """
 
 import sys
@@ -32,6 +33,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 from tvDatafeed import TvDatafeed, Interval
 import config
 from core.data_cache import get_data_with_cache
+from core.indicator_store import get_indicators, save_indicators
+from core.engines.base_engine import SIGNAL_UP, SIGNAL_DOWN, SIGNAL_NEUTRAL, encode_signals
+from core.engines.pattern_index import pattern_key
 # REMOVED: BasePatternEngine import (V6.1 - No longer using Trailing Stop)
 
 # Load environment variables
@@ -103,6 +107,76 @@ def get_market_key(exchange):
     return 'DEFAULT'
 
 
+SIGNAL_CHARS = {SIGNAL_UP: '+', SIGNAL_DOWN: '-', SIGNAL_NEUTRAL: None}
+
+# Pattern stats columns (build_pattern_stats): total, n_up, n_down, sum_up, sum_down (abs)
+PSTAT_TOTAL, PSTAT_N_UP, PSTAT_N_DOWN, PSTAT_SUM_UP, PSTAT_SUM_DOWN = range(5)
+
+
+def build_pattern_stats(signals, next_ret, start, stop, min_len=3, max_len=8):
+    """
+    V15: Vectorized training phase
+    
+    ทุก window ยาว min_len..max_len ที่จบที่ bar i (start <= i < stop) → ตัด bar neutral ทิ้ง
+    → integer pattern key (pattern_key) แล้วรวมสถิติด้วย np.bincount
+    
+    Args:
+        signals: int8 array จาก encode_signals (core.engines.base_engine)
+        next_ret: array ผลตอบแทน bar ถัดไป (next_ret[i] = return ของ bar i+1)
+    
+    Returns:
+        dict: {pattern_key: (total, n_up, n_down, sum_up, sum_down)}
+    """
+    ends = np.arange(start, stop)
+    rets = np.asarray(next_ret, dtype=float)[ends]
+    valid = ~np.isnan(rets)
+    ends, rets = ends[valid], rets[valid]
+    if len(ends) == 0:
+        return {}
+    
+    # ต่อ pattern ไปทางอดีตทีละ bar: char ที่เก่ากว่าอยู่ bit สูงกว่า (เหมือน pattern_key)
+    n_chars = np.zeros(len(ends), dtype=np.int64)
+    bits = np.zeros(len(ends), dtype=np.int64)
+    keys = np.zeros((len(ends), max_len - min_len + 1), dtype=np.int64)
+    for length in range(1, max_len + 1):
+        sig = signals[ends - length + 1]
+        bits |= (sig == SIGNAL_UP).astype(np.int64) << n_chars
+        n_chars += (sig != SIGNAL_NEUTRAL)
+        if length >= min_len:
+            keys[:, length - min_len] = np.where(n_chars > 0, (1 << n_chars) | bits, 0)
+    
+    # row-major ravel → ลำดับเดียวกับ loop เดิม (bar ก่อน แล้วความยาว)
+    keys = keys.ravel()
+    rets = np.repeat(rets, max_len - min_len + 1)
+    keep = keys > 0
+    keys, rets = keys[keep], rets[keep]
+    
+    uniq, inv = np.unique(keys, return_inverse=True)
+    up = rets > 0
+    down = rets < 0
+    n = len(uniq)
+    total = np.bincount(inv, minlength=n)
+    n_up = np.bincount(inv[up], minlength=n)
+    n_down = np.bincount(inv[down], minlength=n)
+    sum_up = np.bincount(inv[up], weights=rets[up], minlength=n)
+    sum_down = np.bincount(inv[down], weights=-rets[down], minlength=n)
+    return dict(zip(uniq.tolist(), zip(total.tolist(), n_up.tolist(), n_down.tolist(),
+                                       sum_up.tolist(), sum_down.tolist())))
+
+
+def directional_stats(stats, direction):
+    """(win_count, avg_win, avg_loss) ของ pattern สำหรับทิศที่จะเทรด (loss รวม return = 0)"""
+    total = stats[PSTAT_TOTAL]
+    if direction == 1:
+        n_win, sum_win, sum_loss = stats[PSTAT_N_UP], stats[PSTAT_SUM_UP], stats[PSTAT_SUM_DOWN]
+    else:
+        n_win, sum_win, sum_loss = stats[PSTAT_N_DOWN], stats[PSTAT_SUM_DOWN], stats[PSTAT_SUM_UP]
+    n_loss = total - n_win
+    avg_win = sum_win / n_win if n_win else 0
+    avg_loss = sum_loss / n_loss if n_loss else 0
+    return n_win, avg_win, avg_loss
+
+
 def calc_atr(high, low, close, period=14):
     """Calculate Average True Range - ใช้สำหรับ ATR-based SL/TP"""
     tr1 = high - low
@@ -284,6 +358,150 @@ def simulate_trade_with_rm(df, entry_idx, direction, stop_loss_pct=2.0, take_pro
     return {'return_pct': 0 - total_commission, 'exit_reason': 'UNKNOWN', 'hold_days': 0, 'sl_used': actual_sl_pct}
 
 
+def simulate_trades_with_rm(df, entry_idx, direction, stop_loss_pct=2.0, take_profit_pct=4.0, max_hold_days=5,
+                            atr_series=None, atr_sl_mult=None, atr_tp_mult=None,
+                            use_trailing_stop=False, trail_activation_pct=1.5, trail_distance_pct=50.0,
+                            production_mode=False, slippage_pct=0.0, commission_pct=0.0, gap_risk=1.0):
+    """
+    V15: Batch version of simulate_trade_with_rm (ผลเหมือนกันทุก trade)
+    
+    entry_idx / direction เป็น array → ประเมิน SL / TP / trailing / max-hold ของทุก trade พร้อมกัน
+    (loop ตามวันที่ถือ ไม่ใช่ตาม trade) บน high/low/close/ATR arrays ที่คำนวณไว้ครั้งเดียว
+    
+    Returns:
+        dict of arrays: {'return_pct', 'exit_reason', 'hold_days', 'sl_used'} (ลำดับเดียวกับ entry_idx)
+    """
+    entry_idx = np.asarray(entry_idx, dtype=np.int64)
+    direction = np.asarray(direction, dtype=np.int64)
+    n_trades = len(entry_idx)
+    n = len(df)
+    close = df['close'].to_numpy(dtype=float)
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    has_open = 'open' in df.columns
+    long_side = direction == 1
+    
+    # V11.0: Entry price logic
+    entry_price = close[entry_idx]
+    if production_mode and has_open:
+        next_open = entry_idx + 1 < n
+        open_ = df['open'].to_numpy(dtype=float)
+        slipped = open_[np.minimum(entry_idx + 1, n - 1)] * np.where(
+            long_side, 1 + slippage_pct / 100, 1 - slippage_pct / 100)
+        entry_price = np.where(next_open, slipped, entry_price)
+    
+    # Determine actual SL/TP percentages
+    if atr_series is not None and atr_sl_mult is not None and atr_tp_mult is not None:
+        atr_val = np.asarray(atr_series, dtype=float)[entry_idx].copy()
+        bad = np.isnan(atr_val) | (atr_val <= 0)
+        if bad.any():
+            # Fallback (rare: ATR warm-up) → same per-trade logic as simulate_trade_with_rm
+            pct = df['close'].pct_change()
+            for t in np.flatnonzero(bad):
+                e = int(entry_idx[t])
+                val = entry_price[t] * 0.015
+                if e >= 20:
+                    price_changes = pct.iloc[max(0, e-20):e+1].dropna()
+                    if len(price_changes) > 0:
+                        std_val = price_changes.std()
+                        if not pd.isna(std_val) and std_val > 0:
+                            val = entry_price[t] * std_val * 1.5
+                if pd.isna(val) or val <= 0:
+                    val = entry_price[t] * 0.015
+                atr_val[t] = val
+        actual_sl_pct = np.minimum((atr_val * atr_sl_mult / entry_price) * 100, 7.0)
+        actual_tp_pct = np.minimum((atr_val * atr_tp_mult / entry_price) * 100, 15.0)
+    else:
+        actual_sl_pct = np.full(n_trades, stop_loss_pct, dtype=float)
+        actual_tp_pct = np.full(n_trades, take_profit_pct, dtype=float)
+    
+    effective_gap_sl = actual_sl_pct * gap_risk if production_mode else actual_sl_pct
+    exit_slip = slippage_pct if production_mode else 0.0
+    total_commission = commission_pct if production_mode else 0.0
+    has_sl = actual_sl_pct != 0   # truthiness (NaN → True เหมือน scalar version)
+    has_tp = actual_tp_pct != 0
+    
+    peak_profit_pct = np.zeros(n_trades)
+    trailing_active = np.zeros(n_trades, dtype=bool)
+    trailing_stop_level = -actual_sl_pct
+    
+    return_pct = np.full(n_trades, 0 - total_commission, dtype=float)
+    exit_reason = np.full(n_trades, 'UNKNOWN', dtype=object)
+    hold_days = np.zeros(n_trades, dtype=np.int64)
+    open_trade = np.ones(n_trades, dtype=bool)
+    
+    def close_out(mask, ret, reason, held):
+        return_pct[mask] = ret[mask] if np.ndim(ret) else ret
+        exit_reason[mask] = reason
+        hold_days[mask] = held
+        open_trade[mask] = False
+    
+    start_day = 2 if (production_mode and has_open) else 1
+    last_day = start_day + max_hold_days - 1
+    for day in range(start_day, start_day + max_hold_days):
+        if not open_trade.any():
+            break
+        bar = entry_idx + day
+        
+        # End of data → exit at last available close
+        past_end = open_trade & (bar >= n)
+        if past_end.any():
+            last_idx = np.minimum(bar - 1, n - 1)
+            ret = (close[last_idx] / entry_price - 1) * 100 * direction
+            ret -= (exit_slip + total_commission)
+            close_out(past_end, ret, 'END_DATA', day - start_day)
+        
+        live = open_trade.copy()
+        if not live.any():
+            break
+        bar_c = np.minimum(bar, n - 1)
+        current_high = high[bar_c]
+        current_low = low[bar_c]
+        current_close = close[bar_c]
+        
+        intraday_worst_pct = np.where(long_side, (current_low / entry_price - 1) * 100,
+                                      -(current_high / entry_price - 1) * 100)
+        intraday_best_pct = np.where(long_side, (current_high / entry_price - 1) * 100,
+                                     -(current_low / entry_price - 1) * 100)
+        close_pct = np.where(long_side, (current_close / entry_price - 1) * 100,
+                             -(current_close / entry_price - 1) * 100)
+        
+        # Update peak profit (same semantics as max(peak, best))
+        peak_profit_pct = np.where(live & (intraday_best_pct > peak_profit_pct), intraday_best_pct, peak_profit_pct)
+        
+        # Trailing stop
+        if use_trailing_stop:
+            activate = live & (peak_profit_pct >= trail_activation_pct)
+            trailing_active |= activate
+            level = peak_profit_pct * (1 - trail_distance_pct / 100)
+            level = np.where(0.0 > level, 0.0, level)
+            trailing_stop_level = np.where(activate, level, trailing_stop_level)
+            hit = activate & (intraday_worst_pct <= trailing_stop_level)
+            exit_pct = np.maximum(trailing_stop_level - exit_slip, 0.0) - total_commission
+            close_out(hit, exit_pct, 'TRAILING_STOP', day - start_day + 1)
+            live &= ~hit
+        
+        # Regular SL check (only if trailing not active)
+        sl_hit = live & ~trailing_active & has_sl & (intraday_worst_pct <= -actual_sl_pct)
+        close_out(sl_hit, -effective_gap_sl - exit_slip - total_commission, 'STOP_LOSS', day - start_day + 1)
+        live &= ~sl_hit
+        
+        # TP check
+        tp_hit = live & has_tp & (intraday_best_pct >= actual_tp_pct)
+        close_out(tp_hit, actual_tp_pct - exit_slip - total_commission, 'TAKE_PROFIT', day - start_day + 1)
+        live &= ~tp_hit
+        
+        # Last day: exit at close
+        if day == last_day and live.any():
+            trail_exit = live & trailing_active & (close_pct < trailing_stop_level)
+            close_out(trail_exit, np.maximum(trailing_stop_level - exit_slip, 0.0) - total_commission,
+                      'TRAILING_STOP', day - start_day + 1)
+            max_hold = live & ~trail_exit
+            close_out(max_hold, close_pct - (exit_slip + total_commission), 'MAX_HOLD', day - start_day + 1)
+    
+    return {'return_pct': return_pct, 'exit_reason': exit_reason, 'hold_days': hold_days, 'sl_used': actual_sl_pct}
+
+
 def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None, min_stats=None, verbose=True, **kwargs):
     """
     Backtest หุ้นเดียว พร้อมแสดงช่วงวันที่
@@ -307,6 +525,11 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
     # Get interval from kwargs (for intraday support)
     interval = kwargs.get('interval', Interval.in_daily)
     
+    # Sweep mode: DataFrame ที่โหลดไว้แล้ว (ไม่ต้อง fetch ซ้ำทุก combo)
+    if kwargs.get('data') is not None:
+        df = kwargs['data']
+        max_retries = 0
+    
     for attempt in range(max_retries):
         try:
             df = get_data_with_cache(
@@ -315,7 +538,8 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
                 exchange=exchange,
                 interval=interval,
                 full_bars=5000,
-                delta_bars=50
+                delta_bars=50,
+                mmap=True  # Cache-served data: zero-copy memory-mapped view
             )
             if df is not None and len(df) >= 250:
                 break
@@ -368,6 +592,9 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
     volume = df['volume']
     pct_change = close.pct_change()
     
+    # V15: ATR / SMA / rolling SD from the symbol's indicator store (shared with the engines)
+    indicators = get_indicators(df, symbol, exchange, interval)
+    
     # REMOVED: Indicators (V6.1 - Back to simple system)
     # System should be simple: just history pattern matching, no indicators
     
@@ -475,58 +702,48 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
         short_window = 20   # 20 วัน
         long_window = 252   # 252 วัน (~1 ปี)
     
-    # Always calculate effective_std (needed for Hybrid Volatility strategy)
-    short_std = pct_change.rolling(window=short_window).std()
-    long_std = pct_change.rolling(window=long_window).std()
-    effective_std = np.maximum(short_std, long_std.fillna(0))
-    effective_std = np.maximum(effective_std, current_floor)
-    
-    if 'fixed_threshold' in kwargs and kwargs['fixed_threshold'] is not None:
-         fixed_val = float(kwargs['fixed_threshold']) / 100.0
-         threshold = pd.Series(fixed_val, index=pct_change.index)
-         if verbose:
-             print(f"   🔧 Using fixed_threshold: {kwargs['fixed_threshold']}% (={fixed_val})")
+    MIN_LEN = 3 
+    MAX_LEN = 8 # REVERTED: 14 was over-fitting. 8 is standard for high accuracy.
+    
+    # Sweep mode: combos ที่ต่างกันแค่ RM params ใช้ threshold / signals / pattern_stats ชุดเดียวกัน
+    shared = kwargs.get('shared')
+    prep_key = ('train', train_end, threshold_multiplier, kwargs.get('fixed_threshold'),
+                short_window, long_window, current_floor)
+    if shared is not None and prep_key in shared:
+        effective_std, threshold, signals, raw_patterns, pattern_stats = shared[prep_key]
     else:
-        # V4.2: Max(20d SD, 252d SD, Market Floor)
-        threshold = effective_std * threshold_multiplier
-        if verbose:
-            print(f"   🔧 Using dynamic threshold (SD-based): multiplier={threshold_multiplier}")
-            print(f"   ⚠️ WARNING: No fixed_threshold provided! Using dynamic threshold instead.")
-    
-    # Convert to +/- pattern (Base strings for window-based extraction)
-    # Note: We keep the full list including None to maintain time-alignment
-    raw_patterns = []
-    for i in range(len(pct_change)):
-        if pd.isna(pct_change.iloc[i]) or pd.isna(threshold.iloc[i]):
-            raw_patterns.append(None)
-        elif pct_change.iloc[i] > threshold.iloc[i]:
-            raw_patterns.append('+')
-        elif pct_change.iloc[i] < -threshold.iloc[i]:
-            raw_patterns.append('-')
+        # Always calculate effective_std (needed for Hybrid Volatility strategy)
+        if indicators is not None:
+            short_std = indicators.rolling_std(short_window, 'close')
+            long_std = indicators.rolling_std(long_window, 'close')
         else:
-            raw_patterns.append(None)
+            short_std = pct_change.rolling(window=short_window).std()
+            long_std = pct_change.rolling(window=long_window).std()
+        effective_std = np.maximum(short_std, long_std.fillna(0))
+        effective_std = np.maximum(effective_std, current_floor)
+    
+        if 'fixed_threshold' in kwargs and kwargs['fixed_threshold'] is not None:
+             fixed_val = float(kwargs['fixed_threshold']) / 100.0
+             threshold = pd.Series(fixed_val, index=pct_change.index)
+             if verbose:
+                 print(f"   🔧 Using fixed_threshold: {kwargs['fixed_threshold']}% (={fixed_val})")
+        else:
+            # V4.2: Max(20d SD, 252d SD, Market Floor)
+            threshold = effective_std * threshold_multiplier
+            if verbose:
+                print(f"   🔧 Using dynamic threshold (SD-based): multiplier={threshold_multiplier}")
+                print(f"   ⚠️ WARNING: No fixed_threshold provided! Using dynamic threshold instead.")
     
-    pattern_stats = {}
-    MIN_LEN = 3 
-    MAX_LEN = 8 # REVERTED: 14 was over-fitting. 8 is standard for high accuracy.
+        # Convert to +/- pattern (Base strings for window-based extraction)
+        # Note: We keep the full list including None to maintain time-alignment
+        signals = encode_signals(pct_change, threshold)
+        raw_patterns = [SIGNAL_CHARS[sig] for sig in signals.tolist()]
     
-    # 1. TRAINING PHASE
-    for i in range(MAX_LEN, train_end - 1):
-        next_ret = pct_change.iloc[i+1]
-        if pd.isna(next_ret): continue
-
-        for length in range(MIN_LEN, MAX_LEN + 1):
-            if i - length + 1 < 0: continue
-            
-            # Optimized Window-based Pattern Extraction
-            window_slice = raw_patterns[i-length+1 : i+1]
-            pat = ''.join([p for p in window_slice if p is not None])
-            
-            if not pat: continue
-            
-            if pat not in pattern_stats:
-                pattern_stats[pat] = []
-            pattern_stats[pat].append(next_ret)
+        # 1. TRAINING PHASE (V15: vectorized, integer pattern keys + np.bincount)
+        next_ret = np.append(pct_change.to_numpy(dtype=float)[1:], np.nan)
+        pattern_stats = build_pattern_stats(signals, next_ret, MAX_LEN, train_end - 1, MIN_LEN, MAX_LEN)
+        if shared is not None:
+            shared[prep_key] = (effective_std, threshold, signals, raw_patterns, pattern_stats)
     
     # ====== V10.0: BALANCED SWEET SPOT PARAMETERS ======
     # Key Changes from V9.0:
@@ -539,7 +756,12 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
     is_tw_market = any(ex in exchange.upper() for ex in ['TWSE', 'TW'])
     
     # Calculate ATR for all markets (needed for ATR-based RM)
-    atr_series = calc_atr(high, low, close, period=14)
+    if shared is not None and 'atr' in shared:
+        atr_series = shared['atr']
+    else:
+        atr_series = indicators.atr(14) if indicators is not None else calc_atr(high, low, close, period=14)
+        if shared is not None:
+            shared['atr'] = atr_series
     
     # V9.0: Position Sizing - Risk 2% per trade
     RISK_PER_TRADE = kwargs.get('risk_per_trade', 0.02)  # 2% of capital
@@ -735,13 +957,23 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
     avg_volume = volume.rolling(20).mean() if production_mode else None
     
     # SMA for Regime-Aware Direction (Hybrid Strategy)
-    sma50 = close.rolling(50).mean()
-    sma200 = close.rolling(200).mean()
+    if shared is not None and 'sma' in shared:
+        sma50, sma200 = shared['sma']
+    else:
+        if indicators is not None:
+            sma50, sma200 = indicators.sma(50), indicators.sma(200)
+        else:
+            sma50 = close.rolling(50).mean()
+            sma200 = close.rolling(200).mean()
+        if shared is not None:
+            shared['sma'] = (sma50, sma200)
+    save_indicators(indicators)   # keys computed above for the first time: one write
     
     # 2. TESTING PHASE
     total_predictions = 0
     correct_predictions = 0
     predictions = []
+    signals_to_trade = []  # (i, dir, forecast, prob, pattern, strategy) → batch RM simulation
     skipped_low_volume = 0
     
     # Set min_prob ก่อน loop เพื่อหลีกเลี่ยงการ set ซ้ำๆ (แก้บัค debug print ซ้ำ)
@@ -855,24 +1087,16 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
             
             window_slice = raw_patterns[i-length+1 : i+1]
             pat = ''.join([p for p in window_slice if p is not None])
-            if not pat or pat not in pattern_stats: continue
+            if not pat: continue
+            hist_stats = pattern_stats.get(pattern_key(pat))
+            if hist_stats is None: continue
             
-            hist_returns = pattern_stats[pat]
-            total = len(hist_returns)
+            total = hist_stats[PSTAT_TOTAL]
             if total < min_stats: continue
             
             # Calculate stats for the TRADED direction specifically
-            if intended_dir == 1:
-                wins = [abs(r) for r in hist_returns if r > 0]
-                losses = [abs(r) for r in hist_returns if r <= 0]
-            else: # intended_dir == -1
-                wins = [abs(r) for r in hist_returns if r < 0]
-                losses = [abs(r) for r in hist_returns if r >= 0]
-            
-            win_count = len(wins)
+            win_count, avg_win, avg_loss = directional_stats(hist_stats, intended_dir)
             cand_prob = (win_count / total) * 100
-            avg_win = np.mean(wins) if wins else 0
-            avg_loss = np.mean(losses) if losses else 0
             rr = avg_win / avg_loss if avg_loss > 0 else 0
             p_win = win_count / total
             expectancy = p_win * avg_win - (1 - p_win) * avg_loss
@@ -927,75 +1151,78 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
             strategy = "MEAN_REVERSION"
         else:
             strategy = "REGIME_AWARE"
-
-        # ====== V9.0: Balanced Risk-Managed Exit ======
-        # All markets: Trailing Stop + Position Sizing
-        # Taiwan: ATR 1.0x SL / 6.5x TP (V12.5: flexible, auto system) + Trailing
-        # China/HK: ATR 1.0x SL / 4.0x TP (V13.5: flexible, auto system) + Trailing
-        # US: ATR 1.0x SL / 5.0x TP (V10.1: flexible, auto system) + Trailing + Quality filter
-        # Thai: Fixed SL 1.5% / TP 3.5% + Trailing
-        
-        if use_risk_mgmt:
-            # V11.0: Common production parameters for all RM calls
-            prod_params = dict(
-                production_mode=production_mode,
-                slippage_pct=prod_slippage,
-                commission_pct=prod_commission,
-                gap_risk=prod_gap_risk
+        
+        # Debug: Check ATR availability for Thai market
+        if use_risk_mgmt and is_thai_market and verbose and i == train_end:
+            print(f"   [DEBUG] RM_USE_ATR: {RM_USE_ATR}, atr_series is not None: {atr_series is not None}")
+            if atr_series is not None:
+                print(f"   [DEBUG] ATR series length: {len(atr_series)}, non-null count: {atr_series.notna().sum()}")
+                if i < len(atr_series):
+                    print(f"   [DEBUG] ATR at index {i}: {atr_series.iloc[i] if not pd.isna(atr_series.iloc[i]) else 'NaN'}")
+        
+        # V15: เก็บ signal ไว้ก่อน → simulate RM exits ของทุก trade พร้อมกันหลัง loop
+        signals_to_trade.append((i, final_dir, final_forecast, confidence, best_match['pattern'], strategy))
+    
+    # ====== V9.0: Balanced Risk-Managed Exit ======
+    # All markets: Trailing Stop + Position Sizing
+    # Taiwan: ATR 1.0x SL / 6.5x TP (V12.5: flexible, auto system) + Trailing
+    # China/HK: ATR 1.0x SL / 4.0x TP (V13.5: flexible, auto system) + Trailing
+    # US: ATR 1.0x SL / 5.0x TP (V10.1: flexible, auto system) + Trailing + Quality filter
+    # Thai: Fixed SL 1.5% / TP 3.5% + Trailing
+    trade_results = None
+    if use_risk_mgmt and signals_to_trade:
+        entry_idx = [sig[0] for sig in signals_to_trade]
+        entry_dir = [sig[1] for sig in signals_to_trade]
+        
+        # V11.0: Common production parameters for all RM calls
+        prod_params = dict(
+            production_mode=production_mode,
+            slippage_pct=prod_slippage,
+            commission_pct=prod_commission,
+            gap_risk=prod_gap_risk
+        )
+        
+        if RM_USE_ATR and atr_series is not None:
+            trade_results = simulate_trades_with_rm(
+                df, entry_idx, entry_dir,
+                max_hold_days=RM_MAX_HOLD,
+                atr_series=atr_series,
+                atr_sl_mult=RM_ATR_SL,
+                atr_tp_mult=RM_ATR_TP,
+                use_trailing_stop=RM_USE_TRAILING,
+                trail_activation_pct=RM_TRAIL_ACTIVATE,
+                trail_distance_pct=RM_TRAIL_DISTANCE,
+                **prod_params
             )
-            
-            # Debug: Check ATR availability for Thai market
-            if is_thai_market and verbose and i == train_end:
-                print(f"   [DEBUG] RM_USE_ATR: {RM_USE_ATR}, atr_series is not None: {atr_series is not None}")
-                if atr_series is not None:
-                    print(f"   [DEBUG] ATR series length: {len(atr_series)}, non-null count: {atr_series.notna().sum()}")
-                    if i < len(atr_series):
-                        print(f"   [DEBUG] ATR at index {i}: {atr_series.iloc[i] if not pd.isna(atr_series.iloc[i]) else 'NaN'}")
-            
-            if RM_USE_ATR and atr_series is not None:
-                trade_result = simulate_trade_with_rm(
-                    df, i, final_dir,
-                    max_hold_days=RM_MAX_HOLD,
-                    atr_series=atr_series,
-                    atr_sl_mult=RM_ATR_SL,
-                    atr_tp_mult=RM_ATR_TP,
-                    use_trailing_stop=RM_USE_TRAILING,
-                    trail_activation_pct=RM_TRAIL_ACTIVATE,
-                    trail_distance_pct=RM_TRAIL_DISTANCE,
-                    **prod_params
-                )
+        else:
+            # Fallback to fixed SL/TP if ATR not available or RM_USE_ATR is False
+            if RM_USE_ATR and (atr_series is None or RM_STOP_LOSS is None):
+                # ATR-based requested but ATR not available or RM_STOP_LOSS is None - use fallback fixed values
+                fallback_sl = 1.5
+                fallback_tp = 3.5
             else:
-                # Fallback to fixed SL/TP if ATR not available or RM_USE_ATR is False
-                if RM_USE_ATR and (atr_series is None or RM_STOP_LOSS is None):
-                    # ATR-based requested but ATR not available or RM_STOP_LOSS is None - use fallback fixed values
-                    if is_thai_market:
-                        # Use original fixed values as fallback for Thai market
-                        fallback_sl = 1.5
-                        fallback_tp = 3.5
-                    else:
-                        fallback_sl = 1.5
-                        fallback_tp = 3.5
-                else:
-                    # Use provided fixed values
-                    fallback_sl = RM_STOP_LOSS if RM_STOP_LOSS is not None else 1.5
-                    fallback_tp = RM_TAKE_PROFIT if RM_TAKE_PROFIT is not None else 3.5
-                
-                trade_result = simulate_trade_with_rm(
-                    df, i, final_dir,
-                    stop_loss_pct=fallback_sl,
-                    take_profit_pct=fallback_tp,
-                    max_hold_days=RM_MAX_HOLD,
-                    use_trailing_stop=RM_USE_TRAILING,
-                    trail_activation_pct=RM_TRAIL_ACTIVATE,
-                    trail_distance_pct=RM_TRAIL_DISTANCE,
-                    **prod_params
-                )
+                # Use provided fixed values
+                fallback_sl = RM_STOP_LOSS if RM_STOP_LOSS is not None else 1.5
+                fallback_tp = RM_TAKE_PROFIT if RM_TAKE_PROFIT is not None else 3.5
             
-            raw_return_pct = trade_result['return_pct']
+            trade_results = simulate_trades_with_rm(
+                df, entry_idx, entry_dir,
+                stop_loss_pct=fallback_sl,
+                take_profit_pct=fallback_tp,
+                max_hold_days=RM_MAX_HOLD,
+                use_trailing_stop=RM_USE_TRAILING,
+                trail_activation_pct=RM_TRAIL_ACTIVATE,
+                trail_distance_pct=RM_TRAIL_DISTANCE,
+                **prod_params
+            )
+    
+    for t, (i, final_dir, final_forecast, confidence, pattern, strategy) in enumerate(signals_to_trade):
+        if trade_results is not None:
+            raw_return_pct = trade_results['return_pct'][t]
             # V13.5: For ATR-based, sl_used is the actual SL% calculated from ATR
-            sl_used = trade_result.get('sl_used', RM_STOP_LOSS if RM_STOP_LOSS is not None else 1.0)
-            exit_reason = trade_result['exit_reason']
-            hold_days = trade_result['hold_days']
+            sl_used = trade_results['sl_used'][t]
+            exit_reason = trade_results['exit_reason'][t]
+            hold_days = int(trade_results['hold_days'][t])
             
             # V9.0: Position Sizing - Scale return by position size
             # Risk 2% of capital per trade → position_pct = risk / SL
@@ -1022,7 +1249,7 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
 
         predictions.append({
             'date': df.index[i],
-            'pattern': best_match['pattern'],
+            'pattern': pattern,
             'forecast': final_forecast,
             'prob': confidence,
             'actual': actual_label,
@@ -1085,6 +1312,95 @@ def backtest_single(tv, symbol, exchange, n_bars=200, threshold_multiplier=None,
     return result
 
 
+
+def replay_single(tv, symbol, exchange, n_bars=200, verbose=True, **kwargs):
+    """
+    V16: Point-in-time replay ของ production engine (processor.replay_asset)
+    
+    backtest_single ใช้ pattern_stats จาก train set + rule คนละแบบกับ aggregate_voting
+    → replay ใช้ engine ตัวเดียวกับ main.py: ทุก bar ใน test window ได้ forecast
+    เดียวกับที่ analyze_asset ทายในวันนั้น (index สร้างครั้งเดียว, O(n) ไม่ใช่ O(n²))
+    ตรวจผลแบบ verify_forecast: close bar ถัดไป vs close bar ที่ทาย
+    
+    Returns:
+        dict: total / correct / accuracy (+ tradeable only), detailed_predictions
+    """
+    import processor
+    
+    if verbose:
+        print(f"\n🔁 REPLAY: {symbol} ({exchange})")
+        print("=" * 50)
+    
+    df = kwargs.get('data')
+    if df is None:
+        df = get_data_with_cache(
+            tv=tv, symbol=symbol, exchange=exchange,
+            interval=kwargs.get('interval', Interval.in_daily),
+            full_bars=5000, delta_bars=50, mmap=True
+        )
+    if df is None or len(df) < 300:
+        if verbose:
+            print(f"❌ Not enough data for {symbol}")
+        return None
+    df = df.dropna()
+    
+    # Forecast bars: the last n_bars bars that already have their N+1 bar
+    n_bars = min(n_bars, len(df) - 300)
+    start = len(df) - 1 - n_bars
+    started = time.perf_counter()
+    replay = processor.replay_asset(df, symbol=symbol, exchange=exchange,
+                                    fixed_threshold=kwargs.get('fixed_threshold'), start=start)
+    elapsed = time.perf_counter() - started
+    
+    close = df['close'].to_numpy(dtype=float)
+    positions = df.index.get_indexer([bar_time for bar_time, _ in replay])
+    predictions = []
+    for pos, (bar_time, results) in zip(positions, replay):
+        if not results or pos >= len(df) - 1:
+            continue
+        res = results[0]
+        actual_return = (close[pos + 1] - close[pos]) / close[pos] * 100
+        actual = 'UP' if actual_return > 0 else 'DOWN' if actual_return < 0 else 'NEUTRAL'
+        predictions.append({
+            'date': bar_time.strftime('%Y-%m-%d %H:%M') if kwargs.get('interval') else bar_time.strftime('%Y-%m-%d'),
+            'pattern': res['pattern'],
+            'forecast': res['forecast_label'],
+            'prob': res['acc_score'],
+            'actual': actual,
+            'actual_return': round(actual_return, 4),
+            'trader_return': round(actual_return * res['forecast_dir'], 4),
+            'correct': int(res['forecast_label'] == actual),
+            'strategy': res['strategy_name'],
+            'is_tradeable': res['is_tradeable'],
+            'exit_reason': 'N+1',
+            'hold_days': 1,
+        })
+    
+    total = len(predictions)
+    correct = sum(p['correct'] for p in predictions)
+    tradeable = [p for p in predictions if p['is_tradeable']]
+    tradeable_correct = sum(p['correct'] for p in tradeable)
+    result = {
+        'symbol': symbol,
+        'exchange': exchange,
+        'bars': n_bars,
+        'total': total,
+        'correct': correct,
+        'accuracy': round(correct / total * 100, 1) if total else 0,
+        'tradeable_total': len(tradeable),
+        'tradeable_correct': tradeable_correct,
+        'tradeable_accuracy': round(tradeable_correct / len(tradeable) * 100, 1) if tradeable else 0,
+        'test_date_from': df.index[start].strftime('%Y-%m-%d'),
+        'test_date_to': df.index[-2].strftime('%Y-%m-%d'),
+        'replay_ms': round(elapsed * 1000, 1),
+        'detailed_predictions': predictions,
+    }
+    if verbose:
+        print(f"   Test: {result['test_date_from']} → {result['test_date_to']} ({n_bars} bars, replay {result['replay_ms']:.0f} ms)")
+        print(f"   Forecasts: {total} | Correct: {correct} | Accuracy: {result['accuracy']:.1f}%")
+        print(f"   Tradeable: {len(tradeable)} | Correct: {tradeable_correct} | Accuracy: {result['tradeable_accuracy']:.1f}%")
+    return result
+
 def save_trade_logs(trades, filename='trade_history.csv'):
     """
     Save list of trade dictionaries to CSV.
@@ -1129,7 +1445,176 @@ def save_trade_logs(trades, filename='trade_history.csv'):
         print(f"\n💾 Saved Trade Logs (APPEND): {log_path} ({len(df_trades)} trades)")
 
 
-def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=None, threshold_multiplier=None, production=False, fast_mode=False, **kwargs):
+def get_trade_log_suffix(group_name, group_config):
+    """logs/trade_history_<SUFFIX>.csv ของแต่ละ group"""
+    group_clean = group_name.replace(" ", "_").upper()
+    # Also check group_config description for better matching
+    group_desc = group_config.get('description', '').upper()
+    if 'US' in group_clean or 'US' in group_desc: return 'US'
+    elif 'THAI' in group_clean or 'THAI' in group_desc: return 'THAI'
+    elif 'CHINA' in group_clean or 'HK' in group_clean or 'CHINA' in group_desc or 'HK' in group_desc: return 'CHINA'
+    elif 'TAIWAN' in group_clean or 'TAIWAN' in group_desc: return 'TAIWAN'
+    elif 'GOLD' in group_clean or 'SILVER' in group_clean or 'METAL' in group_clean: return 'METALS'
+    return 'OTHER'
+
+
+# ===================================================================
+# --jobs N: process-pool backtest over cached data (sharded output)
+# ===================================================================
+SHARD_DIR = 'data/backtest_shards'
+
+
+def get_shard_path(group_name, symbol, exchange):
+    """
+    1 shard ต่อ symbol: data/backtest_shards/GROUP__EXCHANGE_SYMBOL.pkl
+    (symbol เดียวกันอาจอยู่หลาย group เช่น XAUUSD → ใส่ group ใน key ด้วย)
+    """
+    safe_symbol = str(symbol).replace('/', '_').replace('!', '_')
+    group_clean = group_name.replace(" ", "_").upper()
+    return os.path.join(SHARD_DIR, f"{group_clean}__{exchange}_{safe_symbol}.pkl")
+
+
+def _init_backtest_worker():
+    """Worker process: อ่านจาก cache เท่านั้น (main process refresh cache ไว้แล้ว)"""
+    from core.data_cache import set_connection_healthy
+    set_connection_healthy(False)
+
+
+def _backtest_shard_worker(task):
+    """
+    รัน backtest_single 1 symbol แล้วเขียน shard (atomic: tmp + os.replace)
+    
+    Returns:
+        tuple: (symbol, summary dict หรือ None, error message หรือ None)
+    """
+    import pickle
+    import contextlib
+    symbol = task['symbol']
+    try:
+        # backtest_single(verbose=False) ยังมี print บางจุด → ไม่ให้ปนกับ progress ของ main process
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = backtest_single(None, symbol, task['exchange'], verbose=False, **task['kwargs'])
+    except Exception as e:
+        return symbol, None, str(e)
+    
+    if not result:
+        return symbol, None, None
+    
+    result['group'] = task['group_name']
+    trade_logs = []
+    for trade in result.pop('detailed_predictions', []):
+        trade['symbol'] = symbol
+        trade['exchange'] = task['exchange']
+        trade['group'] = task['group_name']
+        trade_logs.append(trade)
+    
+    shard = {'result': result, 'trades': trade_logs, 'file_suffix': task['file_suffix']}
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    shard_path = get_shard_path(task['group_name'], symbol, task['exchange'])
+    tmp_path = f"{shard_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(shard, f)
+    os.replace(tmp_path, shard_path)
+    return symbol, {'total': result.get('total', 0), 'accuracy': result.get('accuracy', 0)}, None
+
+
+def merge_backtest_shards(output_file, shard_paths=None):
+    """
+    Merge shards → output_file (append ครั้งเดียว) + trade_history_<SUFFIX>.csv แล้วลบ shard
+    
+    shard_paths=None: merge ทุก shard ที่ค้างอยู่ (เช่น run ก่อนหน้าถูก interrupt)
+    
+    Returns:
+        list: result dicts ที่ merge แล้ว
+    """
+    import pickle
+    import glob
+    if shard_paths is None:
+        shard_paths = sorted(glob.glob(os.path.join(SHARD_DIR, '*.pkl')))
+    
+    results = []
+    trades_by_suffix = {}
+    merged_paths = []
+    for path in shard_paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                shard = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Skipping unreadable shard {path}: {e}")
+            continue
+        results.append(shard['result'])
+        trades_by_suffix.setdefault(shard['file_suffix'], []).extend(shard['trades'])
+        merged_paths.append(path)
+    
+    if not results:
+        return []
+    
+    df_results = pd.DataFrame(results)
+    if os.path.exists(output_file):
+        # Append ตาม header เดิม (result dict แต่ละแบบเรียง key ไม่เหมือนกัน)
+        header = list(pd.read_csv(output_file, nrows=0).columns)
+        df_results.reindex(columns=header).to_csv(output_file, mode='a', index=False, header=False)
+    else:
+        df_results.to_csv(output_file, index=False)
+    for file_suffix, trade_logs in trades_by_suffix.items():
+        save_trade_logs(trade_logs, filename=f'trade_history_{file_suffix}.csv')
+    for path in merged_paths:
+        os.remove(path)
+    return results
+
+
+def run_backtest_jobs(tv, tasks, jobs, output_file):
+    """
+    --jobs mode: refresh cache (prefetch_many, rate-limited) แล้วรัน backtest_single
+    ใน process pool บน cached data → 1 shard ต่อ symbol → merge ตามลำดับ task
+    
+    Returns:
+        list: result dicts (เหมือน all_results ของ loop ปกติ)
+    """
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from core.data_cache import is_connection_healthy, prefetch_many, tv_client_factory, flush_cache
+    
+    if not tasks:
+        return []
+    
+    # 1. Network: refresh cache ใน main process (workers ไม่ต่อ TradingView)
+    if is_connection_healthy():
+        print(f"\n🌐 Refreshing cache for {len(tasks)} symbols...")
+        assets = [{'symbol': t['symbol'], 'exchange': t['exchange'],
+                   'interval': t['kwargs'].get('interval', Interval.in_daily)} for t in tasks]
+        try:
+            asyncio.run(prefetch_many(tv, assets, Interval.in_daily, full_bars=5000, delta_bars=50,
+                                     tv_factory=tv_client_factory(tv)))
+        except Exception as e:
+            print(f"⚠️ Cache refresh failed ({e}) - using existing cache")
+    flush_cache()  # write-back cache → disk ก่อน workers อ่าน
+    
+    # 2. CPU: backtest_single ทุก core
+    print(f"⚙️ Backtesting {len(tasks)} symbols with {jobs} worker processes...")
+    done = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_backtest_worker) as pool:
+        futures = [pool.submit(_backtest_shard_worker, task) for task in tasks]
+        for future in as_completed(futures):
+            symbol, summary, error = future.result()
+            done += 1
+            prefix = f"   [{done}/{len(tasks)}] {symbol}..."
+            if error:
+                print(f"{prefix} ❌ Error: {error}")
+            elif summary is None:
+                print(f"{prefix} ❌ (No Data)")
+            elif summary['total'] > 0:
+                print(f"{prefix} ✅ {summary['accuracy']:.1f}% ({summary['total']} Trades)")
+            else:
+                print(f"{prefix} ✅ 0 Trades found")
+    
+    # 3. Merge shards ตามลำดับ config
+    return merge_backtest_shards(output_file, [get_shard_path(t['group_name'], t['symbol'], t['exchange']) for t in tasks])
+
+
+def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=None, threshold_multiplier=None, production=False, fast_mode=False, jobs=1, **kwargs):
     """
     Backtest ทุกหุ้นจาก config.py
     
@@ -1137,6 +1622,7 @@ def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=N
         n_bars: จำนวน test bars
         skip_intraday: ข้าม intraday (Gold/Silver) ไหม
         full_scan: If True, test ALL assets (no limit)
+        jobs: > 1 → process pool บน cached data (shard ต่อ symbol + merge, resume ได้)
     """
     print("\n" + "=" * 70)
     print("🔬 BACKTEST ALL STOCKS")
@@ -1153,6 +1639,12 @@ def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=N
     
     output_file = 'data/full_backtest_results.csv'
     processed_symbols = set()
+    pending_tasks = []  # --jobs mode: symbols to run in the process pool (config order)
+    
+    # --jobs mode: merge shards left by an interrupted run first → resume นับรวมด้วย
+    leftover = merge_backtest_shards(output_file)
+    if leftover:
+        print(f"📦 Merged {len(leftover)} result shard(s) from a previous run")
 
     # Load existing results to skip already-processed symbols (works for both --group and no --group)
     # This saves time by not re-running backtests for symbols that already have results
@@ -1226,6 +1718,20 @@ def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=N
 
         print(f"   📊 Processing {len(new_assets)} new symbols...")
         
+        if jobs > 1:
+            for asset in new_assets:
+                pending_tasks.append({
+                    'group_name': group_name,
+                    'symbol': asset['symbol'],
+                    'exchange': asset['exchange'],
+                    'file_suffix': get_trade_log_suffix(group_name, group_config),
+                    'kwargs': dict(kwargs, n_bars=n_bars, fixed_threshold=group_config.get('fixed_threshold'),
+                                   inverse_logic=group_config.get('inverse_logic', False),
+                                   threshold_multiplier=threshold_multiplier, min_adx=group_config.get('min_adx'),
+                                   production=production, engine=group_config.get('engine'))
+                })
+            continue
+        
         for i, asset in enumerate(new_assets):
             symbol = asset['symbol']
             exchange = asset['exchange']
@@ -1291,15 +1797,7 @@ def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=N
                         trade_logs.append(trade)
                     
                     # Log File per Group (Cleaner)
-                    group_clean = group_name.replace(" ", "_").upper()
-                    # Also check group_config description for better matching
-                    group_desc = group_config.get('description', '').upper()
-                    if 'US' in group_clean or 'US' in group_desc: file_suffix = 'US'
-                    elif 'THAI' in group_clean or 'THAI' in group_desc: file_suffix = 'THAI'
-                    elif 'CHINA' in group_clean or 'HK' in group_clean or 'CHINA' in group_desc or 'HK' in group_desc: file_suffix = 'CHINA'
-                    elif 'TAIWAN' in group_clean or 'TAIWAN' in group_desc: file_suffix = 'TAIWAN'
-                    elif 'GOLD' in group_clean or 'SILVER' in group_clean or 'METAL' in group_clean: file_suffix = 'METALS'
-                    else: file_suffix = 'OTHER'
+                    file_suffix = get_trade_log_suffix(group_name, group_config)
                     
                     log_file = f'logs/trade_history_{file_suffix}.csv'
                     save_trade_logs(trade_logs, filename=os.path.basename(log_file))
@@ -1323,6 +1821,9 @@ def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=N
                 base_delay = 3.0 if is_china else 1.0  # Normal delays
             time.sleep(base_delay)
     
+    if pending_tasks:
+        all_results.extend(run_backtest_jobs(tv, pending_tasks, jobs, output_file))
+    
     # Summary
     print("\n" + "=" * 70)
     if all_results:
@@ -1378,6 +1879,173 @@ def backtest_all(n_bars=200, skip_intraday=True, full_scan=False, target_group=N
     return None
 
 
+# ===================================================================
+# --sweep: parameter grid search (1 load + shared encodings per symbol)
+# ===================================================================
+SWEEP_OUTPUT = 'data/sweep_results.csv'
+
+# CLI name → backtest_single kwarg
+SWEEP_PARAM_ALIASES = {'multiplier': 'threshold_multiplier'}
+SWEEP_PARAMS = ['threshold_multiplier', 'min_stats', 'min_prob', 'stop_loss', 'take_profit', 'max_hold',
+                'trail_activate', 'trail_distance', 'atr_sl_mult', 'atr_tp_mult']
+SWEEP_INT_PARAMS = {'min_stats', 'max_hold'}
+
+
+def parse_sweep_grid(spec):
+    """
+    "multiplier=0.8,0.9,1.0;max_hold=5,7;atr_tp_mult=2.5,3.5" → {param: [values]}
+    
+    ชื่อ param เหมือน CLI flag (--multiplier, --max_hold, ...)
+    """
+    grid = {}
+    for part in spec.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        if '=' not in part:
+            raise ValueError(f"Invalid sweep entry '{part}' (expected name=v1,v2,...)")
+        name, values = part.split('=', 1)
+        name = SWEEP_PARAM_ALIASES.get(name.strip().lstrip('-'), name.strip().lstrip('-'))
+        if name not in SWEEP_PARAMS:
+            raise ValueError(f"Unknown sweep parameter '{name}' (choose from: multiplier, {', '.join(SWEEP_PARAMS[1:])})")
+        cast = int if name in SWEEP_INT_PARAMS else float
+        grid[name] = [cast(v) for v in values.split(',') if v.strip()]
+    return grid
+
+
+def _sweep_symbol_worker(task):
+    """
+    รันทุก combo ของ 1 symbol: โหลด cache ครั้งเดียว + shared dict
+    (threshold / signals / pattern_stats / ATR / SMA คำนวณครั้งเดียวต่อ threshold setting)
+    
+    Returns:
+        list: 1 row ต่อ combo
+    """
+    import contextlib
+    from core.data_cache import load_cache
+    df = load_cache(task['symbol'], task['exchange'], mmap=True)
+    if df is None or df.empty:
+        return []
+    
+    shared = {}
+    rows = []
+    for combo in task['combos']:
+        call_kwargs = dict(task['kwargs'], **combo)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result = backtest_single(None, task['symbol'], task['exchange'], verbose=False,
+                                         data=df, shared=shared, **call_kwargs)
+        except Exception as e:
+            result = None
+            print(f"⚠️ {task['symbol']} {combo}: {e}")
+        if not result:
+            continue
+        trades = result.get('detailed_predictions', [])
+        row = {'symbol': task['symbol'], 'exchange': task['exchange'], 'group': task['group_name']}
+        row.update(combo)
+        row.update({
+            'total': result.get('total', 0),
+            'correct': result.get('correct', 0),
+            'accuracy': result.get('accuracy', 0),
+            'avg_win': result.get('avg_win', 0),
+            'avg_loss': result.get('avg_loss', 0),
+            'risk_reward': result.get('risk_reward', 0),
+            'total_return': round(sum(t.get('trader_return', 0) for t in trades), 4),
+        })
+        rows.append(row)
+    return rows
+
+
+def sweep_backtest(grid, n_bars=200, skip_intraday=True, full_scan=False, target_group=None, production=False, jobs=1, output_file=SWEEP_OUTPUT, **kwargs):
+    """
+    Parameter sweep บน cached data
+    
+    Args:
+        grid: {param: [values]} จาก parse_sweep_grid
+        jobs: > 1 → แบ่ง symbol ให้ worker processes (ทุก combo ของ symbol อยู่ใน worker เดียวกัน)
+        kwargs: ค่าคงที่อื่นๆ (เหมือน --stop_loss ฯลฯ)
+    
+    Returns:
+        DataFrame: tidy table 1 แถวต่อ (symbol, combo) → output_file
+    """
+    import itertools
+    from concurrent.futures import ProcessPoolExecutor
+    
+    params = list(grid.keys())
+    combos = [dict(zip(params, values)) for values in itertools.product(*(grid[p] for p in params))]
+    
+    print("\n" + "=" * 70)
+    print("🧪 PARAMETER SWEEP")
+    print("=" * 70)
+    for p in params:
+        print(f"   {p}: {grid[p]}")
+    print(f"   → {len(combos)} combos per symbol")
+    
+    # Same asset selection as backtest_all (without the resume skip)
+    tasks = []
+    for group_name, group_config in config.ASSET_GROUPS.items():
+        if target_group and target_group.upper() not in group_name.upper():
+            continue
+        if skip_intraday and 'METALS' in group_name:
+            continue
+        seen_assets = set()
+        unique_assets = []
+        for a in group_config['assets']:
+            sym = a.get('symbol')
+            if sym and sym not in seen_assets:
+                unique_assets.append(a)
+                seen_assets.add(sym)
+        target_assets = unique_assets if full_scan else unique_assets[:10]
+        for asset in target_assets:
+            tasks.append({
+                'group_name': group_name,
+                'symbol': asset['symbol'],
+                'exchange': asset['exchange'],
+                'combos': combos,
+                'kwargs': dict(kwargs, n_bars=n_bars, fixed_threshold=group_config.get('fixed_threshold'),
+                               inverse_logic=group_config.get('inverse_logic', False),
+                               min_adx=group_config.get('min_adx'), production=production,
+                               engine=group_config.get('engine'))
+            })
+    
+    print(f"   Symbols: {len(tasks)} | Runs: {len(tasks) * len(combos)}")
+    
+    rows = []
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_backtest_worker) as pool:
+            for i, task_rows in enumerate(pool.map(_sweep_symbol_worker, tasks)):
+                rows.extend(task_rows)
+                sys.stdout.write(f"\r   [{i+1}/{len(tasks)}] {tasks[i]['symbol']}...")
+                sys.stdout.flush()
+    else:
+        for i, task in enumerate(tasks):
+            sys.stdout.write(f"\r   [{i+1}/{len(tasks)}] {task['symbol']}...")
+            sys.stdout.flush()
+            rows.extend(_sweep_symbol_worker(task))
+    print()
+    
+    if not rows:
+        print("❌ No sweep results (no cached data?)")
+        return None
+    
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    df.to_csv(output_file, index=False)
+    print(f"💾 Saved: {output_file} ({len(df)} rows)")
+    
+    # Per-combo summary (pooled accuracy, mean RRR, summed return)
+    summary = df.groupby(params, dropna=False).agg(
+        symbols=('symbol', 'count'), total=('total', 'sum'), correct=('correct', 'sum'),
+        risk_reward=('risk_reward', 'mean'), total_return=('total_return', 'sum')
+    ).reset_index()
+    summary['accuracy'] = (summary['correct'] / summary['total'].where(summary['total'] > 0) * 100).round(1)
+    summary = summary.sort_values(['total_return', 'accuracy'], ascending=False)
+    
+    print(f"\n🏆 Top 10 Combos (by total return):")
+    print(summary.head(10).to_string(index=False))
+    return df
+
+
 def main():
     import argparse
     
@@ -1404,6 +2072,12 @@ def main():
                         help='Enable PRODUCTION mode: adds slippage, commission, gap risk, volume filter, entry at open')
     parser.add_argument('--fast', action='store_true',
                         help='Fast mode: reduce delays between requests (may risk rate limiting)')
+    parser.add_argument('--sweep', type=str, default=None,
+                        help='Parameter grid, e.g. "multiplier=0.8,0.9;max_hold=5,7" (use with --all/--full, cached data)')
+    parser.add_argument('--replay', action='store_true',
+                        help='Point-in-time replay of the live engine (main.py forecasts, N+1 close check); with a symbol or --quick')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes for --all/--full (cached data, sharded output; default: 1 = sequential)')
     
     # China Market Testing Parameters
     parser.add_argument('--stop_loss', type=float, default=None, help='Override stop loss percent for testing')
@@ -1455,7 +2129,52 @@ def main():
         # Don't pass threshold_multiplier separately if it's in test_kwargs to avoid duplicate
         threshold_multiplier = None
     
-    if args.full:
+    if args.replay:
+        # Replay Mode: same engine + voting as main.py, every bar of the test window
+        if args.symbol:
+            targets = [(args.symbol, args.exchange)]
+        elif args.quick:
+            targets = [('PTT', 'SET'), ('ADVANC', 'SET'), ('NVDA', 'NASDAQ'),
+                       ('AAPL', 'NASDAQ'), ('2330', 'TWSE'), ('700', 'HKEX')]
+        else:
+            parser.error("--replay needs a symbol or --quick")
+        
+        tv_user = os.environ.get('TV_USERNAME', '')
+        tv_pass = os.environ.get('TV_PASSWORD', '')
+        tv = TvDatafeed(username=tv_user, password=tv_pass) if tv_user and tv_pass else TvDatafeed()
+        
+        all_results = []
+        all_trades = []
+        for symbol, exchange in targets:
+            result = replay_single(tv, symbol, exchange, n_bars=n_bars)
+            if result:
+                all_results.append(result)
+                for trade in result['detailed_predictions']:
+                    trade['symbol'] = symbol
+                    trade['exchange'] = exchange
+                    trade['group'] = 'REPLAY'
+                    all_trades.append(trade)
+        save_trade_logs(all_trades, filename='trade_history_REPLAY.csv')
+        
+        if len(all_results) > 1:
+            total = sum(r['total'] for r in all_results)
+            correct = sum(r['correct'] for r in all_results)
+            print(f"\n📊 REPLAY TOTAL: {total} forecasts | Accuracy: {correct / total * 100 if total else 0:.1f}%")
+    
+    elif args.sweep:
+        # Parameter Sweep Mode (--all = sample 10 per group, --full = entire market)
+        try:
+            grid = parse_sweep_grid(args.sweep)
+        except ValueError as e:
+            parser.error(str(e))
+        # Swept params override the fixed CLI values
+        call_kwargs = {k: v for k, v in test_kwargs.items() if k not in grid}
+        if threshold_multiplier is not None and 'threshold_multiplier' not in grid:
+            call_kwargs['threshold_multiplier'] = threshold_multiplier
+        all_results = sweep_backtest(grid, n_bars=n_bars, full_scan=args.full, target_group=args.group,
+                                     production=production_mode, jobs=max(1, args.jobs), **call_kwargs)
+        
+    elif args.full:
         # Full Scan Mode
         print(f"🚀 Running FULL SCAN on market (Bars: {n_bars}, Group: {args.group})")
         if fast_mode:
@@ -1466,7 +2185,7 @@ def main():
         call_kwargs = test_kwargs.copy()
         if 'threshold_multiplier' in call_kwargs:
             call_kwargs.pop('threshold_multiplier')
-        all_results = backtest_all(n_bars=n_bars, full_scan=True, target_group=args.group, threshold_multiplier=test_kwargs.get('threshold_multiplier', threshold_multiplier), production=production_mode, fast_mode=fast_mode, **call_kwargs)
+        all_results = backtest_all(n_bars=n_bars, full_scan=True, target_group=args.group, threshold_multiplier=test_kwargs.get('threshold_multiplier', threshold_multiplier), production=production_mode, fast_mode=fast_mode, jobs=max(1, args.jobs), **call_kwargs)
         
     elif args.all:
         # Sample Scan Mode
@@ -1479,7 +2198,7 @@ def main():
         call_kwargs = test_kwargs.copy()
         if 'threshold_multiplier' in call_kwargs:
             call_kwargs.pop('threshold_multiplier')
-        all_results = backtest_all(n_bars=n_bars, full_scan=False, target_group=args.group, threshold_multiplier=test_kwargs.get('threshold_multiplier', threshold_multiplier), production=production_mode, fast_mode=fast_mode, **call_kwargs)
+        all_results = backtest_all(n_bars=n_bars, full_scan=False, target_group=args.group, threshold_multiplier=test_kwargs.get('threshold_multiplier', threshold_multiplier), production=production_mode, fast_mode=fast_mode, jobs=max(1, args.jobs), **call_kwargs)
         
     elif args.quick:
         # Quick Test Mode
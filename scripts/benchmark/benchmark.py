@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark.py - Hot Path Benchmark (offline)
+===========================================
+วัดเวลา + memory ของ prediction hot path ด้วยข้อมูล OHLCV สังเคราะห์
+(deterministic, ไม่ต่อ TradingView) เพื่อจับ regression ก่อน deploy
+
+Datasets:
+    daily_5k      5,000 daily bars  (seed คงที่)
+    intraday_50k  50,000 15-min bars (seed คงที่)
+
+Benchmarks (per dataset):
+    analyze_asset            end-to-end (engine + voting, in-memory index)
+    analyze_asset[dynamic]   same with the dynamic (rolling SD) threshold
+    analyze_asset[persist]   end-to-end + persisted index / indicator store, 1 new bar
+    build_pattern_index      one-pass occurrence index (lengths 1-8)
+    aggregate_voting         voting on the pre-built pattern index
+    get_pattern_stats        one suffix lookup (indexed) / [scan] = history rescan
+    replay_asset             point-in-time replay of analyze_asset over every bar
+    update_cache             append 1 bar to the cached series
+    backtest_single          full backtest (200 test bars, daily only with --quick)
+
+Group benchmarks (GROUP_SIZE daily frames, config-sized asset group):
+    analyze_group            whole group as one (symbols x bars) matrix
+    analyze_group[loop]      same frames through analyze_asset one by one
+
+Usage:
+    python scripts/benchmark/benchmark.py                         # → data/benchmark_results.json
+    python scripts/benchmark/benchmark.py --quick                 # fewer repeats, daily only backtest
+    python scripts/benchmark/benchmark.py --only analyze_asset    # filter by name prefix
+    python scripts/benchmark/benchmark.py --compare old.json      # exit 1 if slower than --tolerance
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Fix encoding for Windows console
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "scripts", "backtest"))
+
+import processor
+from core import data_cache
+from core import indicator_store
+from core.engines.reversion_engine import MeanReversionEngine
+
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, "data", "benchmark_results.json")
+RESULTS_VERSION = 1
+
+DATASETS = {
+    'daily_5k':     {'n_bars': 5000,  'freq': 'B',     'seed': 42, 'volatility': 0.015},
+    'intraday_50k': {'n_bars': 50000, 'freq': '15min', 'seed': 7,  'volatility': 0.002},
+}
+FIXED_THRESHOLD = 0.5     # % (config fixed-threshold groups)
+GROUP_SIZE = 114          # Symbols per group benchmark (≈ GROUP_A_THAI)
+ACTIVE_PATTERN = '+-+'    # last bars forced to this streak so the engines run the full path
+
+
+# ===================================================================
+# SYNTHETIC OHLCV
+# ===================================================================
+def make_ohlcv(n_bars, freq='B', seed=42, volatility=0.015, start_price=100.0, active_pattern=ACTIVE_PATTERN):
+    """
+    Deterministic OHLCV random walk (same seed → same frame on every machine).
+    The last bars follow active_pattern with moves of 3 x volatility so the
+    engines always find an active streak instead of exiting on a flat bar.
+    """
+    rng = np.random.default_rng(seed)
+    intraday = rng.normal(0.0, volatility, n_bars)
+    gaps = rng.normal(0.0, volatility * 0.2, n_bars)
+    for i, c in enumerate(reversed(active_pattern)):
+        move = 3 * volatility
+        intraday[n_bars - 1 - i] = move if c == '+' else -move
+
+    opens = np.empty(n_bars)
+    closes = np.empty(n_bars)
+    price = start_price
+    for i in range(n_bars):
+        opens[i] = price * (1 + gaps[i])
+        closes[i] = opens[i] * (1 + intraday[i])
+        price = closes[i]
+    wick = np.abs(rng.normal(0.0, volatility * 0.5, (2, n_bars)))
+    highs = np.maximum(opens, closes) * (1 + wick[0])
+    lows = np.minimum(opens, closes) * (1 - wick[1])
+    volume = rng.integers(100_000, 5_000_000, n_bars).astype(np.float64)
+
+    index = pd.date_range('2000-01-03', periods=n_bars, freq=freq, name='datetime')
+    return pd.DataFrame({'open': opens, 'high': highs, 'low': lows, 'close': closes, 'volume': volume}, index=index)
+
+
+# ===================================================================
+# TIMING
+# ===================================================================
+def measure(fn, repeats, setup=None):
+    """
+    Time fn() `repeats` times after one untimed warm-up call (setup() runs
+    before each call, untimed), then one extra traced run for the Python heap peak.
+    """
+    if setup:
+        setup()
+    fn()
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'median_ms': round(float(np.median(times)), 3),
+        'min_ms': round(float(np.min(times)), 3),
+        'mean_ms': round(float(np.mean(times)), 3),
+        'repeats': repeats,
+        'peak_mem_kb': round(peak / 1024, 1),
+    }
+
+
+def max_rss_mb():
+    """Process peak RSS (None where the resource module is missing, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+# ===================================================================
+# BENCHMARKS
+# ===================================================================
+def bench_dataset(name, df, repeats, quick, only):
+    """All benchmarks of one dataset → {benchmark name: result}"""
+    results = {}
+    symbol, exchange = f"BENCH_{name.upper()}", "BENCH"
+
+    def run(bench, fn, setup=None, n=repeats):
+        key = f"{bench}/{name}"
+        if only and not any(bench.startswith(prefix) for prefix in only):
+            return
+        results[key] = measure(fn, n, setup)
+        r = results[key]
+        print(f"   {key:<40} median {r['median_ms']:>10.2f} ms | min {r['min_ms']:>10.2f} ms"
+              f" | peak {r['peak_mem_kb']:>10.1f} KB")
+
+    # --- End to end ---
+    run('analyze_asset', lambda: processor.analyze_asset(df, symbol=symbol, exchange=exchange,
+                                                         fixed_threshold=FIXED_THRESHOLD))
+    run('analyze_asset[dynamic]', lambda: processor.analyze_asset(df, symbol=symbol, exchange=exchange))
+
+    # Persisted index + indicator store: warm state, then one appended bar per call
+    history = df.iloc[:-1]
+    def persist_setup():
+        processor.analyze_asset(history, symbol=symbol, exchange=exchange,
+                                fixed_threshold=FIXED_THRESHOLD, persist_index=True)
+    run('analyze_asset[persist]', lambda: processor.analyze_asset(df, symbol=symbol, exchange=exchange,
+                                                                  fixed_threshold=FIXED_THRESHOLD,
+                                                                  persist_index=True),
+        setup=persist_setup)
+
+    # --- Point-in-time replay (every bar's live forecast) ---
+    run('replay_asset', lambda: processor.replay_asset(df, symbol=symbol, exchange=exchange,
+                                                       fixed_threshold=FIXED_THRESHOLD),
+        n=max(3, repeats // 3))
+
+    # --- Engine internals (Mean Reversion, fixed threshold) ---
+    engine = MeanReversionEngine()
+    pct_change = (df['close'] - df['open']) / df['open']
+    effective_std = pd.Series(FIXED_THRESHOLD / 100.0, index=df.index)
+    signals = engine.encode_signals(pct_change, effective_std)
+    active_pattern = engine.get_active_pattern(pct_change, effective_std, signals=signals)
+    index = engine.build_pattern_index(df, pct_change, effective_std, signals=signals)
+
+    run('build_pattern_index', lambda: engine.build_pattern_index(df, pct_change, effective_std, signals=signals))
+    run('aggregate_voting', lambda: engine.aggregate_voting(df, pct_change, effective_std, active_pattern,
+                                                            min_count=30, signals=signals, index=index))
+    run('get_pattern_stats', lambda: engine.get_pattern_stats(df, pct_change, effective_std, active_pattern,
+                                                              len(active_pattern), signals=signals, index=index))
+    run('get_pattern_stats[scan]', lambda: engine.get_pattern_stats(df, pct_change, effective_std, active_pattern,
+                                                                    len(active_pattern), signals=signals))
+
+    # --- Cache append (in-memory write-back frame) ---
+    last_bar = df.iloc[-1:]
+    run('update_cache', lambda: data_cache.update_cache(symbol, exchange, last_bar),
+        setup=lambda: data_cache.save_cache(symbol, exchange, history))
+
+    # --- Backtest ---
+    if not (quick and len(df) > 10000):
+        import backtest
+        run('backtest_single', lambda: backtest.backtest_single(None, symbol, exchange, n_bars=200,
+                                                                verbose=False, data=df),
+            n=max(3, repeats // 3))
+    return results
+
+
+def bench_group(repeats, only):
+    """Cross-sectional group analysis vs the per-symbol loop on GROUP_SIZE daily_5k-like frames."""
+    spec = DATASETS['daily_5k']
+    frames = [make_ohlcv(spec['n_bars'], spec['freq'], spec['seed'] + i, spec['volatility'])
+              for i in range(GROUP_SIZE)]
+    symbols = [f"BENCH_G{i}" for i in range(GROUP_SIZE)]
+    exchanges = ["BENCH"] * GROUP_SIZE
+    name = f"group_{GROUP_SIZE}x5k"
+    print(f"\n📦 {name}: {GROUP_SIZE} x {spec['n_bars']} bars")
+
+    results = {}
+    def run(bench, fn):
+        key = f"{bench}/{name}"
+        if only and not any(bench.startswith(prefix) for prefix in only):
+            return
+        results[key] = measure(fn, max(3, repeats // 3))
+        r = results[key]
+        print(f"   {key:<40} median {r['median_ms']:>10.2f} ms | min {r['min_ms']:>10.2f} ms"
+              f" | peak {r['peak_mem_kb']:>10.1f} KB")
+
+    run('analyze_group', lambda: processor.analyze_group(frames, symbols, exchanges,
+                                                         fixed_threshold=FIXED_THRESHOLD))
+    run('analyze_group[loop]', lambda: [processor.analyze_asset(df, symbol=symbol, exchange="BENCH",
+                                                                fixed_threshold=FIXED_THRESHOLD)
+                                        for df, symbol in zip(frames, symbols)])
+    return results
+
+
+def run_benchmarks(quick=False, only=None):
+    repeats = 3 if quick else 10
+    tmp_cache = tempfile.mkdtemp(prefix="bench_cache_")
+    cache_dir = data_cache.CACHE_DIR
+    data_cache.CACHE_DIR = tmp_cache          # Never touch the real cache
+    data_cache.set_connection_healthy(False)  # Offline: cache / in-memory data only
+
+    report = {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'datasets': DATASETS,
+        'results': {},
+    }
+    started = time.perf_counter()
+    try:
+        for name, spec in DATASETS.items():
+            gen_start = time.perf_counter()
+            df = make_ohlcv(spec['n_bars'], spec['freq'], spec['seed'], spec['volatility'])
+            print(f"\n📦 {name}: {len(df)} bars ({(time.perf_counter() - gen_start) * 1000:.0f} ms to generate)")
+            report['results'].update(bench_dataset(name, df, repeats, quick, only))
+        if not only or any(prefix.startswith('analyze_group') or 'analyze_group'.startswith(prefix) for prefix in only):
+            report['results'].update(bench_group(repeats, only))
+    finally:
+        data_cache.drop_memory_cache()
+        indicator_store.drop_indicator_handles()
+        data_cache.CACHE_DIR = cache_dir
+        shutil.rmtree(tmp_cache, ignore_errors=True)
+
+    report['meta']['total_s'] = round(time.perf_counter() - started, 2)
+    report['meta']['max_rss_mb'] = max_rss_mb()
+    return report
+
+
+def compare(report, baseline_path, tolerance):
+    """Print median deltas vs a previous results file. Returns the regressed benchmark names."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    old = baseline.get('results', {})
+    print(f"\n📊 COMPARE vs {baseline_path} (commit {baseline.get('meta', {}).get('git_commit')})")
+    print(f"{'Benchmark':<40} {'Old ms':>10} {'New ms':>10} {'Change':>9}")
+    print("-" * 72)
+    regressions = []
+    for key, new in report['results'].items():
+        if key not in old:
+            print(f"{key:<40} {'-':>10} {new['median_ms']:>10.2f} {'new':>9}")
+            continue
+        old_ms, new_ms = old[key]['median_ms'], new['median_ms']
+        change = (new_ms - old_ms) / old_ms * 100 if old_ms else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = " ⚠️"
+            regressions.append(key)
+        print(f"{key:<40} {old_ms:>10.2f} {new_ms:>10.2f} {change:>+8.1f}%{flag}")
+    print("-" * 72)
+    if regressions:
+        print(f"⚠️ {len(regressions)} benchmark(s) slower than +{tolerance:.0f}%")
+    else:
+        print(f"✅ No regression beyond +{tolerance:.0f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the prediction hot path")
+    parser.add_argument('--quick', action='store_true', help='3 repeats, skip the intraday backtest')
+    parser.add_argument('--only', type=str, default=None,
+                        help='Comma-separated benchmark name prefixes (e.g. analyze_asset,update_cache)')
+    parser.add_argument('--out', type=str, default=DEFAULT_OUTPUT, help='Results JSON path')
+    parser.add_argument('--compare', type=str, default=None, help='Previous results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='Allowed median slowdown in %% before --compare reports a regression (default: 10)')
+    args = parser.parse_args()
+
+    only = [p.strip() for p in args.only.split(',') if p.strip()] if args.only else None
+    print("⏱️ Hot path benchmark (synthetic OHLCV, offline)")
+    report = run_benchmarks(quick=args.quick, only=only)
+
+    out_dir = os.path.dirname(os.path.abspath(args.out))
+    os.makedirs(out_dir, exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results: {args.out} ({report['meta']['total_s']} s, peak RSS {report['meta']['max_rss_mb']} MB)")
+
+    if args.compare:
+        if compare(report, args.compare, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from tvDatafeed import TvDatafeed, Interval
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 import config
 from core.data_cache import get_data_with_cache
+from core.indicator_store import get_indicators, save_indicators
 from processor import analyze_asset
 
 def print_header(text):
@@ -60,8 +61,14 @@ def view_report(symbol):
         
         # Recalculate threshold to see why it failed
         pct_change = close.pct_change()
-        short_term_std = pct_change.rolling(window=20).std()
-        long_term_std = pct_change.rolling(window=252).std()
+        indicators = get_indicators(df, asset_info['symbol'], asset_info['exchange'], interval)
+        if indicators is not None:
+            short_term_std = indicators.rolling_std(20, 'close')
+            long_term_std = indicators.rolling_std(252, 'close')
+            save_indicators(indicators)
+        else:
+            short_term_std = pct_change.rolling(window=20).std()
+            long_term_std = pct_change.rolling(window=252).std()
         long_term_floor = long_term_std * 0.50
         effective_std = np.maximum(short_term_std, long_term_floor.fillna(0))
         threshold = effective_std.iloc[-1] * 1.25 * 100
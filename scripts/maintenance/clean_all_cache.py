@@ -33,7 +33,7 @@ def clean_all_cache():
     # 1. ลบ cache files ใน data/cache/
     cache_dir = 'data/cache'
     if os.path.exists(cache_dir):
-        cache_files = glob.glob(os.path.join(cache_dir, '*.csv')) + glob.glob(os.path.join(cache_dir, '*.pkl'))
+        cache_files = glob.glob(os.path.join(cache_dir, '*.csv')) + glob.glob(os.path.join(cache_dir, '*.npy')) + glob.glob(os.path.join(cache_dir, '*.pkl'))
         for file_path in cache_files:
             try:
                 os.remove(file_path)
@@ -95,7 +95,7 @@ def clean_all_cache():
         print(f"✅ ลบ cache แล้ว: {deleted_count} ไฟล์")
         print()
         print("📋 ไฟล์ที่ลบ:")
-        print("   - data/cache/*.csv, *.pkl (cache files)")
+        print("   - data/cache/*.csv, *.npy, *.pkl (cache files)")
         print("   - logs/trade_history_*.csv (trade history)")
         print("   - data/symbol_performance.csv (performance summary)")
         print("   - data/full_backtest_results.csv (full results)")
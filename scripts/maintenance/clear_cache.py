@@ -21,7 +21,10 @@ def clear_cache():
         print("ℹ️  ไม่พบ cache directory")
         return
     
-    cache_files = glob.glob(os.path.join(CACHE_DIR, "*.csv")) + glob.glob(os.path.join(CACHE_DIR, "*.pkl"))
+    npy_files = glob.glob(os.path.join(CACHE_DIR, "*.npy"))
+    # CSV ที่มี .npy คู่กันคือไฟล์ต้นฉบับที่ track ใน git → ไม่ลบ
+    csv_files = [f for f in glob.glob(os.path.join(CACHE_DIR, "*.csv")) if not os.path.exists(f[:-4] + ".npy")]
+    cache_files = npy_files + csv_files + glob.glob(os.path.join(CACHE_DIR, "*.pkl"))
     
     if not cache_files:
         print("ℹ️  ไม่พบไฟล์ cache")
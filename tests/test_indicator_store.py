@@ -0,0 +1,115 @@
+"""
+Indicator store kernels vs pandas rolling (the values the engines compute directly).
+
+Run: python -m pytest -q tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.indicator_store import _roll_mean, _roll_var, IndicatorSet, parse_key
+
+WINDOWS = [2, 5, 20, 50, 252]
+
+
+def _returns(rng):
+    """Random returns with constant runs (zeros / repeated values) and NaN gaps."""
+    n = int(rng.integers(30, 400))
+    x = rng.normal(0, 0.003, n)
+    for _ in range(int(rng.integers(0, 4))):
+        a = int(rng.integers(0, n))
+        b = min(n, a + int(rng.integers(1, 60)))
+        x[a:b] = rng.choice([0.0, x[a]])
+    if rng.integers(4) == 1:
+        x[rng.integers(0, n, 3)] = np.nan
+    return x
+
+
+def _cases(count=400, seed=0):
+    rng = np.random.default_rng(seed)
+    cases = [(_returns(rng), int(rng.choice(WINDOWS))) for _ in range(count)]
+    # Run of zeros right after random values (ill-conditioned removals)
+    cases.append((np.r_[np.random.default_rng(3).normal(0, 0.003, 100), np.zeros(30)], 20))
+    cases.append((np.r_[np.random.default_rng(4).normal(0, 0.003, 300), np.full(300, 0.0012)], 252))
+    return cases
+
+
+def _assert_same(expected, got):
+    np.testing.assert_array_equal(got, expected)   # NaN == NaN, bit-exact otherwise
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_roll_var_matches_pandas(seed):
+    for x, window in _cases(seed=seed):
+        got, _ = _roll_var(x, window, 0, len(x))
+        _assert_same(pd.Series(x).rolling(window).var().to_numpy(), got)
+
+
+def test_roll_var_resume_matches_full_run():
+    rng = np.random.default_rng(7)
+    for x, window in _cases(200, seed=2):
+        split = int(rng.integers(1, len(x)))
+        head, state = _roll_var(x, window, 0, split)
+        tail, _ = _roll_var(x, window, split, len(x), state)
+        _assert_same(pd.Series(x).rolling(window).var().to_numpy(), np.r_[head, tail])
+
+
+def test_roll_mean_matches_pandas():
+    for x, window in _cases(seed=3):
+        got, _ = _roll_mean(x, window, 0, len(x))
+        _assert_same(pd.Series(x).rolling(window).mean().to_numpy(), got)
+
+
+def test_rolling_std_store_matches_pandas(tmp_path):
+    rng = np.random.default_rng(11)
+    n = 600
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    open_[200:260] = close[200:260]   # flat bars → constant run of zero returns
+    df = pd.DataFrame({'open': open_, 'high': np.maximum(open_, close), 'low': np.minimum(open_, close),
+                       'close': close}, index=pd.date_range('2020-01-01', periods=n, freq='D'))
+    intraday = (df['close'] - df['open']) / df['open']
+
+    store = IndicatorSet(str(tmp_path / 'X.ind.npz'))
+    store.sync(df.iloc[:400])
+    store.rolling_std(20)
+    store.sync(df)                    # resume from the checkpoint
+    _assert_same(intraday.rolling(20).std().to_numpy(), store.rolling_std(20).to_numpy())
+
+
+def test_head_trim_resumes_from_shifted_checkpoint(tmp_path):
+    rng = np.random.default_rng(12)
+    n = 700
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    df = pd.DataFrame({'open': open_, 'high': np.maximum(open_, close) * 1.002,
+                       'low': np.minimum(open_, close) * 0.998, 'close': close},
+                      index=pd.date_range('2020-01-01', periods=n, freq='D'))
+    keys = ['std:20:close', 'sma:50:close', 'atr:14', 'adx:14']
+
+    store = IndicatorSet(str(tmp_path / 'X.ind.npz'))
+    store.sync(df.iloc[:600])
+    for key in keys:
+        store.get(key)
+    store.save()
+    store = IndicatorSet.load(store.path)
+    calls = []
+    original = store._compute
+    store._compute = lambda key, resume, *args: calls.append(resume) or original(key, resume, *args)
+    store.sync(df.iloc[100:640])    # 100 bars trimmed off the head, 40 appended
+    assert calls and all(resume == 600 - 64 - 100 for resume in calls)
+
+    # Warm-up bars as a fresh rolling over the trimmed frame, later bars as over the full history
+    for key in keys:
+        fresh = IndicatorSet(str(tmp_path / 'fresh.ind.npz'))
+        fresh.sync(df.iloc[100:640])
+        full = IndicatorSet(str(tmp_path / 'full.ind.npz'))
+        full.sync(df.iloc[:640])
+        lookback = parse_key(key).lookback
+        expected = np.r_[fresh.get(key).to_numpy()[:lookback], full.get(key).to_numpy()[100 + lookback:]]
+        _assert_same(expected, store.get(key).to_numpy())